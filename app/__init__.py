@@ -1,10 +1,26 @@
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from app.replicas import RoutingSession
 
 # Initialize SQLAlchemy without binding to a specific Flask app
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+def running_cli():
+    """Whether the process is the flask command rather than a server"""
+    return os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+
+
+def init_migrate(app):
+    """Register Flask-Migrate; importing it loads alembic
+
+    There is no module-level Migrate object to import; the registered one is
+    app.extensions["migrate"].
+    """
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
 
 
 def create_app(config_class=None):
@@ -12,25 +28,64 @@ def create_app(config_class=None):
     app = Flask(__name__)
 
     # Load configuration
-    if config_class:
-        app.config.from_object(config_class)
-    else:
+    if not config_class:
         # Import here to avoid circular imports
         from config import get_config
 
-        app.config.from_object(get_config())
+        config_class = get_config()
+    app.config.from_object(config_class)
+    # Settings derived from the environment only when the config is selected
+    if hasattr(config_class, "init_app"):
+        config_class.init_app(app)
 
     # Initialize extensions with the app
     db.init_app(app)
-    migrate.init_app(app, db)
+    fast_start = app.config.get("FAST_START") and not running_cli()
+    if not fast_start:
+        init_migrate(app)
+
+    from app.database import init_database
+    from app.replicas import init_replicas
+    from app.json_provider import init_json_provider
+    from app.instrumentation import init_instrumentation
+
+    init_database(app)
+    init_replicas(app, db)
+    init_json_provider(app)
+    init_instrumentation(app)
 
     # Register blueprints
     from app.routes.stashpoints import bp as stashpoints_bp
+    from app.routes.bookings import bp as bookings_bp
+    from app.routes.customers import bp as customers_bp
 
     app.register_blueprint(stashpoints_bp, url_prefix="/api/v1/stashpoints")
+    app.register_blueprint(bookings_bp, url_prefix="/api/v1/bookings")
+    app.register_blueprint(customers_bp, url_prefix="/api/v1/customers")
+
+    # Keep derived tables in step with bookings, and the stashpoints version
+    from app.services.occupancy import register_occupancy_events
+    from app.services.versions import register_version_events
+    from app.services.geo_index import init_geo_index
+    from app.services.search_cache import init_search_cache
+
+    register_occupancy_events()
+    register_version_events()
+    init_geo_index(app)
+    init_search_cache(app)
+
+    # Register CLI commands
+    from app.commands import register_commands
+
+    register_commands(app)
 
     @app.route("/healthcheck")
     def healthcheck():
         return {"status": "healthy"}
 
+    if fast_start:
+        from app.startup import prepare_app
+
+        prepare_app(app)
+
     return app
@@ -0,0 +1,351 @@
+"""ASGI serving mode for the stashpoints routes
+
+The Flask app blocks a worker thread for every query it waits on. This
+module serves the read-only stashpoints routes as async Starlette views on
+SQLAlchemy's asyncio extension and asyncpg, so one process keeps many
+searches in flight while Postgres works on them.
+
+Statements, validation and serialization are shared with the Flask views:
+a Flask app built by create_app supplies the configuration and JSON
+provider, and statements are built inside its app context. Only execution
+differs. The in-process geo index and search cache are not consulted here;
+every search goes to the database, and to ASYNC_DATABASE_URL only: the read
+replicas of app/replicas.py are not used. Bookings, which hold row locks across
+several statements, stay on the sync app.
+
+    uvicorn asgi:app --workers 4
+"""
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from app import create_app
+from app.database import set_statement_timeout_per_transaction
+from app.models import Stashpoint
+from app.serializers import STASHPOINT_COLUMNS, stashpoint_dict
+from app.services.calendar import (
+    MAX_CALENDAR_STASHPOINTS,
+    CalendarValidationError,
+    build_calendar_statement,
+    calendars_from_rows,
+    parse_calendar_args,
+)
+from app.services.clusters import (
+    ClusterValidationError,
+    bounds_bbox,
+    build_cluster_statement,
+    cluster_dict,
+    parse_tile,
+    parse_viewport_args,
+    parse_window_args,
+)
+from app.services.pagination import (
+    DEFAULT_STREAM_BATCH_SIZE,
+    PaginationError,
+    encode_cursor,
+    ID_KEY,
+    SEARCH_KEY,
+    VERSION_KEY,
+    parse_page_args,
+)
+from app.services.search import (
+    SearchValidationError,
+    batch_results,
+    build_batch_search_statement,
+    build_nearest_statement,
+    build_search_statement,
+    is_search_request,
+    parse_batch_search_params,
+    parse_nearest_args,
+    parse_search_params,
+    search_result,
+)
+from app.services.versions import (
+    STASHPOINTS,
+    UNSEEN,
+    SyncValidationError,
+    build_table_version_statement,
+    listing_headers,
+    parse_since,
+)
+
+
+def async_database_url(url):
+    """The asyncpg flavour of a postgresql:// database URL"""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+def async_connect_args(config):
+    """asyncpg settings for the statement timeout and external pooler modes"""
+    if config.get("DB_EXTERNAL_POOLER"):
+        # Prepared statements do not survive a transaction-mode pooler
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    timeout_ms = config.get("DB_STATEMENT_TIMEOUT_MS")
+    if not timeout_ms:
+        return {}
+    return {"server_settings": {"statement_timeout": str(timeout_ms)}}
+
+
+def build_listing_statement(after=None, limit=None, since=None):
+    """Every stashpoint ordered by id, from the keyset cursor after
+
+    With since, the stashpoints stamped after that version, ordered by
+    (version, id) like listing_results.
+    """
+    if since is None:
+        statement = select(*STASHPOINT_COLUMNS).order_by(Stashpoint.id)
+        if after is not None:
+            statement = statement.where(Stashpoint.id > after[0])
+    else:
+        statement = (
+            select(*STASHPOINT_COLUMNS, Stashpoint.version)
+            .where(Stashpoint.version > since)
+            .order_by(Stashpoint.version, Stashpoint.id)
+        )
+        if after is not None:
+            key = tuple_(Stashpoint.version, Stashpoint.id)
+            statement = statement.where(key > tuple_(*after))
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+class AsyncStashpointsApi:
+    """Async views of the stashpoints routes, bound to a Flask app's config"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.engine = create_async_engine(
+            config.get("ASYNC_DATABASE_URL")
+            or async_database_url(config["SQLALCHEMY_DATABASE_URI"]),
+            pool_pre_ping=True,
+            connect_args=async_connect_args(config),
+        )
+        if config.get("DB_EXTERNAL_POOLER"):
+            set_statement_timeout_per_transaction(
+                self.engine.sync_engine, config["DB_STATEMENT_TIMEOUT_MS"]
+            )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    def json(self, obj, status_code=200, headers=None):
+        with self.flask_app.app_context():
+            body = self.flask_app.json.dumps(obj)
+        return Response(
+            body, status_code, headers=headers, media_type="application/json"
+        )
+
+    def error(self, message, status_code=400):
+        return self.json({"error": message}, status_code)
+
+    async def get_stashpoints(self, request):
+        args = request.query_params
+        searching = is_search_request(args)
+        try:
+            params = parse_search_params(args) if searching else None
+            nearest = parse_nearest_args(args) if searching else None
+            since = parse_since(args)
+            if searching and since is not None:
+                raise SearchValidationError("'since' cannot be combined with a search")
+            key_types = VERSION_KEY if since is not None else ID_KEY
+            limit, after = parse_page_args(args, SEARCH_KEY if searching else key_types)
+            if nearest is not None and (limit is not None or after is not None):
+                raise SearchValidationError(
+                    "'nearest' cannot be combined with 'limit' or 'cursor'"
+                )
+        except (SearchValidationError, SyncValidationError, PaginationError) as e:
+            return self.error(str(e))
+
+        headers = {}
+        if not searching:
+            async with self.sessions() as session:
+                state = (
+                    await session.execute(build_table_version_statement(STASHPOINTS))
+                ).first()
+            headers, modified, since = listing_headers(
+                STASHPOINTS,
+                tuple(state) if state is not None else UNSEEN,
+                request.url.query.encode(),
+                request.headers,
+                since,
+            )
+            if not modified:
+                return Response(status_code=304, headers=headers)
+
+        if nearest is not None:
+            statement = build_nearest_statement(params, *nearest)
+            async with self.sessions() as session:
+                rows = (await session.execute(statement)).all()
+            return self.json([search_result(row) for row in rows])
+
+        def build(limit):
+            # peak_subquery reads AVAILABILITY_SOURCE from the app config
+            with self.flask_app.app_context():
+                if searching:
+                    statement = build_search_statement(params, after=after)
+                    return statement.limit(limit) if limit is not None else statement
+                return build_listing_statement(after, limit, since)
+
+        def keyed(row):
+            if searching:
+                return (row.distance_m, row.id), search_result(row)
+            if since is not None:
+                return (row.version, row.id), stashpoint_dict(row)
+            return (row.id,), stashpoint_dict(row)
+
+        if args.get("stream", "").lower() in ("1", "true"):
+            statement = build(limit)
+            return StreamingResponse(
+                self.stream_json_array(statement, keyed),
+                headers=headers,
+                media_type="application/json",
+            )
+
+        async with self.sessions() as session:
+            rows = (await session.execute(build(limit + 1 if limit else None))).all()
+        keyed_results = [keyed(row) for row in rows]
+        page = [result for _, result in keyed_results[:limit]]
+
+        if limit is not None and len(keyed_results) > limit:
+            next_cursor = encode_cursor(keyed_results[limit - 1][0])
+            next_url = request.url.include_query_params(cursor=next_cursor)
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return self.json(page, headers=headers)
+
+    async def stream_json_array(self, statement, keyed):
+        """Async twin of pagination.stream_json_array over a server-side cursor"""
+        with self.flask_app.app_context():
+            dumps = self.flask_app.json.dumps
+        yield "["
+        first = True
+        async with self.sessions() as session:
+            result = await session.stream(
+                statement.execution_options(yield_per=DEFAULT_STREAM_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                chunk = ",".join(dumps(keyed(row)[1]) for row in rows)
+                yield ("" if first else ",") + chunk
+                first = False
+        yield "]"
+
+    async def batch_search(self, request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        try:
+            params_list = parse_batch_search_params(data)
+        except SearchValidationError as e:
+            return self.error(str(e))
+
+        with self.flask_app.app_context():
+            statement = build_batch_search_statement(params_list)
+        async with self.sessions() as session:
+            rows = (await session.execute(statement)).all()
+        return self.json({"results": batch_results(rows, len(params_list))})
+
+    async def calendars(self, stashpoint_ids, args):
+        start, end, interval = parse_calendar_args(args)
+        statement = build_calendar_statement(stashpoint_ids, start, end)
+        async with self.sessions() as session:
+            rows = (await session.execute(statement)).all()
+        return calendars_from_rows(rows, start, end, interval)
+
+    async def get_calendars(self, request):
+        ids = [id for id in request.query_params.get("ids", "").split(",") if id]
+        try:
+            if not ids:
+                raise CalendarValidationError("'ids' is required")
+            if len(ids) > MAX_CALENDAR_STASHPOINTS:
+                raise CalendarValidationError(
+                    f"At most {MAX_CALENDAR_STASHPOINTS} stashpoints per calendar "
+                    "request"
+                )
+            calendars = await self.calendars(ids, request.query_params)
+        except CalendarValidationError as e:
+            return self.error(str(e))
+        return self.json({"calendars": calendars})
+
+    async def get_calendar(self, request):
+        stashpoint_id = request.path_params["stashpoint_id"]
+        try:
+            calendars = await self.calendars([stashpoint_id], request.query_params)
+        except CalendarValidationError as e:
+            return self.error(str(e))
+        if stashpoint_id not in calendars:
+            return self.error("Stashpoint not found", 404)
+        return self.json(calendars[stashpoint_id])
+
+    async def clusters(self, bounds, zoom, args):
+        dropoff, pickup = parse_window_args(args, datetime.utcnow())
+        with self.flask_app.app_context():
+            statement = build_cluster_statement(bounds, zoom, dropoff, pickup)
+        async with self.sessions() as session:
+            rows = (await session.execute(statement)).all()
+        return [cluster_dict(row) for row in rows]
+
+    def cluster_response(self, body):
+        max_age = self.flask_app.config["CLUSTER_MAX_AGE_SECONDS"]
+        return self.json(body, headers={"Cache-Control": f"public, max-age={max_age}"})
+
+    async def get_clusters(self, request):
+        try:
+            zoom, bounds = parse_viewport_args(request.query_params)
+            clusters = await self.clusters(bounds, zoom, request.query_params)
+        except ClusterValidationError as e:
+            return self.error(str(e))
+        return self.cluster_response(
+            {"zoom": zoom, "bbox": bounds_bbox(bounds), "clusters": clusters}
+        )
+
+    async def get_cluster_tile(self, request):
+        x, y = request.path_params["x"], request.path_params["y"]
+        try:
+            zoom, bounds = parse_tile(request.path_params["zoom"], x, y)
+            clusters = await self.clusters(bounds, zoom, request.query_params)
+        except ClusterValidationError as e:
+            return self.error(str(e))
+        return self.cluster_response(
+            {"zoom": zoom, "x": x, "y": y, "clusters": clusters}
+        )
+
+    async def healthcheck(self, request):
+        return self.json({"status": "healthy"})
+
+    def routes(self):
+        prefix = "/api/v1/stashpoints"
+        return [
+            Route(f"{prefix}/", self.get_stashpoints, methods=["GET"]),
+            Route(f"{prefix}/search/batch", self.batch_search, methods=["POST"]),
+            Route(f"{prefix}/calendar", self.get_calendars, methods=["GET"]),
+            Route(f"{prefix}/clusters", self.get_clusters, methods=["GET"]),
+            Route(
+                f"{prefix}/clusters/{{zoom:int}}/{{x:int}}/{{y:int}}",
+                self.get_cluster_tile,
+                methods=["GET"],
+            ),
+            Route(
+                f"{prefix}/{{stashpoint_id}}/calendar",
+                self.get_calendar,
+                methods=["GET"],
+            ),
+            Route("/healthcheck", self.healthcheck, methods=["GET"]),
+        ]
+
+
+def create_asgi_app(config_class=None):
+    """Create the ASGI application serving the stashpoints routes"""
+    api = AsyncStashpointsApi(create_app(config_class))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await api.engine.dispose()
+
+    return Starlette(routes=api.routes(), lifespan=lifespan)
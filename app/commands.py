@@ -0,0 +1,225 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import db
+
+occupancy_cli = AppGroup("occupancy", help="Maintain the hourly occupancy buckets.")
+
+
+@occupancy_cli.command("rebuild")
+def rebuild_occupancy_command():
+    """Correct stashpoint_occupancy from the bookings table"""
+    from app.services.occupancy import rebuild_occupancy
+
+    rows = rebuild_occupancy()
+    db.session.commit()
+    click.echo(f"Corrected {rows} occupancy buckets")
+
+
+@occupancy_cli.command("compute")
+@click.option(
+    "--start",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="First day of the horizon [default: today].",
+)
+@click.option("--days", type=int, default=90, show_default=True)
+@click.option("--chunk-rows", type=int, default=500_000, show_default=True)
+@click.option("--write/--no-write", default=True, help="Correct the buckets.")
+@click.option(
+    "--report",
+    type=click.File("w"),
+    help="Write per-stashpoint utilization as CSV to this file ('-' for stdout).",
+)
+def compute_occupancy_command(start, days, chunk_rows, write, report):
+    """Compute hourly occupancy of every stashpoint over a horizon
+
+    Streams the bookings through the NumPy engine, then corrects the
+    horizon's stashpoint_occupancy buckets with COPY and/or writes a
+    utilization report. Booking writes are not locked out meanwhile.
+    For nightly jobs; see app/services/bulk_availability.py.
+    """
+    import csv
+    import time
+    from app.services.bulk_availability import (
+        compute_hourly_occupancy,
+        horizon_start,
+        write_occupancy,
+    )
+
+    start = horizon_start(start)
+    started = time.perf_counter()
+    occupancy = compute_hourly_occupancy(
+        start,
+        days,
+        chunk_rows,
+        progress=lambda total: click.echo(f"  {total} bookings read", err=True),
+        stored=write,
+    )
+    click.echo(
+        f"Computed {len(occupancy.stashpoint_ids)} stashpoints x "
+        f"{occupancy.hours} hours from {occupancy.bookings} bookings "
+        f"in {time.perf_counter() - started:.1f}s",
+        err=True,
+    )
+    if write:
+        rows = write_occupancy(occupancy)
+        db.session.commit()
+        click.echo(f"Corrected {rows} occupancy buckets", err=True)
+    if report is not None:
+        peak, mean, full_hours = occupancy.utilization()
+        writer = csv.writer(report)
+        writer.writerow(
+            [
+                "stashpoint_id",
+                "capacity",
+                "peak_booked",
+                "mean_utilization",
+                "full_hours",
+            ]
+        )
+        for row in zip(
+            occupancy.stashpoint_ids,
+            occupancy.capacity.tolist(),
+            peak.tolist(),
+            mean.round(4).tolist(),
+            full_hours.tolist(),
+        ):
+            writer.writerow(row)
+
+
+search_cli = AppGroup("search", help="Inspect the availability search.")
+
+
+@search_cli.command("explain")
+@click.option("--lat", type=float, default=51.5074)
+@click.option("--lng", type=float, default=-0.1278)
+@click.option("--dropoff", default="2023-04-20T10:00:00Z")
+@click.option("--pickup", default="2023-04-20T18:00:00Z")
+@click.option("--bag-count", type=int, default=2)
+@click.option("--radius-km", type=float, default=5.0)
+@click.option("--nearest", type=int, help="Explain a nearest-k search instead.")
+@click.option("--max-distance-km", type=float, default=50.0)
+@click.option("--analyze/--no-analyze", default=True, help="Execute the query.")
+def explain_search_command(
+    lat,
+    lng,
+    dropoff,
+    pickup,
+    bag_count,
+    radius_km,
+    nearest,
+    max_distance_km,
+    analyze,
+):
+    """Print the query plan of an availability search
+
+    Useful to confirm the search uses the location GiST index and the
+    partial bookings index rather than sequential scans, and that nearest-k
+    searches scan the GiST index in KNN order under the LIMIT.
+    """
+    from app.services.search import (
+        build_nearest_statement,
+        build_search_statement,
+        explain_plan,
+        parse_search_params,
+    )
+
+    params = parse_search_params(
+        {
+            "lat": lat,
+            "lng": lng,
+            "dropoff": dropoff,
+            "pickup": pickup,
+            "bag_count": bag_count,
+            "radius_km": radius_km,
+        }
+    )
+    if nearest:
+        statement = build_nearest_statement(params, nearest, max_distance_km)
+    else:
+        statement = build_search_statement(params)
+    for line in explain_plan(statement, analyze):
+        click.echo(line)
+    db.session.rollback()
+
+
+@search_cli.command("coverage")
+@click.argument("demand", type=click.File("r"))
+@click.option("--radius-km", type=float, default=2.0, show_default=True)
+@click.option("--output", type=click.File("w"), default="-")
+def search_coverage_command(demand, radius_km, output):
+    """Nearest stashpoint of every demand point
+
+    DEMAND is a CSV file with lat and lng columns, e.g. searched locations.
+    Writes each point with its nearest stashpoint, the distance in km and
+    the number of stashpoints within --radius-km, using vectorized
+    haversine distance matrices.
+    """
+    import csv
+    from app.services.bulk_availability import nearest_stashpoints
+
+    points = list(csv.DictReader(demand))
+    lat = [float(point["lat"]) for point in points]
+    lng = [float(point["lng"]) for point in points]
+    nearest, distance, within = nearest_stashpoints(lat, lng, radius_km)
+    writer = csv.writer(output)
+    writer.writerow(
+        ["lat", "lng", "nearest_stashpoint_id", "distance_km", "stashpoints_within"]
+    )
+    for row in zip(lat, lng, nearest, distance.round(3).tolist(), within.tolist()):
+        writer.writerow(row)
+
+
+bookings_cli = AppGroup("bookings", help="Maintain the bookings tables.")
+
+
+@bookings_cli.command("archive")
+@click.option(
+    "--older-than-days",
+    type=int,
+    help="Archive bookings picked up at least this many days ago "
+    "[default: BOOKING_ARCHIVE_AFTER_DAYS].",
+)
+@click.option("--batch-size", type=int, default=10000, show_default=True)
+@click.option("--analyze/--no-analyze", default=True, help="ANALYZE bookings after.")
+def archive_bookings_command(older_than_days, batch_size, analyze):
+    """Move completed bookings into bookings_archive
+
+    Safe to run while the app serves traffic, e.g. nightly from cron.
+    """
+    from app.services.archive import archive_bookings, archive_cutoff
+
+    if older_than_days is None:
+        older_than_days = current_app.config["BOOKING_ARCHIVE_AFTER_DAYS"]
+    before = archive_cutoff(older_than_days)
+    click.echo(f"Archiving completed bookings picked up before {before:%Y-%m-%d %H:%M}")
+    moved = archive_bookings(
+        before, batch_size, progress=lambda total: click.echo(f"  {total} moved")
+    )
+    if analyze and moved:
+        db.session.execute(db.text("ANALYZE bookings"))
+        db.session.commit()
+    click.echo(f"Archived {moved} bookings")
+
+
+replicas_cli = AppGroup("replicas", help="Inspect the read replicas.")
+
+
+@replicas_cli.command("status")
+def replicas_status_command():
+    """Check every replica and print whether searches may read from it"""
+    replicas = current_app.extensions.get("replicas")
+    if replicas is None:
+        click.echo("No replicas configured; every query goes to the primary")
+        return
+    for key, healthy in replicas.status().items():
+        url = replicas.engines[key].url.render_as_string(hide_password=True)
+        click.echo(f"{key} {url}: {'healthy' if healthy else 'unhealthy'}")
+
+
+def register_commands(app):
+    """Attach the maintenance CLI groups to the app"""
+    app.cli.add_command(occupancy_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(bookings_cli)
+    app.cli.add_command(replicas_cli)
@@ -0,0 +1,31 @@
+"""Connection setup that depends on how the app reaches Postgres
+
+Connecting directly, the statement timeout is a startup option of every
+connection (see production_engine_options in config.py). A transaction-mode
+pooler hands each transaction whichever server connection is free and drops
+startup options, so there the timeout is set at the start of every
+transaction with SET LOCAL, which ends with the transaction.
+"""
+
+from sqlalchemy import event
+from app import db
+
+
+def set_statement_timeout_per_transaction(engine, timeout_ms):
+    """Run SET LOCAL statement_timeout at the start of each transaction"""
+
+    def begin(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+    event.listen(engine, "begin", begin)
+
+
+def init_database(app):
+    """Apply the statement timeout per transaction behind an external pooler"""
+    if not app.config.get("DB_EXTERNAL_POOLER"):
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            set_statement_timeout_per_transaction(
+                engine, app.config["DB_STATEMENT_TIMEOUT_MS"]
+            )
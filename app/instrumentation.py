@@ -0,0 +1,296 @@
+"""Per-request SQL and timing instrumentation
+
+Every request records how many statements it sent, the time spent in the
+database and in serialization, and the rows the database returned. The
+figures are sent back in a Server-Timing header and aggregated per endpoint
+into Prometheus histograms served at /metrics. A jump in queries per
+request for an endpoint is the signature of an N+1 regression.
+
+Statements slower than SLOW_QUERY_MS are logged with their EXPLAIN plan.
+Metrics are kept per process; scrape every worker or aggregate upstream.
+Streamed responses are recorded when the stream closes, so their figures
+include the rows served while streaming; they carry no Server-Timing
+header, which is sent before the body.
+
+Timings reveal internals, so Server-Timing is off unless
+SERVER_TIMING_ENABLED is set, and /metrics requires METRICS_TOKEN as a
+bearer token, or comes from the same host when no token is configured.
+"""
+
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LOOPBACK_ADDRESSES = ("127.0.0.1", "::1")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Counters of a single request, kept on flask.g"""
+
+    __slots__ = ("started", "queries", "db_seconds", "rows", "sections")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.sections = defaultdict(float)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-endpoint aggregates of RequestStats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = {}
+        self.queries = {}
+        self.db_seconds = defaultdict(float)
+        self.serialize_seconds = defaultdict(float)
+        self.rows = defaultdict(int)
+
+    def record(self, endpoint, method, status, duration, stats):
+        labels = (endpoint, method)
+        with self._lock:
+            self.requests[labels + (str(status),)] += 1
+            if labels not in self.latency:
+                self.latency[labels] = Histogram(LATENCY_BUCKETS)
+                self.queries[labels] = Histogram(QUERY_COUNT_BUCKETS)
+            self.latency[labels].observe(duration)
+            self.queries[labels].observe(stats.queries)
+            self.db_seconds[labels] += stats.db_seconds
+            self.serialize_seconds[labels] += stats.sections.get("serialize", 0.0)
+            self.rows[labels] += stats.rows
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += _counter(
+                "stasher_http_requests_total",
+                "Requests served.",
+                self.requests,
+                ("endpoint", "method", "status"),
+            )
+            lines += _histogram(
+                "stasher_http_request_duration_seconds",
+                "Request latency.",
+                self.latency,
+            )
+            lines += _histogram(
+                "stasher_http_request_db_queries",
+                "SQL statements sent per request.",
+                self.queries,
+            )
+            lines += _counter(
+                "stasher_http_request_db_seconds_total",
+                "Time spent waiting on the database.",
+                self.db_seconds,
+            )
+            lines += _counter(
+                "stasher_http_request_serialize_seconds_total",
+                "Time spent serializing responses.",
+                self.serialize_seconds,
+            )
+            lines += _counter(
+                "stasher_http_request_db_rows_total",
+                "Rows returned by the database.",
+                self.rows,
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _counter(name, help, values, label_names=("endpoint", "method")):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+    return lines
+
+
+def _histogram(name, help, histograms, label_names=("endpoint", "method")):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for labels, histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            le = _labels(label_names, labels, f'le="{bound}"')
+            lines.append(f"{name}_bucket{le} {count}")
+        le = _labels(label_names, labels, 'le="+Inf"')
+        lines.append(f"{name}_bucket{le} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(label_names, labels)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(label_names, labels)} {histogram.count}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+def _request_stats():
+    if has_request_context():
+        return g.get("request_stats")
+    return None
+
+
+@contextmanager
+def timed_section(name):
+    """Add the time spent in the block to a named Server-Timing section"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats()
+        if stats is not None:
+            stats.sections[name] += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = _request_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.rows += max(cursor.rowcount, 0)
+
+    slow_query_ms = (
+        current_app.config.get("SLOW_QUERY_MS") if has_request_context() else None
+    )
+    if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+        _log_slow_query(cursor, statement, parameters, elapsed, executemany)
+
+
+def _log_slow_query(cursor, statement, parameters, elapsed, executemany):
+    plan = None
+    first_word = statement.lstrip().split(None, 1)[0].upper()
+    if not executemany and first_word in ("SELECT", "WITH"):
+        # A bare DBAPI cursor keeps EXPLAIN out of the engine events, and
+        # the savepoint keeps a failing EXPLAIN from aborting the transaction
+        explain = cursor.connection.cursor()
+        try:
+            explain.execute("SAVEPOINT explain_slow_query")
+            try:
+                explain.execute("EXPLAIN " + statement, parameters)
+                plan = "\n".join(row[0] for row in explain.fetchall())
+            finally:
+                explain.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+                explain.execute("RELEASE SAVEPOINT explain_slow_query")
+        except Exception:  # the plan is best effort
+            logger.debug("Could not EXPLAIN slow query", exc_info=True)
+        finally:
+            explain.close()
+    logger.warning(
+        "Slow query (%.1f ms) on %s %s:\n%s\nPlan:\n%s",
+        elapsed * 1000,
+        request.method,
+        request.path,
+        statement,
+        plan or "unavailable",
+    )
+
+
+def _before_request():
+    g.request_stats = RequestStats()
+
+
+def _after_request(response):
+    if response.is_streamed:
+        # The body runs after this hook; record once the stream is closed
+        stats = g.get("request_stats")
+        if stats is not None:
+            response.call_on_close(_recorder(stats, response.status_code))
+        return response
+    stats = g.pop("request_stats", None)
+    if stats is None:
+        return response
+    duration = _record(stats, response.status_code)
+
+    if current_app.config.get("SERVER_TIMING_ENABLED"):
+        db_ms = stats.db_seconds * 1000
+        timings = [f'db;dur={db_ms:.2f};desc="{stats.queries} queries"']
+        timings += [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in stats.sections.items()
+        ]
+        timings.append(f"total;dur={duration * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+
+def _record(stats, status, endpoint=None, method=None):
+    """Add a finished request to the registry; returns its duration"""
+    duration = time.perf_counter() - stats.started
+    if endpoint is None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+    registry.record(endpoint, method, status, duration, stats)
+    return duration
+
+
+def _recorder(stats, status):
+    # The request context may be gone when the stream closes
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    return lambda: _record(stats, status, endpoint, method)
+
+
+def metrics():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        expected = f"Bearer {token}".encode()
+        given = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(given, expected):
+            abort(401)
+    elif request.remote_addr not in LOOPBACK_ADDRESSES:
+        abort(403)
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_instrumentation(app):
+    """Hook the engine and request lifecycle and expose /metrics"""
+    if not app.config.get("INSTRUMENTATION_ENABLED"):
+        return
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,44 @@
+"""Optional orjson-backed JSON provider
+
+orjson encodes the API payloads several times faster than the standard
+library. It is optional: without it the app keeps Flask's default provider.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson"""
+
+    def _option(self, sort_keys):
+        # Dates go through default() so they encode exactly as with Flask
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        option = self._option(kwargs.get("sort_keys", self.sort_keys))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._option(self.sort_keys)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype,
+        )
+
+
+def init_json_provider(app):
+    """Switch the app to orjson when configured and installed"""
+    if app.config.get("JSON_BACKEND") == "orjson" and orjson is not None:
+        app.json = OrjsonProvider(app)
@@ -1,5 +1,15 @@
 from app.models.stashpoint import Stashpoint
 from app.models.booking import Booking
+from app.models.booking_archive import BookingArchive
 from app.models.customer import Customer
+from app.models.occupancy import StashpointOccupancy
+from app.models.table_version import TableVersion
 
-__all__ = ["Stashpoint", "Booking", "Customer"]
+__all__ = [
+    "Stashpoint",
+    "Booking",
+    "BookingArchive",
+    "Customer",
+    "StashpointOccupancy",
+    "TableVersion",
+]
@@ -1,10 +1,38 @@
+import math
 import uuid
 from datetime import datetime
+from sqlalchemy import Integer, and_, func
 from sqlalchemy.ext.hybrid import hybrid_property
 from app import db
 
+SECONDS_PER_DAY = 86400
 
-class Booking(db.Model):
+
+class BookingStateMixin:
+    """Derived booking state shared by Booking and BookingArchive"""
+
+    @hybrid_property
+    def days(self):
+        """Number of started 24-hour periods the bags are stored for"""
+        seconds = (self.pickup_time - self.dropoff_time).total_seconds()
+        return max(1, math.ceil(seconds / SECONDS_PER_DAY))
+
+    @days.expression
+    def days(cls):
+        seconds = func.extract("epoch", cls.pickup_time - cls.dropoff_time)
+        return func.greatest(1, func.ceil(seconds / SECONDS_PER_DAY)).cast(Integer)
+
+    @hybrid_property
+    def is_active(self):
+        """Whether the booking still holds capacity at its stashpoint"""
+        return not self.is_cancelled and not self.checked_out
+
+    @is_active.expression
+    def is_active(cls):
+        return and_(cls.is_cancelled.is_(False), cls.checked_out.is_(False))
+
+
+class Booking(BookingStateMixin, db.Model):
     """Represents a customer's booking to store bags at a stashpoint"""
 
     __tablename__ = "bookings"
@@ -35,6 +63,22 @@ class Booking(db.Model):
     stashpoint = db.relationship("Stashpoint", back_populates="bookings")
     customer = db.relationship("Customer", back_populates="bookings")
 
+    __table_args__ = (
+        # Serves the availability predicate: stashpoint_id IN (...) AND NOT
+        # is_cancelled AND dropoff_time < :pickup AND pickup_time > :dropoff,
+        # with bag_count included so the sweep runs as an index-only scan
+        db.Index(
+            "ix_bookings_active_stashpoint_window",
+            stashpoint_id,
+            dropoff_time,
+            pickup_time,
+            postgresql_where=is_cancelled.is_(False),
+            postgresql_include=["bag_count"],
+        ),
+        # Keyset pages of a customer's bookings ordered by (dropoff_time, id)
+        db.Index("ix_bookings_customer_dropoff", customer_id, dropoff_time, id),
+    )
+
     def to_dict(self):
         """Convert the model to a dictionary for API responses"""
         return {
@@ -0,0 +1,60 @@
+from datetime import datetime
+from app import db
+from app.models.booking import BookingStateMixin
+
+
+class BookingArchive(BookingStateMixin, db.Model):
+    """A completed booking moved out of the bookings table
+
+    Same columns as Booking; see app/services/archive.py.
+    """
+
+    __tablename__ = "bookings_archive"
+
+    id = db.Column(db.String, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Booking details
+    bag_count = db.Column(db.Integer, nullable=False)
+    dropoff_time = db.Column(db.DateTime, nullable=False)
+    pickup_time = db.Column(db.DateTime, nullable=False)
+
+    # Status fields
+    is_paid = db.Column(db.Boolean, nullable=False)
+    is_cancelled = db.Column(db.Boolean, nullable=False)
+    checked_in = db.Column(db.Boolean, nullable=False)
+    checked_out = db.Column(db.Boolean, nullable=False)
+
+    # Foreign keys
+    stashpoint_id = db.Column(
+        db.String, db.ForeignKey("stashpoints.id"), nullable=False, index=True
+    )
+    customer_id = db.Column(
+        db.String, db.ForeignKey("customers.id"), nullable=False, index=True
+    )
+
+    __table_args__ = (
+        db.Index(
+            "ix_bookings_archive_customer_dropoff", customer_id, dropoff_time, id
+        ),
+    )
+
+    def to_dict(self):
+        """Convert the model to a dictionary for API responses"""
+        return {
+            "id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "archived_at": self.archived_at.isoformat(),
+            "bag_count": self.bag_count,
+            "dropoff_time": self.dropoff_time.isoformat(),
+            "pickup_time": self.pickup_time.isoformat(),
+            "is_paid": self.is_paid,
+            "is_cancelled": self.is_cancelled,
+            "checked_in": self.checked_in,
+            "checked_out": self.checked_out,
+            "stashpoint_id": self.stashpoint_id,
+            "customer_id": self.customer_id,
+            "days": self.days,
+            "is_active": self.is_active,
+        }
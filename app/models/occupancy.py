@@ -0,0 +1,24 @@
+from app import db
+
+
+class StashpointOccupancy(db.Model):
+    """Bags booked at a stashpoint during one hour, kept in step with bookings"""
+
+    __tablename__ = "stashpoint_occupancy"
+
+    stashpoint_id = db.Column(
+        db.String,
+        db.ForeignKey("stashpoints.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Start of the hour bucket
+    hour = db.Column(db.DateTime, primary_key=True)
+    booked = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """Convert the model to a dictionary for API responses"""
+        return {
+            "stashpoint_id": self.stashpoint_id,
+            "hour": self.hour.isoformat(),
+            "booked": self.booked,
+        }
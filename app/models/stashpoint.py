@@ -1,9 +1,42 @@
 import uuid
 from datetime import datetime
-from geoalchemy2.types import Geography
+from geoalchemy2.types import Geography, Geometry
+from sqlalchemy.dialects.postgresql import BIT
 from sqlalchemy.ext.hybrid import hybrid_method
-from sqlalchemy import func
+from sqlalchemy import cast, event, func, literal_column
+from sqlalchemy.types import TypeDecorator
 from app import db
+from app.services.schedule import SLOTS_PER_WEEK, daily_schedule, opening_hours
+
+
+class WeeklySchedule(TypeDecorator):
+    """BIT(672) opening schedule, read back as a str of 0s and 1s"""
+
+    impl = BIT(SLOTS_PER_WEEK)
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        # psycopg2 returns bit strings as str, asyncpg as a BitString
+        if value is None or isinstance(value, str):
+            return value
+        return value.as_string()
+
+
+WEB_MERCATOR_SRID = 3857
+
+
+def web_mercator(location):
+    """Web Mercator point of a geography column
+
+    The planner only uses an expression index for an identical expression,
+    so this is exactly the one of ix_stashpoints_location_mercator in the
+    migrations: a cast to plain geometry, without a typmod, and the SRID as
+    a literal rather than a bound parameter.
+    """
+    return func.ST_Transform(
+        cast(location, Geometry(geometry_type=None)),
+        literal_column(str(WEB_MERCATOR_SRID)),
+    )
 
 
 class Stashpoint(db.Model):
@@ -13,6 +46,10 @@ class Stashpoint(db.Model):
 
     id = db.Column(db.String, primary_key=True, default=lambda: uuid.uuid4().hex)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Stamped on every write with the new stashpoints table version, see
+    # app/services/versions.py
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
 
     # Basic details
     name = db.Column(db.String(255), nullable=False)
@@ -34,15 +71,34 @@ class Stashpoint(db.Model):
     open_from = db.Column(db.Time, nullable=False)
     open_until = db.Column(db.Time, nullable=False)
 
+    # Open 15-minute slots of the week, see app/services/schedule.py.
+    # Setting open_from or open_until resets it to those hours every day
+    weekly_schedule = db.Column(WeeklySchedule, nullable=False)
+
     # Relationships
     bookings = db.relationship("Booking", back_populates="stashpoint", lazy="dynamic")
 
+    __table_args__ = (
+        # ?since= delta sync, ordered by (version, id)
+        db.Index("ix_stashpoints_version_id", version, id),
+        # Map tile lookups, see app/services/clusters.py
+        db.Index(
+            "ix_stashpoints_location_mercator",
+            web_mercator(location),
+            postgresql_using="gist",
+        ),
+    )
+
     def __init__(self, **kwargs):
         super(Stashpoint, self).__init__(**kwargs)
         # Set the location from latitude and longitude
         if "latitude" in kwargs and "longitude" in kwargs:
             point_wkt = f'POINT({kwargs["longitude"]} {kwargs["latitude"]})'
             self.location = point_wkt
+        # The open_from and open_until kwargs derived a daily schedule; an
+        # explicit one wins whatever the order of the kwargs
+        if "weekly_schedule" in kwargs:
+            self.weekly_schedule = kwargs["weekly_schedule"]
 
     def to_dict(self):
         """Convert the model to a dictionary for API responses"""
@@ -59,4 +115,21 @@ class Stashpoint(db.Model):
             "open_until": (
                 self.open_until.strftime("%H:%M") if self.open_until else None
             ),
+            "opening_hours": (
+                opening_hours(self.weekly_schedule) if self.weekly_schedule else None
+            ),
         }
+
+
+@event.listens_for(Stashpoint.open_from, "set")
+@event.listens_for(Stashpoint.open_until, "set")
+def _derive_weekly_schedule(target, value, oldvalue, initiator):
+    """Re-derive the daily weekly_schedule when the opening hours change"""
+    if value == oldvalue:
+        return
+    if initiator.key == "open_from":
+        open_from, open_until = value, target.open_until
+    else:
+        open_from, open_until = target.open_from, value
+    if open_from is not None and open_until is not None:
+        target.weekly_schedule = daily_schedule(open_from, open_until)
@@ -0,0 +1,22 @@
+from app import db
+
+
+class TableVersion(db.Model):
+    """Change counter of a table, bumped by every transaction writing to it"""
+
+    __tablename__ = "table_versions"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    # Version of the last change that deleted rows, which a delta cannot show
+    deleted_version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def to_dict(self):
+        """Convert the model to a dictionary for API responses"""
+        return {
+            "name": self.name,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat(),
+            "deleted_version": self.deleted_version,
+        }
@@ -0,0 +1,220 @@
+"""Read-replica routing
+
+Searches and listings only read, yet they share the primary with booking
+writes. With DATABASE_REPLICA_URLS set, every replica is a Flask-SQLAlchemy
+bind. route_reads_to_replicas picks one per request, round-robin, and
+RoutingSession sends the plain SELECTs of that request to it. Everything
+else stays
+on the primary: writes, flushes, SELECT ... FOR UPDATE, text() statements
+and any request not marked, such as the booking routes. Reads filling the
+search cache go to the primary too (see reads_from_primary): entries
+outlive the request, and a lagging replica could fill one with bookings
+that an invalidation already accounted for.
+
+Replicas are health-checked at most every REPLICA_HEALTH_CHECK_SECONDS by
+the request that next picks them: one that cannot be reached, or lags
+the primary by more than REPLICA_MAX_LAG_SECONDS, is skipped until a later
+check passes. One request checks a replica at a time, outside any lock,
+while the others go on with its last known state. A replica that drops
+connections mid-request is skipped straight away. With no healthy replica,
+reads go to the primary.
+
+A client that just wrote must see its write, which a lagging replica may
+not have applied yet. pin_reads_to_primary sets a cookie after a
+successful write, and requests carrying it read from the primary for
+READ_YOUR_WRITES_SECONDS.
+
+This module must not import from app, which imports RoutingSession to
+create db.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+# Bind keys of the replicas, see SQLALCHEMY_BINDS in config.py
+REPLICA_BIND_PREFIX = "replica_"
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+# Seconds the replica is behind in replaying the primary's changes; zero on
+# a primary, or a plain database standing in for a replica
+REPLICATION_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(epoch FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """
+)
+
+
+class ReplicaSet:
+    """Round-robin over the replica engines that passed their last check"""
+
+    def __init__(self, engines, check_interval, max_lag):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._keys = sorted(engines)
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+        self._healthy = dict.fromkeys(self._keys, True)
+        self._checked_at = dict.fromkeys(self._keys, float("-inf"))
+        self._checking = set()
+
+    def choose(self):
+        """Engine of the next healthy replica, or None if there is none"""
+        for _ in self._keys:
+            key = self._keys[next(self._turns) % len(self._keys)]
+            if self.is_healthy(key):
+                return self.engines[key]
+        return None
+
+    def is_healthy(self, key):
+        if self._claim_check(key):
+            healthy = False
+            try:
+                healthy = self.check(key)
+            finally:
+                with self._lock:
+                    self._healthy[key] = healthy
+                    self._checked_at[key] = time.monotonic()
+                    self._checking.discard(key)
+        return self._healthy[key]
+
+    def _claim_check(self, key):
+        """Whether the calling thread is the one to check a replica now"""
+        if time.monotonic() - self._checked_at[key] < self.check_interval:
+            return False
+        with self._lock:
+            # Another thread may be checking, or have checked since
+            if key in self._checking:
+                return False
+            if time.monotonic() - self._checked_at[key] < self.check_interval:
+                return False
+            self._checking.add(key)
+            return True
+
+    def check(self, key):
+        """Whether a replica answers and is within the allowed lag"""
+        try:
+            with self.engines[key].connect() as connection:
+                lag = connection.execute(REPLICATION_LAG).scalar()
+        except SQLAlchemyError:
+            logger.warning("Replica %s is unreachable", key, exc_info=True)
+            return False
+        if lag > self.max_lag:
+            logger.warning("Replica %s lags by %.1fs", key, lag)
+            return False
+        return True
+
+    def mark_unhealthy(self, key):
+        with self._lock:
+            self._healthy[key] = False
+            self._checked_at[key] = time.monotonic()
+
+    def status(self):
+        """{bind key: healthy} after checking every replica now"""
+        return {key: self.check(key) for key in self._keys}
+
+
+class RoutingSession(Session):
+    """Session sending the reads of marked requests to their replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return g.read_replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        return (
+            has_request_context()
+            and g.get("read_replica") is not None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        )
+
+
+@contextmanager
+def reads_from_primary():
+    """Send the reads inside the block to the primary, even in marked requests"""
+    replica = g.pop("read_replica", None) if has_request_context() else None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.read_replica = replica
+
+
+def route_reads_to_replicas():
+    """before_request hook: read from a replica unless the client just wrote
+
+    The replica is chosen once, so all reads of the request see the same
+    snapshot of the data.
+    """
+    replicas = current_app.extensions.get("replicas")
+    if replicas is None:
+        return
+    try:
+        pinned_until = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    if pinned_until <= time.time():
+        g.read_replica = replicas.choose()
+
+
+def pin_reads_to_primary(response):
+    """after_request hook: the client reads from the primary for a while"""
+    if (
+        "replicas" in current_app.extensions
+        and request.method != "GET"
+        and response.status_code < 400
+    ):
+        seconds = current_app.config["READ_YOUR_WRITES_SECONDS"]
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            str(time.time() + seconds),
+            max_age=seconds,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+def init_replicas(app, db):
+    """Set up the ReplicaSet of the replica binds, if any are configured"""
+    with app.app_context():
+        engines = {
+            key: engine
+            for key, engine in db.engines.items()
+            if key and key.startswith(REPLICA_BIND_PREFIX)
+        }
+    if not engines:
+        return
+    replicas = ReplicaSet(
+        engines,
+        app.config["REPLICA_HEALTH_CHECK_SECONDS"],
+        app.config["REPLICA_MAX_LAG_SECONDS"],
+    )
+    for key, engine in engines.items():
+
+        def handle_error(context, key=key):
+            # Also failures to connect, which have no connection yet
+            if context.is_disconnect or context.connection is None:
+                replicas.mark_unhealthy(key)
+
+        event.listen(engine, "handle_error", handle_error)
+    app.extensions["replicas"] = replicas
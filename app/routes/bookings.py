@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, request
+from app.replicas import pin_reads_to_primary
+from app.services.bookings import (
+    BookingError,
+    cancel_booking,
+    create_booking,
+    parse_booking_request,
+)
+
+
+bp = Blueprint("bookings", __name__)
+bp.after_request(pin_reads_to_primary)
+
+
+@bp.errorhandler(BookingError)
+def handle_booking_error(e):
+    return jsonify({"error": str(e)}), e.status_code
+
+
+@bp.route("/", methods=["POST"])
+def post_booking():
+    booking = create_booking(**parse_booking_request(request.get_json(silent=True)))
+    return jsonify(booking.to_dict()), 201
+
+
+@bp.route("/<booking_id>/cancel", methods=["POST"])
+def post_cancel_booking(booking_id):
+    return jsonify(cancel_booking(booking_id).to_dict())
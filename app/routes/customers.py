@@ -0,0 +1,36 @@
+from flask import Blueprint, jsonify, request, url_for
+from app.instrumentation import timed_section
+from app.services.customer_bookings import (
+    CustomerBookingsValidationError,
+    customer_bookings,
+    parse_customer_bookings_args,
+)
+from app.services.pagination import PaginationError, split_page
+
+
+bp = Blueprint("customers", __name__)
+
+
+@bp.route("/<customer_id>/bookings", methods=["GET"])
+def get_customer_bookings(customer_id):
+    try:
+        filters, limit, after = parse_customer_bookings_args(request.args)
+    except (CustomerBookingsValidationError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = customer_bookings(customer_id, filters, limit + 1, after)
+    if results is None:
+        return jsonify({"error": "Customer not found"}), 404
+
+    page, next_cursor = split_page(results, limit)
+    with timed_section("serialize"):
+        response = jsonify(page)
+    if next_cursor is not None:
+        next_url = url_for(
+            ".get_customer_bookings",
+            customer_id=customer_id,
+            **{**request.args.to_dict(), "cursor": next_cursor},
+        )
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
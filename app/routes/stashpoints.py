@@ -1,13 +1,243 @@
-# write me a route to get all stashpoints
-
-from flask import Blueprint, jsonify
+from datetime import datetime
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
+from sqlalchemy import select, tuple_
+from app import db
+from app.instrumentation import timed_section
 from app.models import Stashpoint
+from app.replicas import route_reads_to_replicas
+from app.serializers import STASHPOINT_COLUMNS, stashpoint_dict
+from app.services.calendar import (
+    MAX_CALENDAR_STASHPOINTS,
+    CalendarValidationError,
+    availability_calendars,
+    parse_calendar_args,
+)
+from app.services.clusters import (
+    ClusterValidationError,
+    bounds_bbox,
+    cluster_stashpoints,
+    parse_tile,
+    parse_viewport_args,
+    parse_window_args,
+)
+from app.services.pagination import (
+    DEFAULT_STREAM_BATCH_SIZE,
+    ID_KEY,
+    SEARCH_KEY,
+    VERSION_KEY,
+    PaginationError,
+    parse_page_args,
+    split_page,
+    stream_json_array,
+)
+from app.services.search import (
+    SearchValidationError,
+    batch_search_stashpoints,
+    is_search_request,
+    nearest_search_results,
+    parse_batch_search_params,
+    parse_nearest_args,
+    parse_search_params,
+    search_results,
+)
+from app.services.versions import (
+    STASHPOINTS,
+    SyncValidationError,
+    listing_headers,
+    parse_since,
+    table_version,
+)
 
 
 bp = Blueprint("stashpoints", __name__)
+# Every stashpoints route only reads
+bp.before_request(route_reads_to_replicas)
+
+
+def listing_results(after=None, limit=None, yield_per=None, since=None):
+    """Yield ((id,), result) pairs of every stashpoint ordered by id
+
+    With since, yield ((version, id), result) pairs of the stashpoints
+    stamped after that version instead, ordered by (version, id).
+    """
+    if since is None:
+        statement = select(*STASHPOINT_COLUMNS).order_by(Stashpoint.id)
+        if after is not None:
+            statement = statement.where(Stashpoint.id > after[0])
+    else:
+        key = tuple_(Stashpoint.version, Stashpoint.id)
+        statement = (
+            select(*STASHPOINT_COLUMNS, Stashpoint.version)
+            .where(Stashpoint.version > since)
+            .order_by(Stashpoint.version, Stashpoint.id)
+        )
+        if after is not None:
+            statement = statement.where(key > tuple_(*after))
+    if limit is not None:
+        statement = statement.limit(limit)
+    if yield_per:
+        statement = statement.execution_options(yield_per=yield_per)
+    for row in db.session.execute(statement):
+        key = (row.id,) if since is None else (row.version, row.id)
+        yield key, stashpoint_dict(row)
+
+
+def is_streaming_request(args):
+    return args.get("stream", "").lower() in ("1", "true")
 
 
 @bp.route("/", methods=["GET"])
 def get_stashpoints():
-    stashpoints = Stashpoint.query.all()
-    return jsonify([stashpoint.to_dict() for stashpoint in stashpoints])
+    searching = is_search_request(request.args)
+    try:
+        params = parse_search_params(request.args) if searching else None
+        nearest = parse_nearest_args(request.args) if searching else None
+        since = parse_since(request.args)
+        if searching and since is not None:
+            raise SearchValidationError("'since' cannot be combined with a search")
+        key_types = VERSION_KEY if since is not None else ID_KEY
+        limit, after = parse_page_args(
+            request.args, SEARCH_KEY if searching else key_types
+        )
+        if nearest is not None and (limit is not None or after is not None):
+            raise SearchValidationError(
+                "'nearest' cannot be combined with 'limit' or 'cursor'"
+            )
+    except (SearchValidationError, SyncValidationError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Availability changes with every booking, so only the listing is
+    # versioned: unchanged polls are answered from the version row alone
+    headers = {}
+    if not searching:
+        headers, modified, since = listing_headers(
+            STASHPOINTS,
+            table_version(STASHPOINTS),
+            request.query_string,
+            request.headers,
+            since,
+        )
+        if not modified:
+            return Response(status=304, headers=headers)
+
+    if nearest is not None:
+        results = [result for _, result in nearest_search_results(params, *nearest)]
+        with timed_section("serialize"):
+            return jsonify(results)
+
+    def fetch(**kwargs):
+        if searching:
+            return search_results(params, after=after, **kwargs)
+        return listing_results(after=after, since=since, **kwargs)
+
+    if is_streaming_request(request.args):
+        # Constant memory: rows come from a server-side cursor in batches
+        results = (
+            result
+            for _, result in fetch(limit=limit, yield_per=DEFAULT_STREAM_BATCH_SIZE)
+        )
+        return Response(
+            stream_with_context(stream_json_array(results)),
+            mimetype="application/json",
+            headers=headers,
+        )
+
+    page, next_cursor = split_page(
+        fetch(limit=limit + 1 if limit is not None else None), limit
+    )
+    with timed_section("serialize"):
+        response = jsonify(page)
+    response.headers.update(headers)
+    if next_cursor is not None:
+        next_url = url_for(
+            ".get_stashpoints", **{**request.args.to_dict(), "cursor": next_cursor}
+        )
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+
+@bp.route("/search/batch", methods=["POST"])
+def batch_search():
+    try:
+        params_list = parse_batch_search_params(request.get_json(silent=True))
+    except SearchValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = batch_search_stashpoints(params_list)
+    with timed_section("serialize"):
+        return jsonify({"results": results})
+
+
+@bp.route("/calendar", methods=["GET"])
+def get_calendars():
+    ids = [id for id in request.args.get("ids", "").split(",") if id]
+    try:
+        if not ids:
+            raise CalendarValidationError("'ids' is required")
+        if len(ids) > MAX_CALENDAR_STASHPOINTS:
+            raise CalendarValidationError(
+                f"At most {MAX_CALENDAR_STASHPOINTS} stashpoints per calendar request"
+            )
+        start, end, interval = parse_calendar_args(request.args)
+    except CalendarValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    calendars = availability_calendars(ids, start, end, interval)
+    return jsonify({"calendars": calendars})
+
+
+@bp.route("/<stashpoint_id>/calendar", methods=["GET"])
+def get_calendar(stashpoint_id):
+    try:
+        start, end, interval = parse_calendar_args(request.args)
+    except CalendarValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    calendars = availability_calendars([stashpoint_id], start, end, interval)
+    if stashpoint_id not in calendars:
+        return jsonify({"error": "Stashpoint not found"}), 404
+    return jsonify(calendars[stashpoint_id])
+
+
+def cluster_response(body):
+    """JSON response of clusters, cacheable by shared caches for a while"""
+    with timed_section("serialize"):
+        response = jsonify(body)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["CLUSTER_MAX_AGE_SECONDS"]
+    return response
+
+
+@bp.route("/clusters", methods=["GET"])
+def get_clusters():
+    try:
+        zoom, bounds = parse_viewport_args(request.args)
+        dropoff, pickup = parse_window_args(request.args, datetime.utcnow())
+    except ClusterValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    clusters = cluster_stashpoints(bounds, zoom, dropoff, pickup)
+    return cluster_response(
+        {"zoom": zoom, "bbox": bounds_bbox(bounds), "clusters": clusters}
+    )
+
+
+@bp.route("/clusters/<int:zoom>/<int:x>/<int:y>", methods=["GET"])
+def get_cluster_tile(zoom, x, y):
+    try:
+        zoom, bounds = parse_tile(zoom, x, y)
+        dropoff, pickup = parse_window_args(request.args, datetime.utcnow())
+    except ClusterValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    clusters = cluster_stashpoints(bounds, zoom, dropoff, pickup)
+    return cluster_response({"zoom": zoom, "x": x, "y": y, "clusters": clusters})
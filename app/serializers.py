@@ -0,0 +1,170 @@
+"""Column-projection serializers for API responses
+
+The model to_dict() methods need fully loaded ORM instances. The hot paths
+instead select only the columns a response needs as plain rows and turn
+them into dicts here, skipping identity-map bookkeeping and attribute
+instrumentation. Each *_COLUMNS tuple is meant to be splatted into
+select() and its rows handed to the matching *_dict function.
+"""
+
+from app.models import Booking, Customer, Stashpoint
+from app.services.schedule import opening_hours
+
+# "HH:MM" for every minute of the day, indexed by hour * 60 + minute
+_HHMM = [f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in range(60)]
+
+
+def format_hhmm(value):
+    """Format a time as HH:MM without going through strftime"""
+    if value is None:
+        return None
+    return _HHMM[value.hour * 60 + value.minute]
+
+
+STASHPOINT_COLUMNS = (
+    Stashpoint.id,
+    Stashpoint.name,
+    Stashpoint.description,
+    Stashpoint.address,
+    Stashpoint.postal_code,
+    Stashpoint.latitude,
+    Stashpoint.longitude,
+    Stashpoint.capacity,
+    Stashpoint.open_from,
+    Stashpoint.open_until,
+    Stashpoint.weekly_schedule,
+)
+
+
+def stashpoint_dict(row):
+    """Same shape as Stashpoint.to_dict() from a STASHPOINT_COLUMNS row"""
+    (
+        id,
+        name,
+        description,
+        address,
+        postal_code,
+        latitude,
+        longitude,
+        capacity,
+        open_from,
+        open_until,
+        weekly_schedule,
+    ) = row[: len(STASHPOINT_COLUMNS)]
+    return {
+        "id": id,
+        "name": name,
+        "description": description,
+        "address": address,
+        "postal_code": postal_code,
+        "latitude": latitude,
+        "longitude": longitude,
+        "capacity": capacity,
+        "open_from": format_hhmm(open_from),
+        "open_until": format_hhmm(open_until),
+        "opening_hours": opening_hours(weekly_schedule) if weekly_schedule else None,
+    }
+
+
+def booking_columns(model=Booking):
+    """BOOKING_COLUMNS of Booking or of another model with its columns"""
+    return (
+        model.id,
+        model.created_at,
+        model.bag_count,
+        model.dropoff_time,
+        model.pickup_time,
+        model.is_paid,
+        model.is_cancelled,
+        model.checked_in,
+        model.checked_out,
+        model.stashpoint_id,
+        model.customer_id,
+        model.days.label("days"),
+        model.is_active.label("is_active"),
+    )
+
+
+BOOKING_COLUMNS = booking_columns()
+
+
+def booking_dict(row):
+    """Same shape as Booking.to_dict() from a BOOKING_COLUMNS row"""
+    (
+        id,
+        created_at,
+        bag_count,
+        dropoff_time,
+        pickup_time,
+        is_paid,
+        is_cancelled,
+        checked_in,
+        checked_out,
+        stashpoint_id,
+        customer_id,
+        days,
+        is_active,
+    ) = row[: len(BOOKING_COLUMNS)]
+    return {
+        "id": id,
+        "created_at": created_at.isoformat(),
+        "bag_count": bag_count,
+        "dropoff_time": dropoff_time.isoformat(),
+        "pickup_time": pickup_time.isoformat(),
+        "is_paid": is_paid,
+        "is_cancelled": is_cancelled,
+        "checked_in": checked_in,
+        "checked_out": checked_out,
+        "stashpoint_id": stashpoint_id,
+        "customer_id": customer_id,
+        "days": days,
+        "is_active": is_active,
+    }
+
+
+CUSTOMER_COLUMNS = (
+    Customer.id,
+    Customer.email,
+    Customer.name,
+    Customer.phone,
+    Customer.created_at,
+)
+
+
+def customer_dict(row):
+    """Same shape as Customer.to_dict() from a CUSTOMER_COLUMNS row"""
+    id, email, name, phone, created_at = row[: len(CUSTOMER_COLUMNS)]
+    return {
+        "id": id,
+        "email": email,
+        "name": name,
+        "phone": phone,
+        "created_at": created_at.isoformat(),
+    }
+
+
+STASHPOINT_SUMMARY_COLUMNS = (
+    Stashpoint.name.label("stashpoint_name"),
+    Stashpoint.address.label("stashpoint_address"),
+    Stashpoint.postal_code.label("stashpoint_postal_code"),
+    Stashpoint.latitude.label("stashpoint_latitude"),
+    Stashpoint.longitude.label("stashpoint_longitude"),
+)
+
+
+def booking_with_stashpoint_dict(row):
+    """booking_dict plus a stashpoint summary, from BOOKING_COLUMNS followed
+    by STASHPOINT_SUMMARY_COLUMNS"""
+    result = booking_dict(row)
+    name, address, postal_code, latitude, longitude = row[
+        len(BOOKING_COLUMNS) : len(BOOKING_COLUMNS) + len(STASHPOINT_SUMMARY_COLUMNS)
+    ]
+    result["stashpoint"] = {
+        "id": result["stashpoint_id"],
+        "name": name,
+        "address": address,
+        "postal_code": postal_code,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+    return result
@@ -0,0 +1 @@
+# Query and domain services shared by the routes and CLI commands
@@ -0,0 +1,91 @@
+"""Archival of completed bookings
+
+Availability queries scan the bookings of each candidate stashpoint whose
+dropoff is before the end of the searched window, so every past booking
+left in the table makes searches slower. Completed bookings (checked out,
+cancelled or never checked in, with a pickup before the cutoff) are moved to
+bookings_archive in batches, keeping bookings and its indexes the size of
+the recent and upcoming business.
+
+Each batch is one DELETE ... RETURNING feeding an INSERT, so a booking is
+never in both tables or in neither. Rows locked by a concurrent writer are
+skipped and picked up by the next run. The hourly occupancy buckets of
+archived bookings are left in place; they only cover past hours.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, or_, select
+from app import db
+from app.models import Booking, BookingArchive
+
+DEFAULT_ARCHIVE_BATCH_SIZE = 10000
+
+ARCHIVED_COLUMNS = (
+    "id",
+    "created_at",
+    "bag_count",
+    "dropoff_time",
+    "pickup_time",
+    "is_paid",
+    "is_cancelled",
+    "checked_in",
+    "checked_out",
+    "stashpoint_id",
+    "customer_id",
+)
+
+
+def archive_cutoff(days):
+    """Pickup time before which completed bookings are archived"""
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def build_archive_statement(before, batch_size):
+    """Move one batch of completed bookings picked up before the cutoff"""
+    batch = (
+        select(Booking.id)
+        .where(
+            Booking.pickup_time < before,
+            or_(
+                Booking.checked_out.is_(True),
+                Booking.is_cancelled.is_(True),
+                # No-shows: the bags never arrived and the pickup has passed
+                Booking.checked_in.is_(False),
+            ),
+        )
+        .order_by(Booking.pickup_time)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    columns = [Booking.__table__.c[name] for name in ARCHIVED_COLUMNS]
+    moved = (
+        Booking.__table__.delete()
+        .where(Booking.id.in_(batch.scalar_subquery()))
+        .returning(*columns)
+        .cte("moved")
+    )
+    return insert(BookingArchive).from_select(
+        list(ARCHIVED_COLUMNS) + ["archived_at"],
+        select(
+            *(moved.c[name] for name in ARCHIVED_COLUMNS),
+            func.timezone("utc", func.now()),
+        ),
+    )
+
+
+def archive_bookings(before, batch_size=DEFAULT_ARCHIVE_BATCH_SIZE, progress=None):
+    """Archive every completed booking picked up before the cutoff
+
+    Commits after each batch and returns the number of bookings moved.
+    progress, if given, is called with the running total after each batch.
+    """
+    total = 0
+    while True:
+        result = db.session.execute(build_archive_statement(before, batch_size))
+        db.session.commit()
+        moved = result.rowcount
+        total += moved
+        if progress is not None:
+            progress(total)
+        if moved < batch_size:
+            return total
@@ -0,0 +1,198 @@
+"""Peak-occupancy capacity engine
+
+A stashpoint has room for a new booking when the highest number of bags
+stored at the same instant during the requested window, plus the new bags,
+fits its capacity. Summing every overlapping booking over-reserves, since
+two bookings can overlap the window without ever overlapping each other.
+"""
+
+from sqlalchemy import func, literal, select, union_all
+from app.models import Booking
+
+
+def peak_occupancy(intervals, window_start=None, window_end=None):
+    """Return the maximum concurrent bags for (start, end, bags) intervals
+
+    Intervals are half-open, so a booking picked up at 10:00 does not
+    overlap one dropped off at 10:00. When a window is given the intervals
+    are clipped to it first. Runs in O(k log k) for k intervals.
+    """
+    events = []
+    for start, end, bags in intervals:
+        if window_start is not None and start < window_start:
+            start = window_start
+        if window_end is not None and end > window_end:
+            end = window_end
+        if start < end:
+            events.append((start, bags))
+            events.append((end, -bags))
+
+    # Pickups sort before dropoffs at the same instant
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    peak = occupied = 0
+    for _, delta in events:
+        occupied += delta
+        if occupied > peak:
+            peak = occupied
+    return peak
+
+
+def peak_occupancy_subquery(dropoff, pickup, stashpoint_ids=None):
+    """Peak concurrent bags per stashpoint during [dropoff, pickup]
+
+    The same sweep as peak_occupancy, expressed as a window function so it
+    runs in the database for every candidate stashpoint in one pass.
+    stashpoint_ids (a list or a select of ids) restricts the sweep to the
+    candidate set.
+    """
+    criteria = []
+    if stashpoint_ids is not None:
+        criteria.append(Booking.stashpoint_id.in_(stashpoint_ids))
+    clipped = (
+        select(
+            Booking.stashpoint_id.label("stashpoint_id"),
+            Booking.bag_count.label("bag_count"),
+            func.greatest(Booking.dropoff_time, dropoff).label("starts_at"),
+            func.least(Booking.pickup_time, pickup).label("ends_at"),
+        )
+        .where(
+            Booking.is_cancelled.is_(False),
+            Booking.dropoff_time < pickup,
+            Booking.pickup_time > dropoff,
+            *criteria,
+        )
+        .cte("clipped_bookings")
+    )
+
+    events = union_all(
+        select(
+            clipped.c.stashpoint_id,
+            clipped.c.starts_at.label("at"),
+            clipped.c.bag_count.label("delta"),
+        ),
+        select(
+            clipped.c.stashpoint_id,
+            clipped.c.ends_at.label("at"),
+            (literal(0) - clipped.c.bag_count).label("delta"),
+        ),
+    ).subquery("booking_events")
+
+    running = select(
+        events.c.stashpoint_id,
+        func.sum(events.c.delta)
+        .over(
+            partition_by=events.c.stashpoint_id,
+            order_by=(events.c.at, events.c.delta),
+        )
+        .label("occupied"),
+    ).subquery("running_occupancy")
+
+    return (
+        select(
+            running.c.stashpoint_id,
+            func.max(running.c.occupied).label("peak"),
+        )
+        .group_by(running.c.stashpoint_id)
+        .subquery("peak_occupancy")
+    )
+
+
+def correlated_peak_subquery(stashpoint_id, dropoff, pickup):
+    """Peak concurrent bags during [dropoff, pickup] as a LATERAL subquery
+
+    stashpoint_id is a column of the enclosing query, which joins the
+    subquery ON true. The sweep only runs for the rows the enclosing query
+    reaches, so under a LIMIT it stops as soon as enough rows matched.
+    """
+    overlapping = (
+        Booking.stashpoint_id == stashpoint_id,
+        Booking.is_cancelled.is_(False),
+        Booking.dropoff_time < pickup,
+        Booking.pickup_time > dropoff,
+    )
+    events = union_all(
+        select(
+            func.greatest(Booking.dropoff_time, dropoff).label("at"),
+            Booking.bag_count.label("delta"),
+        )
+        .where(*overlapping)
+        .correlate_except(Booking),
+        select(
+            func.least(Booking.pickup_time, pickup).label("at"),
+            (literal(0) - Booking.bag_count).label("delta"),
+        )
+        .where(*overlapping)
+        .correlate_except(Booking),
+    ).subquery("booking_events")
+
+    running = select(
+        func.sum(events.c.delta)
+        .over(order_by=(events.c.at, events.c.delta))
+        .label("occupied")
+    ).subquery("running_occupancy")
+
+    return select(
+        func.coalesce(func.max(running.c.occupied), 0).label("peak")
+    ).lateral("candidate_peak")
+
+
+def windowed_peak_subquery(windows):
+    """Peak concurrent bags for many (stashpoint, window) pairs at once
+
+    windows is a selectable with idx, stashpoint_id, dropoff and pickup
+    columns, one row per search index and candidate stashpoint. The sweep
+    is partitioned by both, so each search sees only its own window.
+    """
+    clipped = (
+        select(
+            windows.c.idx,
+            Booking.stashpoint_id.label("stashpoint_id"),
+            Booking.bag_count.label("bag_count"),
+            func.greatest(Booking.dropoff_time, windows.c.dropoff).label("starts_at"),
+            func.least(Booking.pickup_time, windows.c.pickup).label("ends_at"),
+        )
+        .join(windows, windows.c.stashpoint_id == Booking.stashpoint_id)
+        .where(
+            Booking.is_cancelled.is_(False),
+            Booking.dropoff_time < windows.c.pickup,
+            Booking.pickup_time > windows.c.dropoff,
+        )
+        .cte("clipped_window_bookings")
+    )
+
+    events = union_all(
+        select(
+            clipped.c.idx,
+            clipped.c.stashpoint_id,
+            clipped.c.starts_at.label("at"),
+            clipped.c.bag_count.label("delta"),
+        ),
+        select(
+            clipped.c.idx,
+            clipped.c.stashpoint_id,
+            clipped.c.ends_at.label("at"),
+            (literal(0) - clipped.c.bag_count).label("delta"),
+        ),
+    ).subquery("window_booking_events")
+
+    running = select(
+        events.c.idx,
+        events.c.stashpoint_id,
+        func.sum(events.c.delta)
+        .over(
+            partition_by=(events.c.idx, events.c.stashpoint_id),
+            order_by=(events.c.at, events.c.delta),
+        )
+        .label("occupied"),
+    ).subquery("window_running_occupancy")
+
+    return (
+        select(
+            running.c.idx,
+            running.c.stashpoint_id,
+            func.max(running.c.occupied).label("peak"),
+        )
+        .group_by(running.c.idx, running.c.stashpoint_id)
+        .subquery("window_peak_occupancy")
+    )
@@ -0,0 +1,141 @@
+"""Booking creation with per-stashpoint capacity enforcement
+
+Checking availability and then inserting is a race: two requests can both
+see the last free slot. create_booking takes a row lock on the stashpoint
+(SELECT ... FOR UPDATE) before checking, so bookings for the same
+stashpoint are serialized while bookings for different stashpoints never
+wait on each other. The lock is held until the booking commits.
+cancel_booking likewise locks the booking it cancels.
+"""
+
+from datetime import datetime
+from sqlalchemy import select
+from app import db
+from app.models import Booking, Customer, Stashpoint
+from app.services.availability import peak_occupancy_subquery
+from app.services.search import SearchValidationError, is_open_for, parse_datetime
+
+
+class BookingError(Exception):
+    """Base class of booking failures, carrying the HTTP status to answer with"""
+
+    status_code = 400
+
+
+class BookingValidationError(BookingError):
+    """Raised when the booking request is malformed"""
+
+
+class NotFoundError(BookingError):
+    """Raised when the booking, customer or stashpoint does not exist"""
+
+    status_code = 404
+
+
+class CapacityError(BookingError):
+    """Raised when the stashpoint cannot take the bags for the whole window"""
+
+    status_code = 409
+
+
+def parse_booking_request(data):
+    """Validate a booking request body into create_booking arguments"""
+    if not isinstance(data, dict):
+        raise BookingValidationError("Request body must be a JSON object")
+    for name in ("customer_id", "stashpoint_id", "dropoff", "pickup", "bag_count"):
+        if data.get(name) in (None, ""):
+            raise BookingValidationError(f"'{name}' is required")
+    try:
+        dropoff = parse_datetime(data["dropoff"], "dropoff")
+        pickup = parse_datetime(data["pickup"], "pickup")
+    except SearchValidationError as e:
+        raise BookingValidationError(str(e))
+
+    bag_count = data["bag_count"]
+    if not isinstance(bag_count, int) or isinstance(bag_count, bool) or bag_count < 1:
+        raise BookingValidationError("'bag_count' must be a positive integer")
+    if pickup <= dropoff:
+        raise BookingValidationError("'pickup' must be after 'dropoff'")
+
+    return {
+        "customer_id": str(data["customer_id"]),
+        "stashpoint_id": str(data["stashpoint_id"]),
+        "dropoff": dropoff,
+        "pickup": pickup,
+        "bag_count": bag_count,
+    }
+
+
+def peak_booked_bags(stashpoint_id, dropoff, pickup):
+    """Peak concurrent bags already booked at a stashpoint during the window"""
+    peak = peak_occupancy_subquery(dropoff, pickup, [stashpoint_id])
+    return db.session.execute(select(peak.c.peak)).scalar() or 0
+
+
+def create_booking(customer_id, stashpoint_id, dropoff, pickup, bag_count, now=None):
+    """Create and commit a booking if the stashpoint has room for it"""
+    now = now or datetime.utcnow()
+    if dropoff < now:
+        raise BookingValidationError("'dropoff' must not be in the past")
+    try:
+        stashpoint = db.session.execute(
+            select(Stashpoint).where(Stashpoint.id == stashpoint_id).with_for_update()
+        ).scalar_one_or_none()
+        if stashpoint is None:
+            raise NotFoundError("Stashpoint not found")
+        if db.session.get(Customer, customer_id) is None:
+            raise NotFoundError("Customer not found")
+        if not is_open_for(stashpoint, dropoff, pickup):
+            raise BookingValidationError(
+                "Stashpoint is closed at the requested dropoff or pickup time"
+            )
+
+        available = stashpoint.capacity - peak_booked_bags(
+            stashpoint_id, dropoff, pickup
+        )
+        if available < bag_count:
+            raise CapacityError(
+                f"Only {max(available, 0)} bags can be stored during this window"
+            )
+
+        booking = Booking(
+            customer_id=customer_id,
+            stashpoint_id=stashpoint_id,
+            dropoff_time=dropoff,
+            pickup_time=pickup,
+            bag_count=bag_count,
+        )
+        db.session.add(booking)
+        db.session.commit()
+    except Exception:
+        # Release the stashpoint lock on every failure path
+        db.session.rollback()
+        raise
+    return booking
+
+
+def cancel_booking(booking_id, now=None):
+    """Cancel a booking before its dropoff, freeing its capacity
+
+    The booking row is locked, so a concurrent check-in or cancellation
+    waits for this one to commit.
+    """
+    now = now or datetime.utcnow()
+    try:
+        booking = db.session.execute(
+            select(Booking).where(Booking.id == booking_id).with_for_update()
+        ).scalar_one_or_none()
+        if booking is None:
+            raise NotFoundError("Booking not found")
+        if booking.checked_in:
+            raise BookingValidationError("Checked-in bookings cannot be cancelled")
+        if booking.dropoff_time <= now:
+            raise BookingValidationError(
+                "Bookings cannot be cancelled once their dropoff time has passed"
+            )
+        booking.is_cancelled = True
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return booking
@@ -0,0 +1,357 @@
+"""Offline availability and distance engine for nightly jobs
+
+Utilization reports, the occupancy bucket backfill and the pricing inputs
+need the booked bags of every stashpoint for every hour of a long horizon,
+far more than the request path can afford. This engine computes them in
+bulk with NumPy instead:
+
+- bookings overlapping the horizon are streamed from a server-side cursor
+  in chunks, already reduced by Postgres to (stashpoint index, first hour,
+  end hour, bags) integers;
+- each chunk adds +bags at its first hour and -bags at its end hour of a
+  (stashpoints x hours) difference array, and one cumulative sum along
+  the hours turns that into hourly occupancy;
+- buckets are corrected in stashpoint_occupancy: the difference between
+  the computed and the stored buckets, both read from one snapshot, is
+  sent with COPY as one integer[] of hours per stashpoint, expanded into
+  rows by Postgres and added to the current buckets.
+
+Nothing locks the buckets. Bookings committed after the snapshot were
+upserted by their own transactions and are left as they are, since the
+correction only adds to whatever is there when it is written.
+
+Hours follow booking_hours() in app/services/occupancy.py, so the backfill
+matches what the ORM events maintain incrementally.
+
+haversine_matrix computes distances between stashpoints and demand points
+(e.g. searched locations) in blocks, for coverage reports.
+"""
+
+import io
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import Integer, cast, delete, func, select, text
+from app import db
+from app.models import Booking, Stashpoint, StashpointOccupancy
+from app.services.geo_index import EARTH_RADIUS_KM
+from app.services.occupancy import floor_hour
+
+DEFAULT_HORIZON_DAYS = 90
+DEFAULT_CHUNK_ROWS = 500_000
+# Stashpoints per COPY; a row holds the booked bags of every hour
+COPY_CHUNK_ROWS = 1_000
+# Bounds the (demand points x stashpoints) block of a distance matrix
+DISTANCE_BLOCK_CELLS = 8_000_000
+
+STAGING_TABLE = "occupancy_staging"
+
+CREATE_STAGING = text(
+    f"""
+    CREATE TEMPORARY TABLE {STAGING_TABLE} (
+        stashpoint_id varchar NOT NULL,
+        booked integer[] NOT NULL
+    ) ON COMMIT DROP
+    """
+)
+
+# One correction per hour that needs one, added to the current bucket;
+# ordinality 1 is the first hour of the horizon. Rows are upserted in the
+# order apply_occupancy_deltas locks them, so the two cannot deadlock
+EXPAND_STAGING = text(
+    f"""
+    INSERT INTO stashpoint_occupancy AS o (stashpoint_id, hour, booked)
+    SELECT s.stashpoint_id,
+        CAST(:start AS timestamp) + interval '1 hour' * (h.ordinality - 1),
+        h.booked
+    FROM {STAGING_TABLE} s
+    CROSS JOIN LATERAL unnest(s.booked) WITH ORDINALITY AS h(booked, ordinality)
+    WHERE h.booked <> 0
+    ORDER BY s.stashpoint_id COLLATE "C", h.ordinality
+    ON CONFLICT (stashpoint_id, hour)
+    DO UPDATE SET booked = o.booked + EXCLUDED.booked
+    """
+)
+
+
+@dataclass
+class HourlyOccupancy:
+    """Booked bags per stashpoint (rows) and hour (columns) of a horizon"""
+
+    start: datetime
+    stashpoint_ids: list
+    capacity: np.ndarray
+    booked: np.ndarray
+    bookings: int = 0
+    # Buckets stored for the horizon in the same snapshot, if read
+    stored: np.ndarray = None
+
+    @property
+    def hours(self):
+        return self.booked.shape[1]
+
+    def available(self):
+        """Capacity left per stashpoint and hour, never below zero"""
+        return np.maximum(self.capacity[:, None] - self.booked, 0)
+
+    def utilization(self):
+        """Per stashpoint (peak booked, mean utilization, hours full)"""
+        capacity = np.maximum(self.capacity, 1)[:, None]
+        return (
+            self.booked.max(axis=1, initial=0),
+            (self.booked / capacity).mean(axis=1),
+            (self.booked >= capacity).sum(axis=1),
+        )
+
+
+def horizon_start(moment=None):
+    """Midnight starting the horizon containing moment (default: today)"""
+    moment = moment or datetime.utcnow()
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _hour_offset(moment, start, rounding):
+    """Whole hours from start to moment, rounded down or up, in SQL"""
+    hours = func.extract("epoch", moment - start) / 3600
+    return cast(rounding(hours), Integer)
+
+
+def _stashpoint_positions():
+    return select(
+        Stashpoint.id,
+        (func.row_number().over(order_by=Stashpoint.id) - 1).label("position"),
+    ).subquery("stashpoint_positions")
+
+
+def build_booking_hours_statement(start, end):
+    """(stashpoint index, first hour, end hour, bags) of bookings in range
+
+    Stashpoint indexes are positions in id order, matching the rows of
+    load_stashpoints. End hours are exclusive. Both are relative to start
+    and not yet clipped to the horizon.
+    """
+    stashpoints = _stashpoint_positions()
+    return (
+        select(
+            stashpoints.c.position,
+            _hour_offset(Booking.dropoff_time, start, func.floor),
+            _hour_offset(Booking.pickup_time, start, func.ceil),
+            Booking.bag_count,
+        )
+        .join(stashpoints, stashpoints.c.id == Booking.stashpoint_id)
+        .where(
+            Booking.is_cancelled.is_(False),
+            Booking.pickup_time > Booking.dropoff_time,
+            Booking.dropoff_time < end,
+            Booking.pickup_time > start,
+        )
+    )
+
+
+def build_stored_buckets_statement(start, end):
+    """(stashpoint index, hour, booked) of the buckets stored in range"""
+    stashpoints = _stashpoint_positions()
+    return (
+        select(
+            stashpoints.c.position,
+            _hour_offset(StashpointOccupancy.hour, start, func.floor),
+            StashpointOccupancy.booked,
+        )
+        .join(stashpoints, stashpoints.c.id == StashpointOccupancy.stashpoint_id)
+        .where(StashpointOccupancy.hour >= start, StashpointOccupancy.hour < end)
+    )
+
+
+def load_stashpoints():
+    """(ids, capacities) of every stashpoint, in id order"""
+    rows = db.session.execute(
+        select(Stashpoint.id, Stashpoint.capacity).order_by(Stashpoint.id)
+    ).all()
+    ids = [row.id for row in rows]
+    return ids, np.fromiter((row.capacity for row in rows), np.int32, len(rows))
+
+
+def stream_booking_chunks(start, end, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield (count, 4) int64 arrays of booking hours from a server-side cursor"""
+    statement = build_booking_hours_statement(start, end).execution_options(
+        yield_per=chunk_rows
+    )
+    for rows in db.session.execute(statement).tuples().partitions():
+        yield np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+
+def load_stored_buckets(stashpoints, start, hours, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """(stashpoints, hours) array of the booked bags stored in the buckets"""
+    stored = np.zeros((stashpoints, hours), dtype=np.int32)
+    statement = build_stored_buckets_statement(
+        start, start + timedelta(hours=hours)
+    ).execution_options(yield_per=chunk_rows)
+    for rows in db.session.execute(statement).tuples().partitions():
+        position, hour, booked = np.array(rows, dtype=np.int64).reshape(-1, 3).T
+        stored[position, hour] = booked
+    return stored
+
+
+def add_bookings(diff, chunk):
+    """Add a chunk of booking hours to a (stashpoints, hours + 1) diff array"""
+    hours = diff.shape[1] - 1
+    position, first, end, bags = chunk.T
+    first = np.clip(first, 0, hours)
+    end = np.clip(end, 0, hours)
+    bags = bags.astype(diff.dtype)
+    np.add.at(diff, (position, first), bags)
+    np.add.at(diff, (position, end), -bags)
+
+
+def compute_hourly_occupancy(
+    start,
+    days=DEFAULT_HORIZON_DAYS,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+    progress=None,
+    stored=False,
+):
+    """Booked bags of every stashpoint for every hour of days from start
+
+    Everything is read from one REPEATABLE READ snapshot, in a transaction
+    of its own that is closed before returning, so the session must not
+    be in a transaction yet. progress, if given, is called with the
+    bookings read so far after each chunk. Set stored to also read the
+    buckets stored for the horizon, which write_occupancy needs.
+    """
+    if db.session.in_transaction():
+        raise ValueError(
+            "compute_hourly_occupancy reads in a transaction of its own; "
+            "commit or roll back the session first"
+        )
+    start = floor_hour(start)
+    end = start + timedelta(days=days)
+    hours = days * 24
+    db.session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    try:
+        ids, capacity = load_stashpoints()
+        diff = np.zeros((len(ids), hours + 1), dtype=np.int32)
+        bookings = 0
+        for chunk in stream_booking_chunks(start, end, chunk_rows):
+            add_bookings(diff, chunk)
+            bookings += len(chunk)
+            if progress is not None:
+                progress(bookings)
+        occupancy = HourlyOccupancy(
+            start,
+            ids,
+            capacity,
+            np.cumsum(diff[:, :hours], axis=1, dtype=np.int32),
+            bookings,
+        )
+        if stored:
+            occupancy.stored = load_stored_buckets(len(ids), start, hours, chunk_rows)
+    finally:
+        db.session.rollback()
+    return occupancy
+
+
+def _staging_lines(stashpoint_ids, counts):
+    """Yield COPY text lines of (stashpoint id, counts array) per stashpoint
+
+    Stashpoints whose counts are all zero are left out. Counts, negative
+    ones included, are formatted by looking up their text, one array per
+    row, never one bucket at a time.
+    """
+    lowest = min(int(counts.min(initial=0)), 0)
+    numbers = np.array(
+        [str(count) for count in range(lowest, int(counts.max(initial=0)) + 1)],
+        dtype=object,
+    )
+    for position in np.flatnonzero(counts.any(axis=1)).tolist():
+        hours = ",".join(numbers[counts[position] - lowest].tolist())
+        yield f"{stashpoint_ids[position]}\t{{{hours}}}\n"
+
+
+def write_occupancy(occupancy):
+    """Correct the buckets of the horizon; returns buckets corrected
+
+    occupancy must be computed with stored=True. The caller owns the
+    transaction. Booking writes only wait for the buckets this corrects,
+    from the moment it corrects them until the caller commits.
+    """
+    if occupancy.stored is None:
+        raise ValueError("compute the occupancy with stored=True to write it")
+    corrections = occupancy.booked - occupancy.stored
+    db.session.execute(CREATE_STAGING)
+    cursor = db.session.connection().connection.cursor()
+    statement = f"COPY {STAGING_TABLE} (stashpoint_id, booked) FROM STDIN"
+    buffer = io.StringIO()
+    lines = _staging_lines(occupancy.stashpoint_ids, corrections)
+    for count, line in enumerate(lines, 1):
+        buffer.write(line)
+        if count % COPY_CHUNK_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    total = db.session.execute(EXPAND_STAGING, {"start": occupancy.start}).rowcount
+    db.session.execute(text(f"DROP TABLE {STAGING_TABLE}"))
+    end = occupancy.start + timedelta(hours=occupancy.hours)
+    db.session.execute(
+        delete(StashpointOccupancy).where(
+            StashpointOccupancy.hour >= occupancy.start,
+            StashpointOccupancy.hour < end,
+            StashpointOccupancy.booked == 0,
+        )
+    )
+    return total
+
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    """Great-circle distances in km between every pair of two point sets
+
+    Same formula as geo_index.haversine_km; returns a (len(lat1), len(lat2))
+    float64 array.
+    """
+    lat1, lng1 = np.radians(lat1)[:, None], np.radians(lng1)[:, None]
+    lat2, lng2 = np.radians(lat2)[None, :], np.radians(lng2)[None, :]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearest_stashpoints(demand_lat, demand_lng, radius_km):
+    """For every demand point: (nearest stashpoint id, its distance in km,
+    stashpoints within radius_km)
+
+    Distances are computed in blocks of demand points, so memory stays
+    bounded by DISTANCE_BLOCK_CELLS whatever the number of points.
+    """
+    rows = db.session.execute(
+        select(Stashpoint.id, Stashpoint.latitude, Stashpoint.longitude).order_by(
+            Stashpoint.id
+        )
+    ).all()
+    ids = np.array([row.id for row in rows], dtype=object)
+    lat = np.array([row.latitude for row in rows], dtype=np.float64)
+    lng = np.array([row.longitude for row in rows], dtype=np.float64)
+    demand_lat = np.asarray(demand_lat, dtype=np.float64)
+    demand_lng = np.asarray(demand_lng, dtype=np.float64)
+
+    count = len(demand_lat)
+    nearest = np.empty(count, dtype=object)
+    distance = np.full(count, np.inf)
+    within = np.zeros(count, dtype=np.int64)
+    if not len(ids):
+        return nearest, distance, within
+    block = max(1, DISTANCE_BLOCK_CELLS // len(ids))
+    for first in range(0, count, block):
+        last = min(count, first + block)
+        matrix = haversine_matrix(
+            demand_lat[first:last], demand_lng[first:last], lat, lng
+        )
+        closest = matrix.argmin(axis=1)
+        nearest[first:last] = ids[closest]
+        distance[first:last] = matrix[np.arange(last - first), closest]
+        within[first:last] = (matrix <= radius_km).sum(axis=1)
+    return nearest, distance, within
@@ -0,0 +1,152 @@
+"""Availability calendars: available capacity per time slot
+
+A calendar splits [start, end) into fixed slots and reports, for each, the
+bags a stashpoint can still take for the whole slot. It is built from one
+query returning the stashpoints and their bookings overlapping the range:
+each booking adds its bags at its first slot and removes them after its
+last one in a difference array, and a prefix sum turns that into booked
+bags per slot. A slot is reported as closed (null) unless the stashpoint is
+open for all of it: 30 and 60-minute slots are open only if every
+15-minute slot of the schedule they cover is open, since bags could not be
+left for the whole slot otherwise.
+
+Timelines are run-length encoded as [slot_count, available] pairs, so a
+30-day hourly calendar of a quiet stashpoint is a handful of pairs.
+"""
+
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import and_, select
+from app import db
+from app.models import Booking, Stashpoint
+from app.services.schedule import is_scheduled_open_during
+from app.services.search import SearchValidationError, parse_datetime
+
+INTERVAL_MINUTES = (15, 30, 60)
+DEFAULT_CALENDAR_DAYS = 7
+MAX_CALENDAR_DAYS = 62
+MAX_CALENDAR_STASHPOINTS = 50
+
+
+class CalendarValidationError(ValueError):
+    """Raised when calendar query parameters are missing or invalid"""
+
+
+def parse_calendar_args(args):
+    """Return (start, end, interval_minutes) from the query string"""
+    try:
+        interval = int(args.get("interval", 60))
+    except ValueError:
+        raise CalendarValidationError("'interval' must be a valid int")
+    if interval not in INTERVAL_MINUTES:
+        raise CalendarValidationError(
+            f"'interval' must be one of {', '.join(map(str, INTERVAL_MINUTES))}"
+        )
+
+    try:
+        if args.get("start"):
+            start = parse_datetime(args["start"], "start")
+        else:
+            start = datetime.utcnow().replace(hour=0, minute=0)
+        end = (
+            parse_datetime(args["end"], "end")
+            if args.get("end")
+            else start + timedelta(days=DEFAULT_CALENDAR_DAYS)
+        )
+    except SearchValidationError as e:
+        raise CalendarValidationError(str(e))
+
+    # Slots are aligned on the interval
+    start = start.replace(
+        minute=start.minute - start.minute % interval, second=0, microsecond=0
+    )
+    if end <= start:
+        raise CalendarValidationError("'end' must be after 'start'")
+    if end - start > timedelta(days=MAX_CALENDAR_DAYS):
+        raise CalendarValidationError(
+            f"Calendars span at most {MAX_CALENDAR_DAYS} days"
+        )
+    return start, end, interval
+
+
+def run_length_encode(values):
+    """Encode a sequence as [run_length, value] pairs"""
+    runs = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+
+def build_calendar_statement(stashpoint_ids, start, end):
+    """Stashpoints with each of their bookings overlapping [start, end)"""
+    return (
+        select(
+            Stashpoint.id,
+            Stashpoint.capacity,
+            Stashpoint.weekly_schedule,
+            Booking.dropoff_time,
+            Booking.pickup_time,
+            Booking.bag_count,
+        )
+        .outerjoin(
+            Booking,
+            and_(
+                Booking.stashpoint_id == Stashpoint.id,
+                Booking.is_cancelled.is_(False),
+                Booking.dropoff_time < end,
+                Booking.pickup_time > start,
+            ),
+        )
+        .where(Stashpoint.id.in_(stashpoint_ids))
+    )
+
+
+def availability_calendars(stashpoint_ids, start, end, interval_minutes):
+    """Run-length encoded availability timelines keyed by stashpoint id"""
+    rows = db.session.execute(build_calendar_statement(stashpoint_ids, start, end))
+    return calendars_from_rows(rows, start, end, interval_minutes)
+
+
+def calendars_from_rows(rows, start, end, interval_minutes):
+    """Build the timelines from the rows of build_calendar_statement"""
+    step = timedelta(minutes=interval_minutes)
+    slot_count = -(-(end - start) // step)
+    slot_starts = [start + step * i for i in range(slot_count)]
+
+    stashpoints = {}
+    differences = {}
+    for row in rows:
+        if row.id not in stashpoints:
+            stashpoints[row.id] = row
+            differences[row.id] = [0] * (slot_count + 1)
+        if row.dropoff_time is None:
+            continue
+        # A booking holds every slot it touches
+        first = max(0, (row.dropoff_time - start) // step)
+        last = min(slot_count, -(-(row.pickup_time - start) // step))
+        diff = differences[row.id]
+        diff[first] += row.bag_count
+        diff[last] -= row.bag_count
+
+    calendars = {}
+    for stashpoint_id, stashpoint in stashpoints.items():
+        booked = accumulate(differences[stashpoint_id][:slot_count])
+        schedule = stashpoint.weekly_schedule
+        available = (
+            max(0, stashpoint.capacity - bags)
+            if is_scheduled_open_during(schedule, slot_start, interval_minutes)
+            else None
+            for slot_start, bags in zip(slot_starts, booked)
+        )
+        calendars[stashpoint_id] = {
+            "stashpoint_id": stashpoint_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "interval_minutes": interval_minutes,
+            "capacity": stashpoint.capacity,
+            "available": run_length_encode(available),
+        }
+    return calendars
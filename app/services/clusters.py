@@ -0,0 +1,232 @@
+"""Server-side clustering of stashpoints for map tiles
+
+Maps ask for clusters per Web Mercator tile (z/x/y, as in slippy maps) or
+for a viewport bounding box at a zoom level, which is widened to the tiles
+it touches. Each tile is divided into a fixed GRID_CELLS_PER_TILE square
+grid and the stashpoints of a cell are merged into one cluster with
+ST_SnapToGrid, so a tile never returns more than GRID_CELLS_PER_TILE ** 2
+clusters however many stashpoints it holds. Cells are aligned with tile
+edges, so a viewport answer is exactly the union of its tiles and tile
+responses can be cached by URL.
+
+Each cluster reports its stashpoint count, centroid, total capacity and
+the capacity available over a window (the current hour by default),
+counting closed stashpoints as having none. Stashpoints are filtered with
+the GiST index on their Web Mercator location.
+"""
+
+import math
+from datetime import timedelta
+from sqlalchemy import and_, case, func, select
+from app import db
+from app.models import Stashpoint
+from app.models.stashpoint import WEB_MERCATOR_SRID, web_mercator
+from app.services.occupancy import floor_hour
+from app.services.search import (
+    SearchValidationError,
+    is_open_at,
+    parse_datetime,
+    peak_subquery,
+)
+
+EARTH_RADIUS_M = 6378137.0
+# Half the width of the Web Mercator square, the x of longitude 180
+WORLD_EXTENT_M = math.pi * EARTH_RADIUS_M
+MAX_LATITUDE = 85.0511287798
+MAX_CLUSTER_ZOOM = 20
+GRID_CELLS_PER_TILE = 8
+MAX_VIEWPORT_TILES = 16
+
+
+class ClusterValidationError(ValueError):
+    """Raised when cluster query parameters are missing or invalid"""
+
+
+def mercator_location():
+    """Web Mercator point of a stashpoint, the expression of its GiST index"""
+    return web_mercator(Stashpoint.location)
+
+
+def tile_size_m(zoom):
+    return 2 * WORLD_EXTENT_M / 2**zoom
+
+
+def tile_bounds(zoom, x, y):
+    """(xmin, ymin, xmax, ymax) of a tile in Web Mercator meters"""
+    size = tile_size_m(zoom)
+    xmin = -WORLD_EXTENT_M + x * size
+    ymax = WORLD_EXTENT_M - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def to_mercator(lng, lat):
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = math.radians(lng) * EARTH_RADIUS_M
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTH_RADIUS_M
+    return x, y
+
+
+def to_lnglat(x, y):
+    lng = math.degrees(x / EARTH_RADIUS_M)
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS_M)) - math.pi / 2)
+    return lng, lat
+
+
+def covering_tiles(bbox, zoom):
+    """((x_first, x_last), (y_first, y_last)) of the tiles a bbox touches"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    size = tile_size_m(zoom)
+    last = 2**zoom - 1
+
+    def tile_index(meters):
+        return max(0, min(last, math.floor(meters / size)))
+
+    xmin, ymin = to_mercator(min_lng, min_lat)
+    xmax, ymax = to_mercator(max_lng, max_lat)
+    xs = tile_index(xmin + WORLD_EXTENT_M), tile_index(xmax + WORLD_EXTENT_M)
+    ys = tile_index(WORLD_EXTENT_M - ymax), tile_index(WORLD_EXTENT_M - ymin)
+    return xs, ys
+
+
+def _parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ClusterValidationError("'zoom' must be a valid int")
+    if not 0 <= zoom <= MAX_CLUSTER_ZOOM:
+        raise ClusterValidationError(
+            f"'zoom' must be between 0 and {MAX_CLUSTER_ZOOM}"
+        )
+    return zoom
+
+
+def parse_window_args(args, now):
+    """(dropoff, pickup) to report available capacity for
+
+    Defaults to the hour containing now, so responses stay cacheable.
+    """
+    dropoff, pickup = args.get("dropoff"), args.get("pickup")
+    if dropoff is None and pickup is None:
+        start = floor_hour(now)
+        return start, start + timedelta(hours=1)
+    if dropoff is None or pickup is None:
+        raise ClusterValidationError("'dropoff' and 'pickup' go together")
+    try:
+        dropoff = parse_datetime(dropoff, "dropoff")
+        pickup = parse_datetime(pickup, "pickup")
+    except SearchValidationError as e:
+        raise ClusterValidationError(str(e))
+    if pickup <= dropoff:
+        raise ClusterValidationError("'pickup' must be after 'dropoff'")
+    return dropoff, pickup
+
+
+def parse_tile(zoom, x, y):
+    """Validate tile coordinates into Web Mercator bounds"""
+    zoom = _parse_zoom(zoom)
+    if not (0 <= x < 2**zoom and 0 <= y < 2**zoom):
+        raise ClusterValidationError(f"Tile {zoom}/{x}/{y} does not exist")
+    return zoom, tile_bounds(zoom, x, y)
+
+
+def parse_viewport_args(args):
+    """Validate bbox and zoom into (zoom, tile-aligned Web Mercator bounds)"""
+    zoom = _parse_zoom(args.get("zoom"))
+    try:
+        bbox = [float(value) for value in args.get("bbox", "").split(",")]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4:
+        raise ClusterValidationError(
+            "'bbox' must be min_lng,min_lat,max_lng,max_lat"
+        )
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ClusterValidationError("'bbox' is not a valid bounding box")
+
+    (x_first, x_last), (y_first, y_last) = covering_tiles(bbox, zoom)
+    if (x_last - x_first + 1) * (y_last - y_first + 1) > MAX_VIEWPORT_TILES:
+        raise ClusterValidationError(
+            f"'bbox' covers more than {MAX_VIEWPORT_TILES} tiles at this zoom"
+        )
+    xmin, _, _, ymax = tile_bounds(zoom, x_first, y_first)
+    _, ymin, xmax, _ = tile_bounds(zoom, x_last, y_last)
+    return zoom, (xmin, ymin, xmax, ymax)
+
+
+def bounds_bbox(bounds):
+    """[min_lng, min_lat, max_lng, max_lat] of Web Mercator bounds"""
+    xmin, ymin, xmax, ymax = bounds
+    return [*to_lnglat(xmin, ymin), *to_lnglat(xmax, ymax)]
+
+
+def build_cluster_statement(bounds, zoom, dropoff, pickup):
+    """Clusters of the stashpoints within tile-aligned bounds at a zoom"""
+    xmin, ymin, xmax, ymax = bounds
+    cell = tile_size_m(zoom) / GRID_CELLS_PER_TILE
+    point = mercator_location()
+    # Half-open like the tile indexes of covering_tiles, so a stashpoint on
+    # a tile edge belongs to one tile only
+    envelope = func.ST_MakeEnvelope(xmin, ymin, xmax, ymax, WEB_MERCATOR_SRID)
+    in_bounds = (
+        point.op("&&")(envelope),
+        func.ST_X(point) >= xmin,
+        func.ST_X(point) < xmax,
+        func.ST_Y(point) > ymin,
+        func.ST_Y(point) <= ymax,
+    )
+    peak = peak_subquery(dropoff, pickup, select(Stashpoint.id).where(*in_bounds))
+    available = case(
+        (
+            and_(is_open_at(dropoff), is_open_at(pickup)),
+            func.greatest(Stashpoint.capacity - func.coalesce(peak.c.peak, 0), 0),
+        ),
+        else_=0,
+    )
+    # Grid points offset by half a cell, so cells start on tile edges
+    snapped = func.ST_SnapToGrid(point, cell / 2, cell / 2, cell, cell)
+    located = (
+        select(
+            Stashpoint.id,
+            Stashpoint.latitude,
+            Stashpoint.longitude,
+            Stashpoint.capacity,
+            available.label("available"),
+            func.ST_X(snapped).label("cell_x"),
+            func.ST_Y(snapped).label("cell_y"),
+        )
+        .outerjoin(peak, peak.c.stashpoint_id == Stashpoint.id)
+        .where(*in_bounds)
+        .subquery("located_stashpoints")
+    )
+    count = func.count().label("count")
+    return (
+        select(
+            count,
+            func.avg(located.c.latitude).label("latitude"),
+            func.avg(located.c.longitude).label("longitude"),
+            func.sum(located.c.capacity).label("capacity"),
+            func.sum(located.c.available).label("available_capacity"),
+            func.min(located.c.id).label("stashpoint_id"),
+        )
+        .group_by(located.c.cell_x, located.c.cell_y)
+        .order_by(count.desc(), func.min(located.c.id))
+    )
+
+
+def cluster_dict(row):
+    """Response dict of a cluster; single stashpoints keep their id"""
+    return {
+        "count": row.count,
+        "latitude": round(row.latitude, 6),
+        "longitude": round(row.longitude, 6),
+        "capacity": int(row.capacity),
+        "available_capacity": int(row.available_capacity),
+        "stashpoint_id": row.stashpoint_id if row.count == 1 else None,
+    }
+
+
+def cluster_stashpoints(bounds, zoom, dropoff, pickup):
+    """Cluster dicts of the stashpoints within tile-aligned bounds"""
+    statement = build_cluster_statement(bounds, zoom, dropoff, pickup)
+    return [cluster_dict(row) for row in db.session.execute(statement)]
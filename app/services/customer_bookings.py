@@ -0,0 +1,134 @@
+"""Booking history of a customer, upcoming or past
+
+A page is one projected query: booking columns joined to a summary of their
+stashpoint, so a customer with thousands of bookings costs the same two
+statements per request (the customer lookup and the page) as one with a
+single booking. Pages are keyset paginated on (dropoff_time, id), served
+by the (customer_id, dropoff_time, id) indexes of bookings and
+bookings_archive.
+
+Upcoming bookings (pickup now or later) are all in bookings, oldest
+dropoff first. Past bookings are newest first and span both tables, as
+completed bookings are moved to bookings_archive; each table contributes
+at most a page of rows to a UNION ALL that is merged and cut to the page.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, tuple_, union_all
+from app import db
+from app.models import Booking, BookingArchive, Customer, Stashpoint
+from app.serializers import (
+    STASHPOINT_SUMMARY_COLUMNS,
+    booking_columns,
+    booking_with_stashpoint_dict,
+)
+from app.services.pagination import DROPOFF_KEY, PaginationError, parse_page_args
+
+DEFAULT_PAGE_SIZE = 50
+WHEN = ("upcoming", "past")
+STATUS_FILTERS = ("is_paid", "is_cancelled", "checked_in", "checked_out")
+TRUE_VALUES = ("1", "true")
+FALSE_VALUES = ("0", "false")
+
+
+class CustomerBookingsValidationError(ValueError):
+    """Raised when customer bookings query parameters are invalid"""
+
+
+@dataclass(frozen=True)
+class BookingFilters:
+    """Which bookings of a customer to list"""
+
+    when: str = "upcoming"
+    statuses: tuple = ()  # (column name, required value) pairs
+
+
+def _parse_bool(value, name):
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise CustomerBookingsValidationError(f"'{name}' must be true or false")
+
+
+def parse_customer_bookings_args(args):
+    """Return (filters, limit, after) from the query string
+
+    limit defaults to DEFAULT_PAGE_SIZE; after is None or the
+    (dropoff_time, id) key of the last booking of the previous page.
+    """
+    when = args.get("when", "upcoming")
+    if when not in WHEN:
+        raise CustomerBookingsValidationError(
+            f"'when' must be one of {', '.join(WHEN)}"
+        )
+    statuses = tuple(
+        (name, _parse_bool(args[name], name)) for name in STATUS_FILTERS if name in args
+    )
+    limit, after = parse_page_args(args, DROPOFF_KEY)
+    if after is not None:
+        dropoff_time, id = after
+        try:
+            after = (datetime.fromisoformat(dropoff_time), id)
+        except ValueError:
+            raise PaginationError("'cursor' does not belong to this listing")
+    return BookingFilters(when, statuses), limit or DEFAULT_PAGE_SIZE, after
+
+
+def _page_statement(model, customer_id, filters, now, after, limit):
+    """At most limit bookings of one table, in page order"""
+    statement = (
+        select(*booking_columns(model), *STASHPOINT_SUMMARY_COLUMNS)
+        .join(Stashpoint, Stashpoint.id == model.stashpoint_id)
+        .where(model.customer_id == customer_id)
+    )
+    for name, value in filters.statuses:
+        statement = statement.where(getattr(model, name).is_(value))
+    key = tuple_(model.dropoff_time, model.id)
+    if filters.when == "upcoming":
+        statement = statement.where(model.pickup_time >= now)
+        if after is not None:
+            statement = statement.where(key > tuple_(*after))
+        order = (model.dropoff_time, model.id)
+    else:
+        statement = statement.where(model.pickup_time < now)
+        if after is not None:
+            statement = statement.where(key < tuple_(*after))
+        order = (model.dropoff_time.desc(), model.id.desc())
+    return statement.order_by(*order).limit(limit)
+
+
+def build_customer_bookings_statement(customer_id, filters, now, after, limit):
+    """One page of a customer's bookings with their stashpoint summaries"""
+    if filters.when == "upcoming":
+        return _page_statement(Booking, customer_id, filters, now, after, limit)
+    merged = union_all(
+        *(
+            _page_statement(model, customer_id, filters, now, after, limit)
+            for model in (Booking, BookingArchive)
+        )
+    ).subquery("customer_bookings")
+    return (
+        select(merged)
+        .order_by(merged.c.dropoff_time.desc(), merged.c.id.desc())
+        .limit(limit)
+    )
+
+
+def customer_bookings(customer_id, filters, limit, after=None, now=None):
+    """List ((dropoff_time, id), result) pairs of a page of bookings
+
+    Fetches limit rows; ask for one more than the page size to know
+    whether there is a next page. Returns None if the customer does not
+    exist.
+    """
+    if db.session.get(Customer, customer_id) is None:
+        return None
+    statement = build_customer_bookings_statement(
+        customer_id, filters, now or datetime.utcnow(), after, limit
+    )
+    return [
+        ((row.dropoff_time.isoformat(), row.id), booking_with_stashpoint_dict(row))
+        for row in db.session.execute(statement)
+    ]
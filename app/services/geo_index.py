@@ -0,0 +1,222 @@
+"""In-process spatial index of stashpoints
+
+Radius lookups are the first step of every search. The index keeps the
+coordinates and the few columns needed to shortlist candidates in a grid of
+fixed-size lat/lng cells, so a lookup only visits the cells overlapping the
+search circle and never touches the database.
+
+The index is rebuilt from the stashpoints table at startup and every
+GEO_INDEX_REFRESH_SECONDS, which keeps workers eventually consistent with
+each other. Changes committed through this process's session are applied
+immediately.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+from sqlalchemy import event, select
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import Stashpoint
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Haversine distances can be about 0.5% off the spheroid distances of PostGIS
+SPHEROID_MARGIN = 1.01
+
+GeoEntry = namedtuple("GeoEntry", "id latitude longitude capacity weekly_schedule")
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two coordinates in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class StashpointGeoIndex:
+    """Grid of stashpoint entries answering radius queries"""
+
+    def __init__(self, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self.built_at = None
+        self._lng_cells = round(360 / cell_degrees)
+        self._entries = {}
+        self._cells = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees) % self._lng_cells,
+        )
+
+    def rebuild(self, entries):
+        """Replace the whole index with entries"""
+        index = {}
+        cells = defaultdict(set)
+        for entry in entries:
+            index[entry.id] = entry
+            cells[self._cell(entry.latitude, entry.longitude)].add(entry.id)
+        with self._lock:
+            self._entries = index
+            self._cells = cells
+            self.built_at = time.monotonic()
+
+    def upsert(self, entry):
+        """Add an entry or move an existing one"""
+        with self._lock:
+            self._discard(entry.id)
+            self._entries[entry.id] = entry
+            self._cells[self._cell(entry.latitude, entry.longitude)].add(entry.id)
+
+    def remove(self, stashpoint_id):
+        """Drop an entry if present"""
+        with self._lock:
+            self._discard(stashpoint_id)
+
+    def _discard(self, stashpoint_id):
+        entry = self._entries.pop(stashpoint_id, None)
+        if entry is not None:
+            cell = self._cell(entry.latitude, entry.longitude)
+            self._cells[cell].discard(stashpoint_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def _cells_within(self, latitude, longitude, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        lat_from = math.floor((latitude - lat_span) / self.cell_degrees)
+        lat_to = math.floor((latitude + lat_span) / self.cell_degrees)
+
+        # Longitude degrees shrink towards the poles
+        cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + lat_span)))
+        lng_span = radius_km / (KM_PER_DEGREE * cos_lat)
+        if lng_span >= 180:
+            lng_cells = range(self._lng_cells)
+        else:
+            lng_from = math.floor((longitude - lng_span) / self.cell_degrees)
+            lng_to = math.floor((longitude + lng_span) / self.cell_degrees)
+            lng_cells = [
+                cell % self._lng_cells for cell in range(lng_from, lng_to + 1)
+            ]
+
+        # A huge radius visits more cells than the index holds
+        if (lat_to - lat_from + 1) * len(lng_cells) > len(self._cells):
+            lng_cells = set(lng_cells)
+            return [
+                cell
+                for cell in self._cells
+                if lat_from <= cell[0] <= lat_to and cell[1] in lng_cells
+            ]
+        return [
+            (lat_cell, lng_cell)
+            for lat_cell in range(lat_from, lat_to + 1)
+            for lng_cell in lng_cells
+        ]
+
+    def within(self, latitude, longitude, radius_km):
+        """Return (distance_km, entry) pairs within radius_km, nearest first"""
+        with self._lock:
+            entries = self._entries
+            candidates = [
+                entries[stashpoint_id]
+                for cell in self._cells_within(latitude, longitude, radius_km)
+                for stashpoint_id in self._cells.get(cell, ())
+            ]
+
+        matches = []
+        for entry in candidates:
+            distance = haversine_km(
+                latitude, longitude, entry.latitude, entry.longitude
+            )
+            if distance <= radius_km:
+                matches.append((distance, entry))
+        matches.sort(key=lambda match: (match[0], match[1].id))
+        return matches
+
+
+geo_index = StashpointGeoIndex()
+
+GEO_ENTRY_COLUMNS = (
+    Stashpoint.id,
+    Stashpoint.latitude,
+    Stashpoint.longitude,
+    Stashpoint.capacity,
+    Stashpoint.weekly_schedule,
+)
+
+
+def load_geo_entries():
+    """Read the indexed columns of every stashpoint"""
+    rows = db.session.execute(select(*GEO_ENTRY_COLUMNS))
+    return [GeoEntry(*row) for row in rows]
+
+
+def refresh_geo_index(max_age):
+    """Rebuild the index when it was never built or is older than max_age"""
+    if geo_index.built_at is not None and (
+        time.monotonic() - geo_index.built_at < max_age
+    ):
+        return geo_index
+    geo_index.rebuild(load_geo_entries())
+    return geo_index
+
+
+def _entry_for(stashpoint):
+    return GeoEntry(
+        *(getattr(stashpoint, column.key) for column in GEO_ENTRY_COLUMNS)
+    )
+
+
+def _after_flush(session, flush_context):
+    changes = session.info.setdefault("geo_index_changes", {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Stashpoint):
+            changes[obj.id] = _entry_for(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Stashpoint):
+            changes[obj.id] = None
+
+
+def _after_commit(session):
+    changes = session.info.pop("geo_index_changes", None)
+    if not changes or geo_index.built_at is None:
+        return
+    for stashpoint_id, entry in changes.items():
+        if entry is None:
+            geo_index.remove(stashpoint_id)
+        else:
+            geo_index.upsert(entry)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop("geo_index_changes", None)
+
+
+def init_geo_index(app):
+    """Track stashpoint changes and build the index if the app enables it"""
+    if not app.config.get("GEO_INDEX_ENABLED"):
+        return
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_soft_rollback", _after_rollback)
+
+    with app.app_context():
+        try:
+            refresh_geo_index(max_age=0)
+        except SQLAlchemyError:
+            # The first search builds it once the database is reachable
+            logger.warning("Could not build the geo index at startup", exc_info=True)
+        finally:
+            db.session.remove()
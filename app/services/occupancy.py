@@ -0,0 +1,196 @@
+"""Hourly occupancy buckets maintained alongside bookings
+
+Each stashpoint_occupancy row holds the bags booked at a stashpoint during
+one hour. A booking counts towards every hour it touches, so MAX(booked)
+over the hours of a window never undercounts the peak occupancy and can be
+read from a handful of rows instead of scanning the bookings history.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import delete, event, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert
+from app import db
+from app.models import Booking, StashpointOccupancy
+
+HOUR = timedelta(hours=1)
+
+# Booking attributes that change which buckets a booking counts towards
+TRACKED_ATTRIBUTES = (
+    "stashpoint_id",
+    "dropoff_time",
+    "pickup_time",
+    "bag_count",
+    "is_cancelled",
+)
+
+# The difference between the buckets the bookings imply and the buckets
+# stored, both read from the statement's snapshot, added to the current
+# buckets. Upserts of bookings committed meanwhile are kept: the correction
+# only adds to whatever they left. Rows are upserted in the order
+# apply_occupancy_deltas locks them (Python sorts ids like the C collation),
+# so the two cannot deadlock
+REBUILD_STATEMENT = text(
+    """
+    INSERT INTO stashpoint_occupancy AS o (stashpoint_id, hour, booked)
+    SELECT stashpoint_id, hour, SUM(booked)
+    FROM (
+        SELECT b.stashpoint_id, h.hour, b.bag_count AS booked
+        FROM bookings b
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('hour', b.dropoff_time),
+            b.pickup_time - interval '1 microsecond',
+            interval '1 hour'
+        ) AS h(hour)
+        WHERE NOT b.is_cancelled AND b.pickup_time > b.dropoff_time
+        UNION ALL
+        SELECT stashpoint_id, hour, -booked FROM stashpoint_occupancy
+    ) AS corrections
+    GROUP BY stashpoint_id, hour
+    HAVING SUM(booked) <> 0
+    ORDER BY stashpoint_id COLLATE "C", hour
+    ON CONFLICT (stashpoint_id, hour)
+    DO UPDATE SET booked = o.booked + EXCLUDED.booked
+    """
+)
+
+
+def floor_hour(moment):
+    """Truncate a datetime to the start of its hour"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def booking_hours(dropoff, pickup):
+    """Yield the start of every hour bucket touched by [dropoff, pickup)"""
+    hour = floor_hour(dropoff)
+    while hour < pickup:
+        yield hour
+        hour += HOUR
+
+
+def _add_contribution(deltas, values, sign):
+    stashpoint_id, dropoff, pickup, bag_count, is_cancelled = values
+    if is_cancelled or None in (stashpoint_id, dropoff, pickup, bag_count):
+        return
+    for hour in booking_hours(dropoff, pickup):
+        deltas[(stashpoint_id, hour)] += sign * bag_count
+
+
+def _current_values(booking):
+    return tuple(getattr(booking, name) for name in TRACKED_ATTRIBUTES)
+
+
+def _previous_values(booking):
+    attrs = inspect(booking).attrs
+    values = []
+    for name in TRACKED_ATTRIBUTES:
+        history = attrs[name].history
+        values.append(history.deleted[0] if history.deleted else getattr(booking, name))
+    return tuple(values)
+
+
+def occupancy_deltas(session):
+    """Bucket changes implied by the bookings pending in a flushing session"""
+    deltas = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            _add_contribution(deltas, _current_values(obj), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and session.is_modified(obj):
+            previous, current = _previous_values(obj), _current_values(obj)
+            if previous != current:
+                _add_contribution(deltas, previous, -1)
+                _add_contribution(deltas, current, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            _add_contribution(deltas, _previous_values(obj), -1)
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_occupancy_deltas(connection, deltas):
+    """Upsert bucket deltas, locking rows in a stable order"""
+    if not deltas:
+        return
+    table = StashpointOccupancy.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.stashpoint_id, table.c.hour],
+        set_={"booked": table.c.booked + statement.excluded.booked},
+    )
+    connection.execute(
+        statement,
+        [
+            {"stashpoint_id": stashpoint_id, "hour": hour, "booked": delta}
+            for (stashpoint_id, hour), delta in sorted(deltas.items())
+        ],
+    )
+
+
+def _after_flush(session, flush_context):
+    deltas = occupancy_deltas(session)
+    if deltas:
+        apply_occupancy_deltas(session.connection(), deltas)
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_occupancy_events():
+    """Keep the buckets in step with every flushed Booking change"""
+    if event.contains(db.session, "after_flush", _after_flush):
+        return
+    event.listen(db.session, "after_flush", _after_flush)
+    # Load previous values on set so history always carries the old buckets
+    for name in TRACKED_ATTRIBUTES:
+        event.listen(
+            getattr(Booking, name),
+            "set",
+            _track_previous_value,
+            active_history=True,
+            retval=True,
+        )
+
+
+def rebuild_occupancy():
+    """Correct every bucket from the bookings table; returns buckets changed
+
+    Used for backfills and after bulk loads that bypass the ORM. The caller
+    owns the transaction. Nothing locks the table: booking writes only wait
+    for the buckets this corrects, from the moment it corrects them until
+    the caller commits.
+    """
+    corrected = db.session.execute(REBUILD_STATEMENT).rowcount
+    db.session.execute(
+        delete(StashpointOccupancy).where(StashpointOccupancy.booked == 0)
+    )
+    return corrected
+
+
+def bucket_peak(intervals, dropoff, pickup):
+    """Python twin of bucket_peak_subquery over (start, end, bags) intervals"""
+    booked = defaultdict(int)
+    first = floor_hour(dropoff)
+    for start, end, bags in intervals:
+        for hour in booking_hours(start, end):
+            if first <= hour < pickup:
+                booked[hour] += bags
+    return max(booked.values(), default=0)
+
+
+def bucket_peak_subquery(dropoff, pickup, stashpoint_ids=None):
+    """Peak booked bags per stashpoint read from the hourly buckets"""
+    statement = select(
+        StashpointOccupancy.stashpoint_id.label("stashpoint_id"),
+        func.max(StashpointOccupancy.booked).label("peak"),
+    ).where(
+        StashpointOccupancy.hour >= floor_hour(dropoff),
+        StashpointOccupancy.hour < pickup,
+    )
+    if stashpoint_ids is not None:
+        statement = statement.where(
+            StashpointOccupancy.stashpoint_id.in_(stashpoint_ids)
+        )
+    return statement.group_by(StashpointOccupancy.stashpoint_id).subquery(
+        "peak_occupancy"
+    )
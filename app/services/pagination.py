@@ -0,0 +1,100 @@
+"""Keyset pagination and streaming helpers
+
+Pages are addressed by an opaque cursor wrapping the sort key of the last
+row served, so fetching page n costs the same as fetching page 1.
+"""
+
+import base64
+import binascii
+import json
+import math
+from flask import current_app
+
+DEFAULT_STREAM_BATCH_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+# Types of the sort key values of each listing; float also accepts ints
+ID_KEY = (str,)
+SEARCH_KEY = (float, str)
+VERSION_KEY = (int, str)
+DROPOFF_KEY = (str, str)
+
+
+class PaginationError(ValueError):
+    """Raised when limit or cursor query parameters are invalid"""
+
+
+def encode_cursor(key):
+    """Wrap a sort key tuple into an opaque url-safe cursor"""
+    payload = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def _is_key_value(value, kind):
+    # JSON booleans decode as bools, which are ints to isinstance
+    if isinstance(value, bool):
+        return False
+    if kind is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, kind)
+
+
+def decode_cursor(token, key_types):
+    """Unwrap a cursor into a sort key tuple of values of key_types"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise PaginationError("'cursor' is malformed")
+    if (
+        not isinstance(key, list)
+        or len(key) != len(key_types)
+        or not all(map(_is_key_value, key, key_types))
+    ):
+        raise PaginationError("'cursor' does not belong to this listing")
+    return tuple(key)
+
+
+def parse_page_args(args, key_types):
+    """Return (limit, after) from the query string; both may be None"""
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError("'limit' must be a valid int")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise PaginationError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    cursor = args.get("cursor")
+    after = decode_cursor(cursor, key_types) if cursor else None
+    return limit, after
+
+
+def split_page(keyed_results, limit):
+    """Split (key, result) pairs fetched with limit + 1 into a page
+
+    Returns the results of the page and the cursor of the next page, which
+    is None on the last page.
+    """
+    keyed_results = list(keyed_results)
+    if limit is None or len(keyed_results) <= limit:
+        return [result for _, result in keyed_results], None
+    page = keyed_results[:limit]
+    return [result for _, result in page], encode_cursor(page[-1][0])
+
+
+def stream_json_array(results, batch_size=DEFAULT_STREAM_BATCH_SIZE):
+    """Encode results as a JSON array in chunks of batch_size items"""
+    dumps = current_app.json.dumps
+    yield "["
+    chunk = []
+    first = True
+    for result in results:
+        chunk.append(dumps(result))
+        if len(chunk) >= batch_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
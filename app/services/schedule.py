@@ -0,0 +1,118 @@
+"""Weekly opening schedules as bitmasks of 15-minute slots
+
+A schedule is a 672-character string of "0" and "1", one per 15-minute slot
+of the week starting Monday 00:00, stored in a BIT(672) column. It can
+express closed days, different hours per weekday and openings that run
+past midnight, and checking a moment is a single get_bit() in SQL.
+
+A stashpoint is open at a moment if the slot containing it is open, or if
+the moment is exactly when an open slot ends, so closing time itself
+counts as open like the original open_from/open_until check did. Times
+are matched against the naive UTC datetimes the API works with.
+"""
+
+from functools import lru_cache
+from sqlalchemy import func, or_
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def slot_of(moment):
+    """Index of the slot of the week containing moment"""
+    return moment.weekday() * SLOTS_PER_DAY + _minutes(moment) // SLOT_MINUTES
+
+
+def slots_at(moment):
+    """(slot containing moment, slot ending at moment or that same slot)"""
+    slot = slot_of(moment)
+    on_boundary = (
+        _minutes(moment) % SLOT_MINUTES == 0
+        and moment.second == 0
+        and moment.microsecond == 0
+    )
+    return slot, (slot - 1) % SLOTS_PER_WEEK if on_boundary else slot
+
+
+def daily_schedule(open_from, open_until):
+    """Schedule open every day from open_from to open_until"""
+    return weekly_schedule({day: [(open_from, open_until)] for day in range(7)})
+
+
+def weekly_schedule(hours):
+    """Schedule from {weekday: [(open_from, open_until), ...]}
+
+    Weekdays are 0 (Monday) to 6 or the names in WEEKDAYS; missing days
+    are closed. Slots partly inside a range count as open. A range whose
+    open_until is not after its open_from continues into the next day, so
+    equal times mean open around the clock.
+    """
+    slots = ["0"] * SLOTS_PER_WEEK
+    for weekday, ranges in hours.items():
+        if isinstance(weekday, str):
+            weekday = WEEKDAYS.index(weekday)
+        for open_from, open_until in ranges:
+            first = _minutes(open_from) // SLOT_MINUTES
+            last = -(-_minutes(open_until) // SLOT_MINUTES)
+            if last <= first:
+                last += SLOTS_PER_DAY
+            offset = weekday * SLOTS_PER_DAY
+            for slot in range(offset + first, offset + last):
+                slots[slot % SLOTS_PER_WEEK] = "1"
+    return "".join(slots)
+
+
+def is_scheduled_open_at(schedule, moment):
+    """Python twin of schedule_open_at"""
+    slot, previous = slots_at(moment)
+    return schedule[slot] == "1" or schedule[previous] == "1"
+
+
+def is_scheduled_open_during(schedule, moment, minutes=SLOT_MINUTES):
+    """True if every slot overlapping [moment, moment + minutes) is open"""
+    first = slot_of(moment)
+    count = -(-(_minutes(moment) % SLOT_MINUTES + minutes) // SLOT_MINUTES)
+    return all(
+        schedule[(first + offset) % SLOTS_PER_WEEK] == "1" for offset in range(count)
+    )
+
+
+def schedule_open_at(schedule, slots):
+    """SQL condition that a schedule is open at the slots of slots_at()"""
+    slot, previous = slots
+    return or_(
+        func.get_bit(schedule, slot) == 1, func.get_bit(schedule, previous) == 1
+    )
+
+
+@lru_cache(maxsize=1024)
+def opening_hours(schedule):
+    """{weekday name: [["HH:MM", "HH:MM"], ...]} of a schedule
+
+    Ranges are split at midnight; the end of a day is "24:00". Schedules
+    repeat across stashpoints, so the result is cached; do not mutate it.
+    """
+    hours = {}
+    for day, name in enumerate(WEEKDAYS):
+        day_slots = schedule[day * SLOTS_PER_DAY : (day + 1) * SLOTS_PER_DAY]
+        ranges = []
+        slot = day_slots.find("1")
+        while slot != -1:
+            end = day_slots.find("0", slot)
+            if end == -1:
+                end = SLOTS_PER_DAY
+            ranges.append([_hhmm(slot), _hhmm(end)])
+            slot = day_slots.find("1", end)
+        hours[name] = ranges
+    return hours
+
+
+def _hhmm(slot):
+    minutes = slot * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
@@ -0,0 +1,522 @@
+"""Availability search for stashpoints"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from flask import current_app
+from geoalchemy2.types import Geography
+from sqlalchemy import (
+    DateTime,
+    Float,
+    Integer,
+    and_,
+    cast,
+    column,
+    func,
+    select,
+    true,
+    tuple_,
+    text,
+    values,
+)
+from sqlalchemy.dialects import postgresql
+from app import db
+from app.models import Booking, Stashpoint
+from app.replicas import reads_from_primary
+from app.serializers import STASHPOINT_COLUMNS, stashpoint_dict
+from app.services.availability import (
+    correlated_peak_subquery,
+    peak_occupancy,
+    peak_occupancy_subquery,
+    windowed_peak_subquery,
+)
+from app.services.geo_index import SPHEROID_MARGIN, refresh_geo_index
+from app.services.occupancy import bucket_peak, bucket_peak_subquery
+from app.services.schedule import is_scheduled_open_at, schedule_open_at, slots_at
+
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 100.0
+MAX_BATCH_SEARCHES = 50
+DEFAULT_NEAREST_MAX_DISTANCE_KM = 50.0
+MAX_NEAREST = 50
+
+SEARCH_PARAMS = (
+    "lat",
+    "lng",
+    "dropoff",
+    "pickup",
+    "bag_count",
+    "radius_km",
+    "nearest",
+    "max_distance_km",
+)
+
+
+class SearchValidationError(ValueError):
+    """Raised when search query parameters are missing or invalid"""
+
+
+@dataclass(frozen=True)
+class SearchParams:
+    """Validated parameters of an availability search"""
+
+    lat: float
+    lng: float
+    dropoff: datetime
+    pickup: datetime
+    bag_count: int
+    radius_km: float = DEFAULT_RADIUS_KM
+
+
+def is_search_request(args):
+    """Return True if the query string asks for an availability search"""
+    return any(name in args for name in SEARCH_PARAMS)
+
+
+def parse_datetime(value, name):
+    """Parse an ISO 8601 datetime into a naive UTC datetime"""
+    try:
+        # datetime.fromisoformat does not accept the "Z" suffix before 3.11
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        raise SearchValidationError(f"'{name}' must be an ISO 8601 datetime")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_number(args, name, kind, required=True, default=None):
+    value = args.get(name)
+    if value is None or value == "":
+        if required:
+            raise SearchValidationError(f"'{name}' is required")
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise SearchValidationError(f"'{name}' must be a valid {kind.__name__}")
+
+
+def parse_search_params(args):
+    """Validate the query string of a search request into SearchParams"""
+    lat = _parse_number(args, "lat", float)
+    lng = _parse_number(args, "lng", float)
+    bag_count = _parse_number(args, "bag_count", int)
+    radius_km = _parse_number(
+        args, "radius_km", float, required=False, default=DEFAULT_RADIUS_KM
+    )
+
+    for name in ("dropoff", "pickup"):
+        if not args.get(name):
+            raise SearchValidationError(f"'{name}' is required")
+    dropoff = parse_datetime(args["dropoff"], "dropoff")
+    pickup = parse_datetime(args["pickup"], "pickup")
+
+    if not -90 <= lat <= 90:
+        raise SearchValidationError("'lat' must be between -90 and 90")
+    if not -180 <= lng <= 180:
+        raise SearchValidationError("'lng' must be between -180 and 180")
+    if bag_count < 1:
+        raise SearchValidationError("'bag_count' must be at least 1")
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise SearchValidationError(
+            f"'radius_km' must be greater than 0 and at most {MAX_RADIUS_KM:g}"
+        )
+    if pickup <= dropoff:
+        raise SearchValidationError("'pickup' must be after 'dropoff'")
+
+    return SearchParams(
+        lat=lat,
+        lng=lng,
+        dropoff=dropoff,
+        pickup=pickup,
+        bag_count=bag_count,
+        radius_km=radius_km,
+    )
+
+
+def parse_nearest_args(args):
+    """Return (k, max_distance_km) of a nearest-k search, or None"""
+    k = _parse_number(args, "nearest", int, required=False)
+    if k is None:
+        return None
+    max_distance_km = _parse_number(
+        args,
+        "max_distance_km",
+        float,
+        required=False,
+        default=DEFAULT_NEAREST_MAX_DISTANCE_KM,
+    )
+    if not 1 <= k <= MAX_NEAREST:
+        raise SearchValidationError(f"'nearest' must be between 1 and {MAX_NEAREST}")
+    if not 0 < max_distance_km <= MAX_RADIUS_KM:
+        raise SearchValidationError(
+            f"'max_distance_km' must be greater than 0 and at most {MAX_RADIUS_KM:g}"
+        )
+    return k, max_distance_km
+
+
+def parse_batch_search_params(data):
+    """Validate a batch body, {"searches": [...]} or a bare array, into SearchParams"""
+    searches = data.get("searches") if isinstance(data, dict) else data
+    if not isinstance(searches, list) or not searches:
+        raise SearchValidationError("'searches' must be a non-empty array")
+    if len(searches) > MAX_BATCH_SEARCHES:
+        raise SearchValidationError(
+            f"At most {MAX_BATCH_SEARCHES} searches can be batched"
+        )
+
+    params = []
+    for i, spec in enumerate(searches):
+        if not isinstance(spec, dict):
+            raise SearchValidationError(f"searches[{i}] must be an object")
+        try:
+            params.append(parse_search_params(spec))
+        except SearchValidationError as e:
+            raise SearchValidationError(f"searches[{i}]: {e}")
+    return params
+
+
+def search_point(lat, lng):
+    """Build a geography point expression for the given coordinates"""
+    return cast(func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326), Geography)
+
+
+def is_open_at(moment):
+    """SQL condition that a stashpoint's weekly schedule is open at moment"""
+    return schedule_open_at(Stashpoint.weekly_schedule, slots_at(moment))
+
+
+def peak_subquery(dropoff, pickup, stashpoint_ids):
+    """Peak occupancy per stashpoint from the configured availability source"""
+    if current_app.config.get("AVAILABILITY_SOURCE") == "occupancy":
+        return bucket_peak_subquery(dropoff, pickup, stashpoint_ids)
+    return peak_occupancy_subquery(dropoff, pickup, stashpoint_ids)
+
+
+def peak_booked(intervals, dropoff, pickup):
+    """Python twin of peak_subquery over (start, end, bags) intervals"""
+    if current_app.config.get("AVAILABILITY_SOURCE") == "occupancy":
+        return bucket_peak(intervals, dropoff, pickup)
+    return peak_occupancy(intervals, dropoff, pickup)
+
+
+def build_search_statement(params, candidate_ids=None, after=None):
+    """Build the single statement that answers an availability search
+
+    candidate_ids, when given, restricts the spatial filter to the ids
+    shortlisted by the in-process geo index. after is a (distance_m, id)
+    keyset cursor; only results sorting after it are returned.
+    """
+    point = search_point(params.lat, params.lng)
+    candidate_criteria = (
+        func.ST_DWithin(Stashpoint.location, point, params.radius_km * 1000),
+        is_open_at(params.dropoff),
+        is_open_at(params.pickup),
+    )
+    if candidate_ids is not None:
+        candidate_criteria += (Stashpoint.id.in_(candidate_ids),)
+    candidate_ids = select(Stashpoint.id).where(*candidate_criteria)
+    peak = peak_subquery(params.dropoff, params.pickup, candidate_ids)
+    distance = func.ST_Distance(Stashpoint.location, point).label("distance_m")
+    available = (Stashpoint.capacity - func.coalesce(peak.c.peak, 0)).label(
+        "available_capacity"
+    )
+
+    statement = (
+        select(*STASHPOINT_COLUMNS, distance, available)
+        .outerjoin(peak, peak.c.stashpoint_id == Stashpoint.id)
+        .where(*candidate_criteria, available >= params.bag_count)
+        .order_by(distance, Stashpoint.id)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(distance, Stashpoint.id) > tuple_(*after))
+    return statement
+
+
+def build_nearest_statement(params, k, max_distance_km):
+    """Build the statement of a nearest-k search
+
+    Stashpoints come off the GiST index in KNN order (<->), nearest first,
+    and availability is swept per stashpoint in a LATERAL subquery, so the
+    query stops once k available stashpoints are found or max_distance_km
+    is reached. params.radius_km is not used.
+    """
+    point = search_point(params.lat, params.lng)
+    peak = correlated_peak_subquery(Stashpoint.id, params.dropoff, params.pickup)
+    distance = func.ST_Distance(Stashpoint.location, point).label("distance_m")
+    available = (Stashpoint.capacity - peak.c.peak).label("available_capacity")
+    return (
+        select(*STASHPOINT_COLUMNS, distance, available)
+        .select_from(Stashpoint)
+        .join(peak, true())
+        .where(
+            func.ST_DWithin(Stashpoint.location, point, max_distance_km * 1000),
+            is_open_at(params.dropoff),
+            is_open_at(params.pickup),
+            # Cheap pre-check before sweeping the stashpoint's bookings
+            Stashpoint.capacity >= params.bag_count,
+            available >= params.bag_count,
+        )
+        .order_by(Stashpoint.location.op("<->")(point))
+        .limit(k)
+    )
+
+
+def search_result(row, distance_m=None, available_capacity=None):
+    """Response dict of a search row: the stashpoint, distance and capacity"""
+    result = stashpoint_dict(row)
+    if distance_m is None:
+        distance_m = row.distance_m
+    if available_capacity is None:
+        available_capacity = row.available_capacity
+    result["distance_km"] = round(distance_m / 1000, 3)
+    result["available_capacity"] = available_capacity
+    return result
+
+
+def shortlist_candidates(params):
+    """Ids near the search radius from the geo index, or None if disabled
+
+    The radius is widened by SPHEROID_MARGIN, so every stashpoint that
+    ST_DWithin keeps is shortlisted even where the haversine distance of
+    the index is the longer one. ST_DWithin still decides the radius.
+    """
+    config = current_app.config
+    if not config.get("GEO_INDEX_ENABLED"):
+        return None
+    index = refresh_geo_index(config["GEO_INDEX_REFRESH_SECONDS"])
+    radius_km = params.radius_km * SPHEROID_MARGIN
+    return [
+        entry.id
+        for _, entry in index.within(params.lat, params.lng, radius_km)
+        if entry.capacity >= params.bag_count
+        and is_open_for(entry, params.dropoff, params.pickup)
+    ]
+
+
+def is_open_for(stashpoint, dropoff, pickup):
+    """Python twin of the opening-hours criteria of build_search_statement"""
+    schedule = stashpoint.weekly_schedule
+    return is_scheduled_open_at(schedule, dropoff) and is_scheduled_open_at(
+        schedule, pickup
+    )
+
+
+def fill_cache_entry(window, center, radius_km):
+    """Candidates within radius_km of center and their bookings over window"""
+    point = search_point(*center)
+    # A replica lagging behind an invalidation would refill stale bookings
+    with reads_from_primary():
+        rows = db.session.execute(
+            select(*STASHPOINT_COLUMNS).where(
+                func.ST_DWithin(Stashpoint.location, point, radius_km * 1000)
+            )
+        ).all()
+        bookings = defaultdict(list)
+        if rows:
+            statement = select(
+                Booking.stashpoint_id,
+                Booking.dropoff_time,
+                Booking.pickup_time,
+                Booking.bag_count,
+            ).where(
+                Booking.stashpoint_id.in_([row.id for row in rows]),
+                Booking.is_cancelled.is_(False),
+                Booking.dropoff_time < window[1],
+                Booking.pickup_time > window[0],
+            )
+            for stashpoint_id, *interval in db.session.execute(statement):
+                bookings[stashpoint_id].append(tuple(interval))
+    return rows, dict(bookings)
+
+
+def cached_search_results(cache, params, after=None, limit=None):
+    """search_results with candidates and bookings read from the search cache
+
+    Available capacity over the exact window is swept from the cached
+    bookings, which cover the window widened to whole hours. Candidates
+    with room for the bags are filtered by radius, ordered and paged in SQL
+    with the distance of build_search_statement, so cursors carry over
+    between cached and uncached searches.
+    """
+    entry = cache.get_or_fill(params, fill_cache_entry)
+    rows = {}
+    for row in entry.rows:
+        if not is_open_for(row, params.dropoff, params.pickup):
+            continue
+        intervals = entry.bookings.get(row.id, ())
+        available = row.capacity - peak_booked(intervals, params.dropoff, params.pickup)
+        if available >= params.bag_count:
+            rows[row.id] = row, available
+    if not rows:
+        return
+    point = search_point(params.lat, params.lng)
+    distance = func.ST_Distance(Stashpoint.location, point).label("distance_m")
+    statement = (
+        select(Stashpoint.id, distance)
+        .where(
+            Stashpoint.id.in_(rows),
+            func.ST_DWithin(Stashpoint.location, point, params.radius_km * 1000),
+        )
+        .order_by(distance, Stashpoint.id)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(distance, Stashpoint.id) > tuple_(*after))
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    for stashpoint_id, distance_m in db.session.execute(statement):
+        row, available = rows[stashpoint_id]
+        yield (distance_m, stashpoint_id), search_result(row, distance_m, available)
+
+
+def search_results(params, after=None, limit=None, yield_per=None):
+    """Yield ((distance_m, id), result) pairs of a search, nearest first
+
+    yield_per streams rows from a server-side cursor in batches of that size.
+    Other searches go through the search cache when it is enabled.
+    """
+    cache = current_app.extensions.get("search_cache")
+    if cache is not None and not yield_per:
+        yield from cached_search_results(cache, params, after, limit)
+        return
+
+    candidate_ids = shortlist_candidates(params)
+    if candidate_ids == []:
+        return
+    statement = build_search_statement(params, candidate_ids, after)
+    if limit is not None:
+        statement = statement.limit(limit)
+    if yield_per:
+        statement = statement.execution_options(yield_per=yield_per)
+
+    for row in db.session.execute(statement):
+        yield (row.distance_m, row.id), search_result(row)
+
+
+def nearest_search_results(params, k, max_distance_km):
+    """Yield ((distance_m, id), result) pairs of the k nearest available"""
+    statement = build_nearest_statement(params, k, max_distance_km)
+    for row in db.session.execute(statement):
+        yield (row.distance_m, row.id), search_result(row)
+
+
+def search_stashpoints(params):
+    """Return available stashpoints for params ordered by distance"""
+    return [result for _, result in search_results(params)]
+
+
+def build_batch_search_statement(params_list):
+    """Build one statement answering many searches, tagged by their index
+
+    The searches are joined in as a VALUES list, so candidate selection,
+    the peak-occupancy sweep and the capacity filter run for all of them in
+    a single set-based query.
+    """
+    specs = values(
+        column("idx", Integer),
+        column("lat", Float),
+        column("lng", Float),
+        column("radius_m", Float),
+        column("dropoff", DateTime),
+        column("pickup", DateTime),
+        column("dropoff_slot", Integer),
+        column("dropoff_previous_slot", Integer),
+        column("pickup_slot", Integer),
+        column("pickup_previous_slot", Integer),
+        column("bag_count", Integer),
+        name="search_specs",
+    ).data(
+        [
+            (
+                idx,
+                params.lat,
+                params.lng,
+                params.radius_km * 1000,
+                params.dropoff,
+                params.pickup,
+                *slots_at(params.dropoff),
+                *slots_at(params.pickup),
+                params.bag_count,
+            )
+            for idx, params in enumerate(params_list)
+        ]
+    )
+    point = search_point(specs.c.lat, specs.c.lng)
+    candidates = (
+        select(
+            specs.c.idx,
+            Stashpoint.id.label("stashpoint_id"),
+            specs.c.lat,
+            specs.c.lng,
+            specs.c.dropoff,
+            specs.c.pickup,
+            specs.c.bag_count,
+        )
+        .select_from(specs)
+        .join(
+            Stashpoint,
+            and_(
+                func.ST_DWithin(Stashpoint.location, point, specs.c.radius_m),
+                schedule_open_at(
+                    Stashpoint.weekly_schedule,
+                    (specs.c.dropoff_slot, specs.c.dropoff_previous_slot),
+                ),
+                schedule_open_at(
+                    Stashpoint.weekly_schedule,
+                    (specs.c.pickup_slot, specs.c.pickup_previous_slot),
+                ),
+            ),
+        )
+        .cte("search_candidates")
+    )
+
+    peak = windowed_peak_subquery(candidates)
+    distance = func.ST_Distance(
+        Stashpoint.location, search_point(candidates.c.lat, candidates.c.lng)
+    ).label("distance_m")
+    available = (Stashpoint.capacity - func.coalesce(peak.c.peak, 0)).label(
+        "available_capacity"
+    )
+    return (
+        select(*STASHPOINT_COLUMNS, distance, available, candidates.c.idx)
+        .select_from(candidates)
+        .join(Stashpoint, Stashpoint.id == candidates.c.stashpoint_id)
+        .outerjoin(
+            peak,
+            and_(
+                peak.c.idx == candidates.c.idx,
+                peak.c.stashpoint_id == candidates.c.stashpoint_id,
+            ),
+        )
+        .where(available >= candidates.c.bag_count)
+        .order_by(candidates.c.idx, distance, Stashpoint.id)
+    )
+
+
+def batch_search_stashpoints(params_list):
+    """Answer several searches in one query, keyed by their index"""
+    rows = db.session.execute(build_batch_search_statement(params_list))
+    return batch_results(rows, len(params_list))
+
+
+def batch_results(rows, count):
+    """Group batch search rows by the index of their search"""
+    results = {str(idx): [] for idx in range(count)}
+    for row in rows:
+        results[str(row.idx)].append(search_result(row))
+    return results
+
+
+def explain_plan(statement, analyze=False):
+    """Lines of the query plan of a statement, with its parameters inlined
+
+    analyze executes the statement; the caller should roll back afterwards.
+    """
+    compiled = statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    options = "ANALYZE, BUFFERS" if analyze else "COSTS"
+    plan = db.session.execute(text(f"EXPLAIN ({options}) {compiled}"))
+    return [line for (line,) in plan]
@@ -0,0 +1,480 @@
+"""Search result cache with booking-aware invalidation
+
+Search traffic concentrates on a few places and time windows, so entries
+are keyed on the geohash cell of the coordinates, the window widened to
+whole hours and the radius. An entry holds every stashpoint within the
+radius of anywhere in the cell together with its bookings overlapping the
+widened window, which is the expensive part of a search to read. The
+available capacity over the exact window of each request is swept from
+those bookings, then its radius, distance order, opening hours and bag
+count are applied to the cached candidates, see cached_search_results.
+
+Entries are tagged with the stashpoints they cover. Committing a booking
+change for stashpoint X evicts only the entries tagged with X whose window
+overlaps the booking, instead of flushing the whole cache. Every
+invalidation also bumps a generation, and an entry is only stored if the
+generation has not moved since before it was filled: otherwise a booking
+committed during the fill could be missing from an entry stored after its
+invalidation ran.
+
+Backends implement CacheBackend. LocalCacheBackend is an in-process LRU
+with a TTL: invalidations only reach the worker that committed the change,
+so other workers may serve stale availability until the TTL expires. With
+several workers, use RedisCacheBackend (SEARCH_CACHE_REDIS_URL), whose
+entries and invalidations are shared by every worker. Redis entries are
+JSON: anything able to write to a shared Redis could run code in every
+worker through pickle.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, time as time_of_day
+from flask import current_app
+from sqlalchemy import event, inspect
+from app import db
+from app.models import Booking, Stashpoint
+from app.serializers import STASHPOINT_COLUMNS
+from app.services.geo_index import SPHEROID_MARGIN, haversine_km
+from app.services.occupancy import HOUR, floor_hour
+
+GEOHASH_PRECISION = 6
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Candidate rows decoded from JSON, with the fields of STASHPOINT_COLUMNS
+CachedRow = namedtuple("CachedRow", [column.key for column in STASHPOINT_COLUMNS])
+_TIME_FIELDS = ("open_from", "open_until")
+
+
+def geohash_cell(lat, lng, precision=GEOHASH_PRECISION):
+    """Return the geohash of a coordinate and the bounds of its cell"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars), tuple(lat_range), tuple(lng_range)
+
+
+def hour_window(dropoff, pickup):
+    """The window from dropoff to pickup widened to whole hours"""
+    end = floor_hour(pickup)
+    return floor_hour(dropoff), end if end == pickup else end + HOUR
+
+
+class CacheEntry:
+    """Candidates of a quantized search and their bookings over its window
+
+    rows hold the STASHPOINT_COLUMNS of the candidates. bookings maps
+    stashpoint ids to the (dropoff, pickup, bags) of their uncancelled
+    bookings overlapping window; candidates without any are left out.
+    """
+
+    __slots__ = (
+        "window",
+        "center",
+        "radius_km",
+        "rows",
+        "bookings",
+        "stashpoint_ids",
+    )
+
+    def __init__(self, window, center, radius_km, rows, bookings):
+        self.window = window
+        self.center = center
+        self.radius_km = radius_km
+        self.rows = rows
+        self.bookings = bookings
+        self.stashpoint_ids = frozenset(row.id for row in rows)
+
+    def overlaps(self, start, end):
+        return self.window[0] < end and self.window[1] > start
+
+    def covers(self, latitude, longitude):
+        return haversine_km(*self.center, latitude, longitude) <= self.radius_km
+
+    def dumps(self):
+        """Encode as JSON, with datetimes and times as ISO 8601 strings"""
+        rows = [
+            [
+                value.isoformat() if name in _TIME_FIELDS and value else value
+                for name, value in zip(CachedRow._fields, row)
+            ]
+            for row in self.rows
+        ]
+        bookings = {
+            stashpoint_id: [
+                [dropoff.isoformat(), pickup.isoformat(), bags]
+                for dropoff, pickup, bags in intervals
+            ]
+            for stashpoint_id, intervals in self.bookings.items()
+        }
+        return json.dumps(
+            {
+                "window": [moment.isoformat() for moment in self.window],
+                "center": self.center,
+                "radius_km": self.radius_km,
+                "rows": rows,
+                "bookings": bookings,
+            }
+        )
+
+    @classmethod
+    def loads(cls, payload):
+        """Decode an entry encoded by dumps"""
+        data = json.loads(payload)
+        rows = []
+        for values in data["rows"]:
+            row = CachedRow(*values)
+            times = {
+                name: time_of_day.fromisoformat(getattr(row, name))
+                for name in _TIME_FIELDS
+                if getattr(row, name)
+            }
+            rows.append(row._replace(**times))
+        bookings = {
+            stashpoint_id: [
+                (datetime.fromisoformat(dropoff), datetime.fromisoformat(pickup), bags)
+                for dropoff, pickup, bags in intervals
+            ]
+            for stashpoint_id, intervals in data["bookings"].items()
+        }
+        return cls(
+            tuple(datetime.fromisoformat(moment) for moment in data["window"]),
+            tuple(data["center"]),
+            data["radius_km"],
+            rows,
+            bookings,
+        )
+
+
+class CacheBackend:
+    """Storage for search cache entries tagged by stashpoint id"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry, generation=None):
+        """Store entry unless the generation moved on from generation
+
+        Returns whether the entry was stored. The check and the write are
+        atomic with respect to bump_generation.
+        """
+        raise NotImplementedError
+
+    def generation(self):
+        """Current invalidation generation"""
+        raise NotImplementedError
+
+    def bump_generation(self):
+        raise NotImplementedError
+
+    def delete(self, keys):
+        raise NotImplementedError
+
+    def untag(self, stashpoint_id, keys):
+        """Drop keys of entries that no longer exist from a stashpoint's tag"""
+
+    def keys_for_stashpoint(self, stashpoint_id):
+        """Keys of the entries whose candidates include stashpoint_id"""
+        raise NotImplementedError
+
+    def items(self):
+        """Iterate over every (key, entry); used for rare wide evictions"""
+        raise NotImplementedError
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU with a per-entry TTL"""
+
+    def __init__(self, max_entries=10_000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            for stashpoint_id in entry.stashpoint_ids:
+                self._tags.setdefault(stashpoint_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def keys_for_stashpoint(self, stashpoint_id):
+        with self._lock:
+            return set(self._tags.get(stashpoint_id, ()))
+
+    def items(self):
+        with self._lock:
+            return [(key, entry) for key, (_, entry) in self._entries.items()]
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        for stashpoint_id in item[1].stashpoint_ids:
+            keys = self._tags.get(stashpoint_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[stashpoint_id]
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared backend on Redis; entries expire through Redis TTLs"""
+
+    def __init__(self, url, ttl=60, prefix="stasher:search:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _entry_key(self, key):
+        return f"{self.prefix}entry:{key}"
+
+    def _tag_key(self, stashpoint_id):
+        return f"{self.prefix}tag:{stashpoint_id}"
+
+    def _generation_key(self):
+        return f"{self.prefix}generation"
+
+    def get(self, key):
+        payload = self.client.get(self._entry_key(key))
+        return CacheEntry.loads(payload) if payload is not None else None
+
+    def set(self, key, entry, generation=None):
+        from redis.exceptions import WatchError
+
+        with self.client.pipeline() as pipeline:
+            try:
+                # EXEC fails if an invalidation bumps the generation after this
+                if generation is not None:
+                    pipeline.watch(self._generation_key())
+                    if int(pipeline.get(self._generation_key()) or 0) != generation:
+                        return False
+                pipeline.multi()
+                pipeline.set(self._entry_key(key), entry.dumps(), ex=self.ttl)
+                for stashpoint_id in entry.stashpoint_ids:
+                    tag = self._tag_key(stashpoint_id)
+                    pipeline.sadd(tag, key)
+                    pipeline.expire(tag, self.ttl)
+                pipeline.execute()
+            except WatchError:
+                return False
+        return True
+
+    def generation(self):
+        return int(self.client.get(self._generation_key()) or 0)
+
+    def bump_generation(self):
+        self.client.incr(self._generation_key())
+
+    def delete(self, keys):
+        if not keys:
+            return
+        names = [self._entry_key(key) for key in keys]
+        payloads = self.client.mget(names)
+        pipeline = self.client.pipeline()
+        pipeline.delete(*names)
+        for key, payload in zip(keys, payloads):
+            if payload is not None:
+                for stashpoint_id in CacheEntry.loads(payload).stashpoint_ids:
+                    pipeline.srem(self._tag_key(stashpoint_id), key)
+        pipeline.execute()
+
+    def untag(self, stashpoint_id, keys):
+        # Expired entries leave their keys in the tags until the tags expire
+        if keys:
+            self.client.srem(self._tag_key(stashpoint_id), *keys)
+
+    def keys_for_stashpoint(self, stashpoint_id):
+        members = self.client.smembers(self._tag_key(stashpoint_id))
+        return {member.decode() for member in members}
+
+    def items(self):
+        offset = len(self._entry_key(""))
+        for name in self.client.scan_iter(match=self._entry_key("*")):
+            entry = self.get(name.decode()[offset:])
+            if entry is not None:
+                yield name.decode()[offset:], entry
+
+
+class SearchCache:
+    """Quantized search cache over a CacheBackend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def quantize(params):
+        """Return the cache key and the widened search it stands for"""
+        cell, lat_bounds, lng_bounds = geohash_cell(params.lat, params.lng)
+        center = (sum(lat_bounds) / 2, sum(lng_bounds) / 2)
+        # Everything within the radius of any point in the cell, with a
+        # margin for the spheroid distances of ST_DWithin
+        reach = SPHEROID_MARGIN * haversine_km(*center, lat_bounds[1], lng_bounds[1])
+        window = hour_window(params.dropoff, params.pickup)
+        key = "{}:{}:{}:{:g}".format(
+            cell,
+            window[0].isoformat(),
+            window[1].isoformat(),
+            params.radius_km,
+        )
+        return key, window, center, params.radius_km + reach
+
+    def get_or_fill(self, params, fill):
+        """Return the entry for params, filling it on a miss
+
+        fill is called as fill(window, center, radius_km) and returns the
+        (rows, bookings) of a CacheEntry.
+        """
+        key, window, center, radius_km = self.quantize(params)
+        entry = self.backend.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        generation = self.backend.generation()
+        entry = CacheEntry(window, center, radius_km, *fill(window, center, radius_km))
+        self.backend.set(key, entry, generation)
+        return entry
+
+    def invalidate_booking(self, stashpoint_id, dropoff, pickup):
+        """Evict entries covering stashpoint_id whose window overlaps a booking"""
+        # Bumped first, so a fill running now is either evicted or not stored
+        self.backend.bump_generation()
+        stale, expired = [], []
+        for key in self.backend.keys_for_stashpoint(stashpoint_id):
+            entry = self.backend.get(key)
+            if entry is None:
+                expired.append(key)
+            elif entry.overlaps(dropoff, pickup):
+                stale.append(key)
+        self.backend.delete(stale)
+        self.backend.untag(stashpoint_id, expired)
+
+    def invalidate_stashpoint(self, stashpoint_id, latitude=None, longitude=None):
+        """Evict entries affected by a stashpoint being added, changed or removed"""
+        self.backend.bump_generation()
+        stale = set(self.backend.keys_for_stashpoint(stashpoint_id))
+        if latitude is not None and longitude is not None:
+            stale.update(
+                key
+                for key, entry in self.backend.items()
+                if entry.covers(latitude, longitude)
+            )
+        self.backend.delete(list(stale))
+
+
+def _booking_windows(booking):
+    """(stashpoint_id, dropoff, pickup) before and after a pending change"""
+    attrs = inspect(booking).attrs
+    windows = {
+        (booking.stashpoint_id, booking.dropoff_time, booking.pickup_time),
+    }
+    previous = tuple(
+        attrs[name].history.deleted[0]
+        if attrs[name].history.deleted
+        else getattr(booking, name)
+        for name in ("stashpoint_id", "dropoff_time", "pickup_time")
+    )
+    windows.add(previous)
+    return windows
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.setdefault("search_cache_invalidations", set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Booking):
+            pending.update(("booking",) + window for window in _booking_windows(obj))
+        elif isinstance(obj, Stashpoint):
+            pending.add(("stashpoint", obj.id, obj.latitude, obj.longitude))
+
+
+def _after_commit(session):
+    pending = session.info.pop("search_cache_invalidations", None)
+    cache = current_app.extensions.get("search_cache") if pending else None
+    if cache is None:
+        return
+    for kind, *args in pending:
+        if kind == "booking":
+            cache.invalidate_booking(*args)
+        else:
+            cache.invalidate_stashpoint(*args)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop("search_cache_invalidations", None)
+
+
+def init_search_cache(app):
+    """Attach a SearchCache to the app if SEARCH_CACHE_ENABLED is set"""
+    config = app.config
+    if not config.get("SEARCH_CACHE_ENABLED"):
+        return
+    ttl = config["SEARCH_CACHE_TTL_SECONDS"]
+    if config.get("SEARCH_CACHE_REDIS_URL"):
+        backend = RedisCacheBackend(config["SEARCH_CACHE_REDIS_URL"], ttl=ttl)
+    else:
+        backend = LocalCacheBackend(config["SEARCH_CACHE_MAX_ENTRIES"], ttl=ttl)
+    app.extensions["search_cache"] = SearchCache(backend)
+    register_search_cache_events()
+
+
+def register_search_cache_events():
+    """Evict cached searches when bookings or stashpoints change"""
+    if event.contains(db.session, "after_flush", _after_flush):
+        return
+    event.listen(db.session, "after_flush", _after_flush)
+    event.listen(db.session, "after_commit", _after_commit)
+    event.listen(db.session, "after_soft_rollback", _after_rollback)
@@ -0,0 +1,152 @@
+"""Table version counters for conditional GETs and delta sync
+
+table_versions holds a counter per tracked table. Every flush that inserts,
+updates or deletes stashpoints bumps the stashpoints counter once and
+stamps the written rows with the new version and updated_at. Bumping
+updates the counter row, which stays locked until the transaction ends,
+so writers commit in version order: once a reader sees version N, every
+row stamped N or lower is visible too.
+
+Polling clients can then be answered from the counter alone. The listing
+ETag is derived from the version and the query string, so If-None-Match
+is settled with one primary key lookup. If-Modified-Since is not honoured:
+Last-Modified has one-second resolution, so a client that read the listing
+between two writes in the same second would be told it still had the
+latest.
+
+?since=N returns the stashpoints stamped after version N from the version
+index. Deleted rows leave no stamp, so a since older than the last
+deletion gets the full listing.
+
+Writes that bypass the ORM (COPY, bulk deletes) must call
+touch_all_stashpoints afterwards, like rebuild_occupancy for bookings.
+"""
+
+import hashlib
+from datetime import datetime
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.postgresql import insert
+from werkzeug.http import http_date
+from werkzeug.sansio.http import is_resource_modified
+from app import db
+from app.models import Stashpoint, TableVersion
+
+STASHPOINTS = Stashpoint.__tablename__
+# table_version() of a table no write has bumped yet
+UNSEEN = (0, None, 0)
+
+
+class SyncValidationError(ValueError):
+    """Raised when the since query parameter is invalid"""
+
+
+def parse_since(args):
+    """The version of a ?since= delta sync, or None for the whole listing"""
+    since = args.get("since")
+    if since is None:
+        return None
+    try:
+        since = int(since)
+    except ValueError:
+        raise SyncValidationError("'since' must be a valid int")
+    if since < 0:
+        raise SyncValidationError("'since' must not be negative")
+    return since
+
+
+def delta_base(since, deleted_version):
+    """Version to list changes after; -1, meaning all rows, when rows were
+    deleted after since"""
+    return since if since >= deleted_version else -1
+
+
+def listing_etag(name, version, query_string):
+    """Strong ETag of a listing response at a table version"""
+    digest = hashlib.sha1(query_string).hexdigest()[:16]
+    return f"{name}-{version}-{digest}"
+
+
+def bump_table_version(connection, name, now, deleted=False):
+    """Increment a table's version and return the new one"""
+    table = TableVersion.__table__
+    statement = insert(table).values(
+        name=name, version=1, updated_at=now, deleted_version=1 if deleted else 0
+    )
+    changes = {"version": table.c.version + 1, "updated_at": now}
+    if deleted:
+        changes["deleted_version"] = table.c.version + 1
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.name], set_=changes
+    ).returning(table.c.version)
+    return connection.execute(statement).scalar_one()
+
+
+def build_table_version_statement(name):
+    return select(
+        TableVersion.version, TableVersion.updated_at, TableVersion.deleted_version
+    ).where(TableVersion.name == name)
+
+
+def table_version(name):
+    """(version, updated_at, deleted_version) of a table, or zeros if unseen"""
+    row = db.session.execute(build_table_version_statement(name)).first()
+    return tuple(row) if row is not None else UNSEEN
+
+
+def listing_headers(name, state, query_string, request_headers, since=None):
+    """Version headers of a listing response and whether the client has it
+
+    state is the table_version() of the listed table. Returns (headers,
+    modified, since): modified is False when the request's If-None-Match
+    still holds, and since becomes the version to list changes after, if
+    the request asked for a delta. Last-Modified is sent for information
+    only; If-Modified-Since never answers 304.
+    """
+    version, updated_at, deleted_version = state
+    etag = listing_etag(name, version, query_string)
+    headers = {"ETag": f'"{etag}"', f"X-{name.title()}-Version": str(version)}
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    modified = is_resource_modified(
+        http_if_none_match=request_headers.get("If-None-Match"), etag=etag
+    )
+    if since is not None:
+        since = delta_base(since, deleted_version)
+        headers["X-Sync"] = "full" if since < 0 else "delta"
+    return headers, modified, since
+
+
+def _before_flush(session, flush_context, instances):
+    written = [obj for obj in session.new if isinstance(obj, Stashpoint)]
+    written += [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, Stashpoint) and session.is_modified(obj)
+    ]
+    deleted = any(isinstance(obj, Stashpoint) for obj in session.deleted)
+    if not written and not deleted:
+        return
+    now = datetime.utcnow()
+    version = bump_table_version(session.connection(), STASHPOINTS, now, deleted)
+    for stashpoint in written:
+        stashpoint.version = version
+        stashpoint.updated_at = now
+
+
+def touch_all_stashpoints():
+    """Stamp every stashpoint with a new version after a bulk write
+
+    Counts as a deletion, so delta clients resync. The caller owns the
+    transaction.
+    """
+    now = datetime.utcnow()
+    version = bump_table_version(db.session.connection(), STASHPOINTS, now, True)
+    db.session.execute(update(Stashpoint).values(version=version, updated_at=now))
+    return version
+
+
+def register_version_events():
+    """Keep the stashpoints version in step with every flushed change"""
+    if event.contains(db.session, "before_flush", _before_flush):
+        return
+    event.listen(db.session, "before_flush", _before_flush)
@@ -0,0 +1,117 @@
+"""Fast-start mode: pay startup costs before a worker takes traffic
+
+With FAST_START set, create_app skips what a serving process never uses
+(Flask-Migrate and alembic are only imported for the flask CLI), configures
+the ORM mappers up front and warms up:
+
+- every search statement shape is executed once, filling the engine's
+  compiled statement cache, so no request pays for SQL compilation;
+- each pooled connection is opened and runs those statements, so requests
+  do not pay for connecting or for the backend loading its catalog caches;
+- in-process caches (geo index, opening hours) are filled.
+
+Under gunicorn with preload_app the app is created once in the master, so
+mapper configuration and the compiled cache are inherited by every worker;
+the post_fork hook then warms each worker's own connections.
+
+Flask-Migrate is the only import this mode defers. geoalchemy2 and the
+models are needed to map the tables and orjson by the first response, so
+they are imported by create_app in either mode; under preload_app their
+cost is paid once in the master. numpy is only imported by the flask
+commands that use it, whatever the mode.
+"""
+
+import logging
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import configure_mappers
+from app import db
+from app.models import Stashpoint
+from app.serializers import STASHPOINT_COLUMNS
+from app.services.calendar import build_calendar_statement
+from app.services.schedule import opening_hours
+from app.services.search import (
+    SearchParams,
+    build_batch_search_statement,
+    build_nearest_statement,
+    build_search_statement,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP_CONNECTIONS = 5
+
+
+def warmup_statements(lat, lng, stashpoint_id):
+    """One statement of each shape the stashpoints routes execute"""
+    dropoff = datetime.utcnow().replace(
+        hour=10, minute=0, second=0, microsecond=0
+    ) + timedelta(days=1)
+    params = SearchParams(
+        lat=lat,
+        lng=lng,
+        dropoff=dropoff,
+        pickup=dropoff + timedelta(hours=8),
+        bag_count=1,
+    )
+    search = build_search_statement(params)
+    listing = select(*STASHPOINT_COLUMNS).order_by(Stashpoint.id)
+    return [
+        search,
+        search.limit(21),
+        build_search_statement(params, after=(0.0, "")).limit(21),
+        build_nearest_statement(params, 5, 50.0),
+        listing,
+        listing.limit(101),
+        build_batch_search_statement([params, params]),
+        build_calendar_statement([stashpoint_id], dropoff, dropoff + timedelta(days=7)),
+    ]
+
+
+def prefill_caches(app):
+    """Fill the in-process caches a first request would otherwise fill"""
+    if app.config.get("GEO_INDEX_ENABLED"):
+        from app.services.geo_index import refresh_geo_index
+
+        refresh_geo_index(max_age=0)
+    schedules = db.session.scalars(select(Stashpoint.weekly_schedule).distinct())
+    for schedule in schedules:
+        opening_hours(schedule)
+
+
+def warm_up(app, connections=None):
+    """Execute every statement shape on each of connections pool connections"""
+    if connections is None:
+        engine_options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+        connections = engine_options.get("pool_size", DEFAULT_WARMUP_CONNECTIONS)
+    with app.app_context():
+        try:
+            sample = db.session.execute(
+                select(Stashpoint.id, Stashpoint.latitude, Stashpoint.longitude)
+                .order_by(Stashpoint.id)
+                .limit(1)
+            ).first()
+            stashpoint_id, lat, lng = sample or ("", 0.0, 0.0)
+            statements = warmup_statements(lat, lng, stashpoint_id)
+            prefill_caches(app)
+            db.session.rollback()
+
+            # Hold them all at once so each is a distinct pooled connection
+            with ExitStack() as stack:
+                for _ in range(connections):
+                    connection = stack.enter_context(db.engine.connect())
+                    for statement in statements:
+                        connection.execute(statement).all()
+                    connection.rollback()
+        except SQLAlchemyError:
+            logger.warning("Warm-up failed; serving cold", exc_info=True)
+        finally:
+            db.session.remove()
+
+
+def prepare_app(app):
+    """Configure the ORM once and warm up, before the server forks"""
+    configure_mappers()
+    warm_up(app)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Benchmark the stashpoints API at several dataset sizes and search radii.
+
+Each dataset size is generated with seed_load_data (deterministic), then
+every scenario is replayed either through the Flask test client, which
+also counts SQL statements per request, or over HTTP against a running
+server with --base-url, which counts statements from Server-Timing headers
+when the server runs with SERVER_TIMING_ENABLED=true. Results are printed
+or written as JSON so runs on different commits can be compared with
+benchmarks/compare.py.
+
+    python -m benchmarks.api --sizes 1000x100000,5000x1000000 --output before.json
+    python -m benchmarks.api --skip-load --base-url http://localhost:5000 \
+        --concurrency 32
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+from app import create_app, db
+from benchmarks.common import (
+    QueryCounter,
+    git_revision,
+    run_load,
+    summarize,
+    write_report,
+)
+from seed_load_data import CITIES, DEFAULT_ANCHOR, load_dataset
+
+LISTING_PATH = "/api/v1/stashpoints/"
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def parse_sizes(value):
+    """Parse "1000x100000,5000x1000000" into (stashpoints, bookings) pairs"""
+    sizes = []
+    for size in value.split(","):
+        stashpoints, bookings = size.lower().split("x")
+        sizes.append((int(stashpoints), int(bookings)))
+    return sizes
+
+
+def search_requests(count, radius_km, seed):
+    """Deterministic search query strings around the dataset's cities"""
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        _, lat, lng, spread_km, _ = rng.choice(CITIES)
+        dropoff = DEFAULT_ANCHOR + timedelta(
+            days=rng.randint(-7, 14), hours=rng.randint(8, 14)
+        )
+        pickup = dropoff + timedelta(hours=rng.choice((2, 4, 8, 24, 72)))
+        requests.append(
+            (
+                LISTING_PATH,
+                {
+                    "lat": round(lat + rng.uniform(-0.03, 0.03), 5),
+                    "lng": round(lng + rng.uniform(-0.03, 0.03), 5),
+                    "dropoff": dropoff.isoformat() + "Z",
+                    "pickup": pickup.isoformat() + "Z",
+                    "bag_count": rng.choice((1, 1, 2, 3)),
+                    "radius_km": radius_km,
+                },
+            )
+        )
+    return requests
+
+
+def corpus_requests(path):
+    """Read (path, query) requests from a JSONL corpus
+
+    Each line is {"path": "/api/v1/stashpoints/", "query": {...}}.
+    """
+    with open(path) as f:
+        return [
+            (entry.get("path", LISTING_PATH), entry.get("query", {}))
+            for entry in map(json.loads, f)
+            if entry
+        ]
+
+
+def scenarios(args):
+    """Yield (name, requests) for every scenario of a run"""
+    yield "listing_page", [(LISTING_PATH, {"limit": 100})] * args.requests
+    yield "listing_full", [(LISTING_PATH, {})] * max(1, args.requests // 10)
+    for radius_km in args.radii:
+        yield f"search_r{radius_km:g}km", search_requests(
+            args.requests, radius_km, args.seed
+        )
+    if args.corpus:
+        yield "corpus", corpus_requests(args.corpus)
+
+
+def client_caller(app):
+    client = app.test_client()
+
+    def call(request):
+        path, query = request
+        return client.get(path, query_string=query).status_code == 200
+
+    return call
+
+
+class HttpCaller:
+    """Issue requests over HTTP, summing queries from Server-Timing headers"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.queries = None
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        path, query = request
+        url = self.base_url + path + "?" + urllib.parse.urlencode(query)
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                response.read()
+                self._count_queries(response.headers.get("Server-Timing", ""))
+                return response.status == 200
+        except (urllib.error.URLError, TimeoutError):
+            return False
+
+    def _count_queries(self, server_timing):
+        match = SERVER_TIMING_QUERIES.search(server_timing)
+        if match:
+            with self._lock:
+                self.queries = (self.queries or 0) + int(match.group(1))
+
+
+def run_scenarios(app, args):
+    results = []
+    for name, requests in scenarios(args):
+        if args.base_url:
+            call = HttpCaller(args.base_url, args.timeout)
+            latencies, wall, errors = run_load(call, requests, args.concurrency)
+            queries = call.queries
+        else:
+            call = client_caller(app)
+            with app.app_context():
+                call(requests[0])  # warm up connections and compiled statements
+                with QueryCounter(db.engine) as counter:
+                    latencies, wall, errors = run_load(
+                        call, requests, args.concurrency
+                    )
+            queries = counter.count
+        results.append(
+            {"scenario": name, **summarize(latencies, wall, errors, queries)}
+        )
+        print(f"  {name}: {results[-1]}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stashpoints API")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1000x100000"))
+    parser.add_argument(
+        "--radii",
+        type=lambda value: [float(radius) for radius in value.split(",")],
+        default=[1.0, 5.0, 20.0],
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--base-url", help="benchmark a running server over HTTP")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--corpus", help="JSONL file of requests to replay")
+    parser.add_argument("--skip-load", action="store_true", help="use current data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    report = {
+        "git_revision": git_revision(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mode": "http" if args.base_url else "test_client",
+        "concurrency": args.concurrency,
+        "datasets": [],
+    }
+
+    sizes = [None] if args.skip_load else args.sizes
+    for size in sizes:
+        if size is not None:
+            stashpoints, bookings = size
+            print(f"Loading {stashpoints} stashpoints, {bookings} bookings", flush=True)
+            with app.app_context():
+                load_dataset(
+                    stashpoints,
+                    customers=max(100, bookings // 10),
+                    bookings=bookings,
+                    seed=args.seed,
+                )
+        report["datasets"].append(
+            {
+                "stashpoints": size[0] if size else None,
+                "bookings": size[1] if size else None,
+                "results": run_scenarios(app, args),
+            }
+        )
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Stress booking creation: many concurrent clients booking the same hub.
+
+Every client posts bookings for overlapping windows at one stashpoint
+(by default "Central Station Lockers" from seed_test_data.py). Afterwards
+the peak occupancy of the hub is recomputed from the committed bookings;
+the run fails if it ever exceeds the capacity.
+
+    python -m benchmarks.booking_stress --clients 50 --bookings-per-client 20
+"""
+
+import argparse
+import random
+import sys
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import create_app, db
+from app.models import Booking, Customer, Stashpoint
+from app.services.availability import peak_occupancy
+from benchmarks.common import run_load, summarize, write_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress concurrent booking creation")
+    parser.add_argument("--stashpoint", default="Central Station Lockers")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--bookings-per-client", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        hub = db.session.scalars(
+            select(Stashpoint).where(Stashpoint.name == args.stashpoint)
+        ).first()
+        if hub is None:
+            sys.exit(f"No stashpoint named {args.stashpoint!r}; seed the database")
+        customer_ids = db.session.scalars(select(Customer.id).limit(100)).all()
+        hub_id, capacity = hub.id, hub.capacity
+        db.session.remove()
+
+    # Windows inside opening hours on a single day so they all contend
+    day = datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) + timedelta(days=60)
+    rng = random.Random(args.seed)
+    jobs = []
+    for _ in range(args.clients * args.bookings_per_client):
+        dropoff = day + timedelta(hours=rng.randint(8, 14), minutes=rng.choice((0, 30)))
+        jobs.append(
+            {
+                "customer_id": rng.choice(customer_ids),
+                "stashpoint_id": hub_id,
+                "dropoff": dropoff.isoformat(),
+                "pickup": (dropoff + timedelta(hours=rng.randint(1, 6))).isoformat(),
+                "bag_count": rng.choice((1, 1, 2, 3)),
+            }
+        )
+
+    client = app.test_client()
+    outcomes = {"created": 0, "full": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def book(job):
+        status = client.post("/api/v1/bookings/", json=job).status_code
+        with lock:
+            outcomes[{201: "created", 409: "full"}.get(status, "failed")] += 1
+        return status in (201, 409)
+
+    latencies, wall, errors = run_load(book, jobs, args.clients)
+
+    with app.app_context():
+        intervals = db.session.execute(
+            select(Booking.dropoff_time, Booking.pickup_time, Booking.bag_count).where(
+                Booking.stashpoint_id == hub_id, Booking.is_cancelled.is_(False)
+            )
+        ).all()
+    peak = peak_occupancy(intervals, day, day + timedelta(days=1))
+
+    report = {
+        "stashpoint": args.stashpoint,
+        "capacity": capacity,
+        "clients": args.clients,
+        **outcomes,
+        "peak_occupancy": peak,
+        "overbooked_bags": max(0, peak - capacity),
+        "bookings_per_sec": round(outcomes["created"] / wall, 1),
+        **summarize(latencies, wall, errors),
+    }
+    write_report(report, args.output)
+    if report["overbooked_bags"]:
+        sys.exit("Overbooking detected")
+
+
+if __name__ == "__main__":
+    main()
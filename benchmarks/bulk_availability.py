@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Cost of the offline availability engine against the SQL backfill.
+
+Generates a dataset with seed_load_data (10k stashpoints and 5M bookings by
+default), then empties and rebuilds the occupancy buckets of the booking
+horizon twice: with rebuild_occupancy (one INSERT ... SELECT over generate_series) and
+with the NumPy engine of `flask occupancy compute` (streamed chunks,
+difference arrays, COPY of one array per stashpoint). Both results are
+compared bucket for bucket. Finally the nearest stashpoint of
+--demand-points random points is found with the vectorized haversine
+matrices of `flask search coverage`.
+
+    python -m benchmarks.bulk_availability --stashpoints 10000 --bookings 5000000
+    python -m benchmarks.bulk_availability --skip-load --chunk-rows 100000
+
+Exits non-zero if the two backfills disagree.
+"""
+
+import argparse
+import sys
+import time
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import select, text
+from app import create_app, db
+from app.models import Stashpoint
+from app.services.bulk_availability import (
+    compute_hourly_occupancy,
+    nearest_stashpoints,
+    write_occupancy,
+)
+from app.services.occupancy import rebuild_occupancy
+from benchmarks.common import git_revision, write_report
+from seed_load_data import DEFAULT_ANCHOR, load_dataset
+
+# Bookings of seed_load_data span 60 days before to 30 days after the anchor
+HORIZON_START = DEFAULT_ANCHOR - timedelta(days=61)
+HORIZON_DAYS = 93
+
+SNAPSHOT_TABLE = "benchmark_expected_occupancy"
+
+SNAPSHOT = text(
+    f"""
+    CREATE UNLOGGED TABLE {SNAPSHOT_TABLE} AS
+    SELECT stashpoint_id, hour, booked FROM stashpoint_occupancy
+    WHERE hour >= :start AND hour < :end
+    """
+)
+
+CLEAR_HORIZON = text(
+    "DELETE FROM stashpoint_occupancy WHERE hour >= :start AND hour < :end"
+)
+
+# Buckets present on one side only, or with a different booked count
+MISMATCHES = text(
+    f"""
+    SELECT count(*) FROM (
+        (SELECT stashpoint_id, hour, booked FROM {SNAPSHOT_TABLE}
+         EXCEPT ALL
+         SELECT stashpoint_id, hour, booked FROM stashpoint_occupancy
+         WHERE hour >= :start AND hour < :end)
+        UNION ALL
+        (SELECT stashpoint_id, hour, booked FROM stashpoint_occupancy
+         WHERE hour >= :start AND hour < :end
+         EXCEPT ALL
+         SELECT stashpoint_id, hour, booked FROM {SNAPSHOT_TABLE})
+    ) AS differences
+    """
+)
+
+
+def timed(call, commit=True):
+    started = time.perf_counter()
+    result = call()
+    if commit:
+        db.session.commit()
+    return result, time.perf_counter() - started
+
+
+def demand_points(count, seed):
+    """Points within about 5km of random stashpoints"""
+    rows = db.session.execute(select(Stashpoint.latitude, Stashpoint.longitude)).all()
+    rng = np.random.default_rng(seed)
+    centers = np.array(rows, dtype=np.float64)[rng.integers(len(rows), size=count)]
+    jitter = rng.uniform(-0.05, 0.05, size=(count, 2))
+    return centers[:, 0] + jitter[:, 0], centers[:, 1] + jitter[:, 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the bulk occupancy engine")
+    parser.add_argument("--stashpoints", type=int, default=10_000)
+    parser.add_argument("--bookings", type=int, default=5_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    parser.add_argument("--demand-points", type=int, default=100_000)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--skip-load", action="store_true", help="reuse the data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    end = HORIZON_START + timedelta(days=HORIZON_DAYS)
+    horizon = {"start": HORIZON_START, "end": end}
+    report = {"git_revision": git_revision(), "chunk_rows": args.chunk_rows}
+
+    with app.app_context():
+        if not args.skip_load:
+            print(
+                f"Loading {args.stashpoints} stashpoints, {args.bookings} bookings",
+                flush=True,
+            )
+            load_dataset(
+                args.stashpoints,
+                customers=max(100, args.bookings // 10),
+                bookings=args.bookings,
+                seed=args.seed,
+            )
+
+        # Emptied so that each backfill writes every bucket of the horizon
+        db.session.execute(CLEAR_HORIZON, horizon)
+        db.session.commit()
+        rows, elapsed = timed(rebuild_occupancy)
+        report["sql_rebuild"] = {"buckets": rows, "seconds": round(elapsed, 2)}
+        print(f"  SQL rebuild: {report['sql_rebuild']}", flush=True)
+        db.session.execute(text(f"DROP TABLE IF EXISTS {SNAPSHOT_TABLE}"))
+        db.session.execute(SNAPSHOT, horizon)
+        db.session.commit()
+
+        db.session.execute(CLEAR_HORIZON, horizon)
+        db.session.commit()
+        occupancy, compute_seconds = timed(
+            lambda: compute_hourly_occupancy(
+                HORIZON_START, HORIZON_DAYS, args.chunk_rows, stored=True
+            ),
+            commit=False,
+        )
+        rows, write_seconds = timed(lambda: write_occupancy(occupancy))
+        report["numpy_engine"] = {
+            "bookings": occupancy.bookings,
+            "matrix_mb": round(occupancy.booked.nbytes / 2**20, 1),
+            "buckets": rows,
+            "compute_seconds": round(compute_seconds, 2),
+            "copy_seconds": round(write_seconds, 2),
+            "seconds": round(compute_seconds + write_seconds, 2),
+        }
+        print(f"  NumPy engine: {report['numpy_engine']}", flush=True)
+
+        mismatches = db.session.execute(MISMATCHES, horizon).scalar()
+        db.session.execute(text(f"DROP TABLE {SNAPSHOT_TABLE}"))
+        db.session.commit()
+        report["mismatched_buckets"] = mismatches
+
+        lat, lng = demand_points(args.demand_points, args.seed)
+        started = time.perf_counter()
+        _, distance, within = nearest_stashpoints(lat, lng, args.radius_km)
+        elapsed = time.perf_counter() - started
+        report["coverage"] = {
+            "demand_points": args.demand_points,
+            "seconds": round(elapsed, 2),
+            "pairs_per_sec": round(len(lat) * len(occupancy.stashpoint_ids) / elapsed),
+            "median_nearest_km": round(float(np.median(distance)), 3),
+            "mean_within_radius": round(float(within.mean()), 1),
+        }
+        print(f"  Coverage: {report['coverage']}", flush=True)
+
+    write_report(report, args.output)
+    if mismatches:
+        sys.exit(f"{mismatches} buckets differ between the two backfills")
+
+
+if __name__ == "__main__":
+    main()
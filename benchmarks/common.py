@@ -0,0 +1,110 @@
+"""Shared helpers for the benchmark scripts"""
+
+import json
+import math
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, wall_seconds, errors=0, queries=None):
+    """Latency percentiles (ms), throughput and query counts of a run"""
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "max_ms": _ms(latencies[-1] if latencies else None),
+        "throughput_rps": round(len(latencies) / wall_seconds, 1)
+        if wall_seconds
+        else None,
+        "queries_per_request": None,
+    }
+    if queries is not None and latencies:
+        summary["queries_per_request"] = round(queries / len(latencies), 2)
+    return summary
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def run_load(call, jobs, concurrency=1):
+    """Run call(job) for every job on concurrency threads
+
+    call returns True on success. Returns (latencies, wall_seconds, errors).
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(job):
+        nonlocal errors
+        started = time.perf_counter()
+        ok = call(job)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for job in jobs:
+            timed(job)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, jobs))
+    return latencies, time.perf_counter() - started, errors
+
+
+class QueryCounter:
+    """Count statements sent to the database by an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def git_revision():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(report, path):
+    """Write a report as JSON to path, or stdout when path is None or '-'"""
+    payload = json.dumps(report, indent=2, default=str)
+    if path in (None, "-"):
+        print(payload)
+    else:
+        with open(path, "w") as f:
+            f.write(payload + "\n")
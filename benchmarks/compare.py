@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark reports written by benchmarks.api
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request")
+
+
+def index_results(report):
+    """Map (stashpoints, bookings, scenario) to the scenario results"""
+    return {
+        (dataset["stashpoints"], dataset["bookings"], result["scenario"]): result
+        for dataset in report["datasets"]
+        for result in dataset["results"]
+    }
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = index_results(json.load(f))
+    with open(args.after) as f:
+        after = index_results(json.load(f))
+
+    for key in sorted(before.keys() & after.keys(), key=str):
+        stashpoints, bookings, scenario = key
+        print(f"{scenario} ({stashpoints} stashpoints / {bookings} bookings)")
+        for metric in METRICS:
+            old, new = before[key].get(metric), after[key].get(metric)
+            print(f"  {metric:22} {old!s:>10} -> {new!s:>10}  {change(old, new)}")
+
+
+if __name__ == "__main__":
+    main()
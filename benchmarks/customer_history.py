@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Statements and latency per page of a heavy customer's booking history.
+
+A benchmark customer is given --bookings bookings (10k by default) at
+stashpoints of the current dataset, half upcoming and half past, generated
+server-side with INSERT ... SELECT. Completed past bookings are archived
+like `flask bookings archive` would, so past pages merge both tables. Then
+every page of /api/v1/customers/<id>/bookings is fetched through the test
+client for each listing, following X-Next-Cursor, counting statements.
+
+    python -m benchmarks.customer_history --bookings 10000
+
+Exits non-zero if any page took more than MAX_QUERIES_PER_PAGE statements
+or if the pages do not add up to the customer's bookings, so it doubles
+as the regression check for N+1 queries on this endpoint.
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, text
+from app import create_app, db
+from app.models import Booking, BookingArchive, Customer, Stashpoint
+from app.services.archive import archive_bookings
+from benchmarks.common import QueryCounter, git_revision, summarize, write_report
+
+MAX_QUERIES_PER_PAGE = 2
+CUSTOMER_EMAIL = "customer-history@benchmark.invalid"
+
+INSERT_BOOKINGS = text(
+    """
+    INSERT INTO bookings (
+        id, created_at, bag_count, dropoff_time, pickup_time, is_paid,
+        is_cancelled, checked_in, checked_out, stashpoint_id, customer_id
+    )
+    SELECT
+        md5('customer-history-' || g),
+        d.dropoff_time - interval '7 days',
+        1 + g % 3,
+        d.dropoff_time,
+        d.dropoff_time + interval '4 hours',
+        g % 3 <> 0,
+        g % 20 = 0,
+        d.dropoff_time < :now,
+        d.dropoff_time < :now,
+        sp.ids[1 + (g * 2654435761) % array_length(sp.ids, 1)],
+        :customer_id
+    FROM generate_series(1, CAST(:bookings AS bigint)) AS g
+    CROSS JOIN (SELECT array_agg(id ORDER BY id) AS ids FROM stashpoints) AS sp
+    CROSS JOIN LATERAL (
+        -- Alternate past and upcoming, spread over a year either side of now
+        SELECT CAST(:now AS timestamp)
+            + interval '1 hour' * (CASE WHEN g % 2 = 0 THEN 1 ELSE -1 END)
+            * (24 + (g * 7919) % 8760) AS dropoff_time
+    ) AS d
+    """
+)
+
+FILTERS = {
+    "all": {},
+    "paid": {"is_paid": "true"},
+    "cancelled": {"is_cancelled": "true"},
+}
+
+
+def create_customer(bookings, now, archive_days):
+    """Replace the benchmark customer with one holding bookings bookings"""
+    existing = db.session.scalar(
+        select(Customer.id).where(Customer.email == CUSTOMER_EMAIL)
+    )
+    if existing is not None:
+        for model in (Booking, BookingArchive):
+            db.session.execute(delete(model).where(model.customer_id == existing))
+        db.session.execute(delete(Customer).where(Customer.id == existing))
+    customer = Customer(email=CUSTOMER_EMAIL, name="History Benchmark")
+    db.session.add(customer)
+    db.session.flush()
+    db.session.execute(
+        INSERT_BOOKINGS,
+        {"customer_id": customer.id, "bookings": bookings, "now": now},
+    )
+    db.session.commit()
+    archived = archive_bookings(now - timedelta(days=archive_days))
+    db.session.execute(text("ANALYZE bookings"))
+    db.session.execute(text("ANALYZE bookings_archive"))
+    db.session.commit()
+    return customer.id, archived
+
+
+def expected_count(customer_id, now, when, filters):
+    total = 0
+    for model in (Booking, BookingArchive):
+        statement = select(func.count()).where(model.customer_id == customer_id)
+        if when == "upcoming":
+            statement = statement.where(model.pickup_time >= now)
+        else:
+            statement = statement.where(model.pickup_time < now)
+        for name, value in filters.items():
+            statement = statement.where(getattr(model, name).is_(value == "true"))
+        total += db.session.scalar(statement)
+    return total
+
+
+def page_through(client, customer_id, query):
+    """Fetch every page; return (latencies, queries per page, bookings)"""
+    path = f"/api/v1/customers/{customer_id}/bookings"
+    latencies, queries, seen = [], [], 0
+    query = dict(query)
+    while True:
+        with QueryCounter(db.engine) as counter:
+            started = time.perf_counter()
+            response = client.get(path, query_string=query)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            sys.exit(f"{path} {query}: HTTP {response.status_code}")
+        queries.append(counter.count)
+        seen += len(response.get_json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            return latencies, queries, seen
+        query["cursor"] = next_cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page a heavy customer's bookings")
+    parser.add_argument("--bookings", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--archive-days", type=int, default=30)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    now = datetime.utcnow().replace(microsecond=0)
+    report = {"git_revision": git_revision(), "bookings": args.bookings, "runs": []}
+    failures = []
+
+    with app.app_context():
+        if db.session.scalar(select(func.count()).select_from(Stashpoint)) == 0:
+            sys.exit("No stashpoints; seed the database first")
+        customer_id, archived = create_customer(
+            args.bookings, now, args.archive_days
+        )
+        report["archived"] = archived
+        db.session.remove()
+
+        for when in ("upcoming", "past"):
+            for name, filters in FILTERS.items():
+                query = {"when": when, "limit": args.limit, **filters}
+                latencies, queries, seen = page_through(client, customer_id, query)
+                expected = expected_count(customer_id, now, when, filters)
+                db.session.remove()
+                run = {
+                    "listing": f"{when}/{name}",
+                    "pages": len(latencies),
+                    "bookings": seen,
+                    "expected_bookings": expected,
+                    "max_queries_per_page": max(queries),
+                    **summarize(latencies, sum(latencies), 0, sum(queries)),
+                }
+                report["runs"].append(run)
+                print(f"  {run}", flush=True)
+                if max(queries) > MAX_QUERIES_PER_PAGE or seen != expected:
+                    failures.append(run["listing"])
+
+    write_report(report, args.output)
+    if failures:
+        sys.exit(f"Failed: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
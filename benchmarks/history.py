@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Search latency as booking history grows, with and without archival.
+
+A hot dataset is generated with seed_load_data (bookings around the anchor
+date), then history is added in steps: completed bookings picked up before
+the hot data, generated server-side with INSERT ... SELECT. After each step
+the history is archived with the same job as `flask bookings archive`
+(unless --no-archive) and the search scenario is replayed.
+
+    python -m benchmarks.history --history 1000000,10000000,50000000
+    python -m benchmarks.history --no-archive --output unarchived.json
+
+With archival, search latency should stay flat however much history there
+is, because the bookings table only ever holds the hot data.
+"""
+
+import argparse
+import time
+from datetime import timedelta
+from sqlalchemy import func, select, text
+from app import create_app, db
+from app.models import Booking, BookingArchive
+from app.services.archive import archive_bookings
+from benchmarks.api import client_caller, search_requests
+from benchmarks.common import git_revision, run_load, summarize, write_report
+from seed_load_data import DEFAULT_ANCHOR, load_dataset
+
+HISTORY_CHUNK_ROWS = 1_000_000
+
+# History ends where the hot bookings of seed_load_data begin
+HISTORY_CUTOFF = DEFAULT_ANCHOR - timedelta(days=60)
+
+INSERT_HISTORY = text(
+    """
+    INSERT INTO bookings (
+        id, created_at, bag_count, dropoff_time, pickup_time, is_paid,
+        is_cancelled, checked_in, checked_out, stashpoint_id, customer_id
+    )
+    SELECT
+        md5('history-' || g),
+        h.dropoff_time - interval '7 days',
+        1 + g % 3,
+        h.dropoff_time,
+        h.dropoff_time + interval '4 hours',
+        true,
+        g % 20 = 0,
+        true,
+        true,
+        sp.ids[1 + (g * 2654435761) % array_length(sp.ids, 1)],
+        cu.ids[1 + (g * 40503) % array_length(cu.ids, 1)]
+    FROM generate_series(CAST(:first AS bigint), :last) AS g
+    CROSS JOIN (SELECT array_agg(id ORDER BY id) AS ids FROM stashpoints) AS sp
+    CROSS JOIN (
+        SELECT array_agg(id ORDER BY id) AS ids
+        FROM (SELECT id FROM customers ORDER BY id LIMIT 10000) AS c
+    ) AS cu
+    CROSS JOIN LATERAL (
+        -- Spread over the year before the cutoff
+        SELECT CAST(:cutoff AS timestamp) - interval '1 day'
+            - interval '1 minute' * ((g * 7919) % 525600) AS dropoff_time
+    ) AS h
+    """
+)
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(",")]
+
+
+def add_history(first, last):
+    """Insert history bookings numbered first to last, in chunks"""
+    for start in range(first, last + 1, HISTORY_CHUNK_ROWS):
+        stop = min(last, start + HISTORY_CHUNK_ROWS - 1)
+        db.session.execute(
+            INSERT_HISTORY, {"first": start, "last": stop, "cutoff": HISTORY_CUTOFF}
+        )
+        db.session.commit()
+        print(f"  history rows {start}-{stop}", flush=True)
+
+
+def table_count(model):
+    # Exact counts; reltuples would drift between ANALYZE runs
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search latency versus history")
+    parser.add_argument("--history", type=parse_counts, default=[1_000_000, 50_000_000])
+    parser.add_argument("--stashpoints", type=int, default=5000)
+    parser.add_argument("--hot-bookings", type=int, default=500_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--no-archive", action="store_true", help="keep history hot")
+    parser.add_argument("--skip-load", action="store_true", help="reuse hot data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    report = {
+        "git_revision": git_revision(),
+        "archive": not args.no_archive,
+        "concurrency": args.concurrency,
+        "levels": [],
+    }
+    requests = search_requests(args.requests, args.radius_km, args.seed)
+    call = client_caller(app)
+
+    with app.app_context():
+        if not args.skip_load:
+            print(f"Loading {args.hot_bookings} hot bookings", flush=True)
+            load_dataset(
+                args.stashpoints,
+                customers=max(100, args.hot_bookings // 10),
+                bookings=args.hot_bookings,
+                seed=args.seed,
+            )
+        history = 0
+        for target in sorted(args.history):
+            print(f"Growing history to {target} bookings", flush=True)
+            add_history(history + 1, target)
+            history = target
+
+            level = {"history_bookings": target}
+            if not args.no_archive:
+                started = time.perf_counter()
+                moved = archive_bookings(HISTORY_CUTOFF, args.batch_size)
+                elapsed = time.perf_counter() - started
+                level["archived"] = moved
+                level["archive_rows_per_sec"] = round(moved / elapsed, 1)
+            db.session.execute(text("ANALYZE bookings"))
+            db.session.commit()
+            level["bookings_rows"] = table_count(Booking)
+            level["archive_rows"] = table_count(BookingArchive)
+            db.session.remove()
+
+            call(requests[0])  # warm up connections and compiled statements
+            latencies, wall, errors = run_load(call, requests, args.concurrency)
+            level.update(summarize(latencies, wall, errors))
+            report["levels"].append(level)
+            print(f"  {level}", flush=True)
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
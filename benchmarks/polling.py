@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Cost of partner polls of the stashpoints listing, plain versus conditional.
+
+Replays --polls polls of the full listing through the test client three
+ways: without validators (every poll re-reads and re-serializes the table),
+with If-None-Match from the previous response (304 while nothing changes)
+and as a ?since= delta sync. Every --write-every polls one stashpoint's
+capacity is changed, as an admin edit would, so conditional polls also
+pay for the occasional change.
+
+    python -m benchmarks.polling --polls 500 --write-every 50
+
+Exits non-zero if a 304 took more than one SQL statement.
+"""
+
+import argparse
+import sys
+import time
+from sqlalchemy import select
+from app import create_app, db
+from app.models import Stashpoint
+from benchmarks.common import QueryCounter, git_revision, summarize, write_report
+
+LISTING_PATH = "/api/v1/stashpoints/"
+
+
+def edit_stashpoint(ids, turn):
+    stashpoint = db.session.get(Stashpoint, ids[turn % len(ids)])
+    stashpoint.capacity += 1 if turn % 2 == 0 else -1
+    db.session.commit()
+
+
+def poll(client, mode, state):
+    """One poll; returns its status code and updates the client state"""
+    query, headers = {}, {}
+    if mode == "conditional" and "etag" in state:
+        headers["If-None-Match"] = state["etag"]
+    if mode == "delta":
+        query["since"] = state.get("version", 0)
+    response = client.get(LISTING_PATH, query_string=query, headers=headers)
+    if response.status_code == 200:
+        state["etag"] = response.headers.get("ETag")
+        state["version"] = response.headers.get("X-Stashpoints-Version", 0)
+        state["bytes"] = state.get("bytes", 0) + len(response.data)
+    return response.status_code
+
+
+def run(app, client, mode, polls, write_every, ids):
+    state = {}
+    latencies, not_modified_queries, statuses = [], [], {}
+    total_queries = 0
+    for turn in range(polls):
+        if write_every and turn and turn % write_every == 0:
+            with app.app_context():
+                edit_stashpoint(ids, turn)
+        with QueryCounter(db.engine) as counter:
+            started = time.perf_counter()
+            status = poll(client, mode, state)
+            latencies.append(time.perf_counter() - started)
+        total_queries += counter.count
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 304:
+            not_modified_queries.append(counter.count)
+    return {
+        "mode": mode,
+        "statuses": statuses,
+        "response_bytes": state.get("bytes", 0),
+        "max_queries_per_304": max(not_modified_queries, default=None),
+        **summarize(latencies, sum(latencies), 0, total_queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure listing polls")
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--write-every", type=int, default=50)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        ids = db.session.scalars(
+            select(Stashpoint.id).order_by(Stashpoint.id).limit(10)
+        ).all()
+        if not ids:
+            sys.exit("No stashpoints; seed the database first")
+        db.session.remove()
+
+    report = {"git_revision": git_revision(), "polls": args.polls, "modes": []}
+    with app.app_context():
+        for mode in ("plain", "conditional", "delta"):
+            result = run(app, client, mode, args.polls, args.write_every, ids)
+            report["modes"].append(result)
+            print(f"  {result}", flush=True)
+    write_report(report, args.output)
+    if any((mode["max_queries_per_304"] or 0) > 1 for mode in report["modes"]):
+        sys.exit("A 304 response took more than one statement")
+
+
+if __name__ == "__main__":
+    main()
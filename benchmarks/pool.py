@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Check that the production connection pool is not exhausted under load.
+
+In-process mode models one server worker: the app is built with the
+production engine options for --workers and --threads, and searches are
+replayed on --concurrency threads (one worker's threads by default). Pool
+checkouts are tracked with pool events; the run fails on any error, which
+includes pool checkout timeouts, or if connections are still checked out
+afterwards.
+
+With --base-url the searches are sent to a running server instead (e.g.
+gunicorn --config gunicorn.conf.py) while pg_stat_activity is sampled; the
+run fails if the server ever holds more connections than the budget.
+
+    python -m benchmarks.pool --workers 9 --threads 4
+    python -m benchmarks.pool --base-url http://localhost:5000 --concurrency 64
+"""
+
+import argparse
+import sys
+import threading
+from sqlalchemy import event, text
+from app import create_app, db
+from benchmarks.api import HttpCaller, client_caller, search_requests
+from benchmarks.common import run_load, summarize, write_report
+from config import WEB_THREADS, WEB_WORKERS, ProdConfig, production_engine_options
+
+
+class PoolWatcher:
+    """Track the peak number of connections checked out of a pool"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.checked_out = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self, *args):
+        with self._lock:
+            self.checked_out += 1
+            self.peak = max(self.peak, self.checked_out)
+
+    def _checkin(self, *args):
+        with self._lock:
+            self.checked_out -= 1
+
+    def __enter__(self):
+        event.listen(self.engine, "checkout", self._checkout)
+        event.listen(self.engine, "checkin", self._checkin)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "checkout", self._checkout)
+        event.remove(self.engine, "checkin", self._checkin)
+
+
+class ConnectionSampler(threading.Thread):
+    """Sample the connections open on the database every interval seconds"""
+
+    def __init__(self, engine, interval=0.1):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        query = text(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+        )
+        with self.engine.connect() as conn:
+            while not self.stopped.wait(self.interval):
+                self.peak = max(self.peak, conn.execute(query).scalar())
+                conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check pool sizing under load")
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--threads", type=int, default=WEB_THREADS)
+    parser.add_argument("--max-connections", type=int, default=90)
+    parser.add_argument("--concurrency", type=int, help="defaults to --threads")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--base-url", help="load a running server over HTTP")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    options = production_engine_options(
+        workers=args.workers, threads=args.threads, max_connections=args.max_connections
+    )
+
+    class PoolConfig(ProdConfig):
+        SQLALCHEMY_ENGINE_OPTIONS = options
+
+    app = create_app(PoolConfig)
+    requests = search_requests(args.requests, args.radius_km, args.seed)
+    concurrency = args.concurrency or args.threads
+    report = {
+        "workers": args.workers,
+        "threads": args.threads,
+        "concurrency": concurrency,
+        "pool_size": options["pool_size"],
+        "max_overflow": options["max_overflow"],
+    }
+
+    with app.app_context():
+        engine = db.engine
+        if args.base_url:
+            sampler = ConnectionSampler(engine)
+            sampler.start()
+            call = HttpCaller(args.base_url, args.timeout)
+            latencies, wall, errors = run_load(call, requests, concurrency)
+            sampler.stopped.set()
+            sampler.join()
+            report["connection_budget"] = args.max_connections
+            report["peak_server_connections"] = sampler.peak
+            failed = errors or sampler.peak > args.max_connections
+        else:
+            with PoolWatcher(engine) as watcher:
+                latencies, wall, errors = run_load(
+                    client_caller(app), requests, concurrency
+                )
+            capacity = options["pool_size"] + options["max_overflow"]
+            report["pool_capacity"] = capacity
+            report["peak_checked_out"] = watcher.peak
+            report["leaked_connections"] = engine.pool.checkedout()
+            failed = errors or report["leaked_connections"]
+
+    report.update(summarize(latencies, wall, errors))
+    write_report(report, args.output)
+    if failed:
+        sys.exit("Connection pool check failed")
+
+
+if __name__ == "__main__":
+    main()
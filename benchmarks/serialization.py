@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of stashpoint serialization, one factor at a time.
+
+Needs no database: rows are synthesized in memory. Building the response
+dicts and encoding them are measured separately:
+
+- dicts: ORM to_dict() (building Stashpoint instances, a lower bound of
+  what loading them costs) versus the column-projection serializers;
+- encoding: Flask's default stdlib json provider versus orjson, on the
+  same dicts;
+- end to end: every combination of the two.
+
+    python -m benchmarks.serialization --rows 10000
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import time as time_of_day
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.json_provider import OrjsonProvider, orjson
+from app.models import Stashpoint
+from app.serializers import stashpoint_dict
+from app.services.schedule import daily_schedule
+from config import Config
+
+
+class BenchmarkConfig(Config):
+    """Config that never needs a reachable database"""
+
+    GEO_INDEX_ENABLED = False
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        open_from = time_of_day(rng.randint(0, 11), rng.choice((0, 15, 30, 45)))
+        open_until = time_of_day(rng.randint(12, 23), rng.choice((0, 15, 30, 45)))
+        rows.append(
+            (
+                f"{i:032x}",
+                f"Stashpoint {i}",
+                "Secure bag storage",
+                f"{i} High Street",
+                "EC1A 1AA",
+                51.5 + rng.uniform(-0.2, 0.2),
+                -0.12 + rng.uniform(-0.3, 0.3),
+                rng.randint(5, 100),
+                open_from,
+                open_until,
+                daily_schedule(open_from, open_until),
+            )
+        )
+    return rows
+
+
+def orm_dicts(rows):
+    keys = (
+        "id name description address postal_code latitude longitude "
+        "capacity open_from open_until weekly_schedule"
+    ).split()
+    stashpoints = [Stashpoint(**dict(zip(keys, row))) for row in rows]
+    return [stashpoint.to_dict() for stashpoint in stashpoints]
+
+
+def projection_dicts(rows):
+    return [stashpoint_dict(row) for row in rows]
+
+
+def measure(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - started)
+    return round(len(rows) / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    rows = make_rows(args.rows)
+    builders = {"orm_to_dict": orm_dicts, "projection": projection_dicts}
+    encoders = {"stdlib_json": DefaultJSONProvider(app)}
+    if orjson is not None:
+        encoders["orjson"] = OrjsonProvider(app)
+
+    report = {"rows": args.rows, "rows_per_sec": {}}
+    with app.app_context():
+        dicts = projection_dicts(rows)
+        assert orm_dicts(rows) == dicts, "serializers disagree"
+        for name, build in builders.items():
+            report["rows_per_sec"][f"dicts:{name}"] = measure(build, rows, args.repeat)
+        for name, encoder in encoders.items():
+            report["rows_per_sec"][f"encode:{name}"] = measure(
+                encoder.dumps, dicts, args.repeat
+            )
+        for build_name, build in builders.items():
+            for encode_name, encoder in encoders.items():
+                report["rows_per_sec"][f"total:{build_name}+{encode_name}"] = measure(
+                    lambda rows: encoder.dumps(build(rows)), rows, args.repeat
+                )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
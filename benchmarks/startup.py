@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-request and first-request latency, cold versus fast start.
+
+Each run is a fresh interpreter that imports the app, creates it and
+serves one search followed by a second one through the test client. Cold
+runs use the default startup; warm runs set FAST_START=true, so startup
+also configures mappers and warms statements, connections and caches.
+
+    python -m benchmarks.startup --runs 5
+
+time_to_first_request_ms covers interpreter start to the first response,
+startup_ms the import and create_app part of it. Under gunicorn with
+preload_app, startup is paid once in the master rather than per worker.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.api import search_requests
+from benchmarks.common import git_revision, write_report
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+ready = time.perf_counter()
+client = app.test_client()
+path, query = json.loads(sys.argv[1])
+latencies = []
+for _ in range(2):
+    request_started = time.perf_counter()
+    status = client.get(path, query_string=query).status_code
+    latencies.append(time.perf_counter() - request_started)
+    if len(latencies) == 1:
+        first_response_at = time.time()
+print(json.dumps({
+    "status": status,
+    "startup": ready - started,
+    "first_request": latencies[0],
+    "second_request": latencies[1],
+    "first_response_at": first_response_at,
+}))
+"""
+
+
+def run_child(request, fast_start):
+    env = dict(os.environ, FAST_START="true" if fast_start else "false")
+    spawned_at = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(request)],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["time_to_first_request"] = result["first_response_at"] - spawned_at
+    return result
+
+
+def median_ms(results, name):
+    return round(statistics.median(result[name] for result in results) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold and warm startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    request = search_requests(1, args.radius_km, args.seed)[0]
+    report = {"git_revision": git_revision(), "runs": args.runs, "modes": []}
+    for mode, fast_start in (("cold", False), ("fast_start", True)):
+        results = [run_child(request, fast_start) for _ in range(args.runs)]
+        if any(result["status"] != 200 for result in results):
+            sys.exit(f"{mode}: search failed; is the database seeded?")
+        report["modes"].append(
+            {
+                "mode": mode,
+                "time_to_first_request_ms": median_ms(
+                    results, "time_to_first_request"
+                ),
+                "startup_ms": median_ms(results, "startup"),
+                "first_request_ms": median_ms(results, "first_request"),
+                "second_request_ms": median_ms(results, "second_request"),
+            }
+        )
+        print(f"  {report['modes'][-1]}", flush=True)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Throughput per core of the sync app under gunicorn and the async app under
+uvicorn.
+
+Each server is started in turn, pinned to the first --cores CPUs with one
+worker process per core, and the same search requests are replayed over
+HTTP at --concurrency. Requests per second are divided by the number of
+cores. The database is used as is, so load a dataset first with
+seed_load_data.py.
+
+    python -m benchmarks.throughput --cores 2 --concurrency 200 --output cores.json
+
+Linux only (os.sched_setaffinity). Exits non-zero if a server fails to start
+or any request fails, since the figures would then be meaningless.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from benchmarks.api import HttpCaller, search_requests
+from benchmarks.common import git_revision, run_load, summarize, write_report
+
+SERVERS = {
+    "sync": ["gunicorn", "--config", "gunicorn.conf.py", "--bind", "{bind}"],
+    "async": ["uvicorn", "asgi:app", "--host", "{host}", "--port", "{port}"],
+}
+
+
+def start_server(name, cores, host, port):
+    """Start a server pinned to the first cores CPUs, one worker per core"""
+    command = [
+        part.format(bind=f"{host}:{port}", host=host, port=port)
+        for part in SERVERS[name]
+    ]
+    command += ["--workers", str(cores)]
+    env = dict(os.environ, WEB_CONCURRENCY=str(cores))
+    return subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        preexec_fn=lambda: os.sched_setaffinity(0, range(cores)),
+    )
+
+
+def wait_until_ready(process, base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(base_url + "/healthcheck", timeout=1):
+                return True
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.2)
+    return False
+
+
+def measure(name, args, requests):
+    port = args.port + list(SERVERS).index(name)
+    base_url = f"http://{args.host}:{port}"
+    process = start_server(name, args.cores, args.host, port)
+    try:
+        if not wait_until_ready(process, base_url, args.startup_timeout):
+            sys.exit(f"The {name} server did not start")
+        call = HttpCaller(base_url, args.timeout)
+        # Open every worker's connections before timing
+        run_load(call, requests[: args.concurrency], args.concurrency)
+        latencies, wall, errors = run_load(call, requests, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait()
+    summary = summarize(latencies, wall, errors)
+    summary["throughput_rps_per_core"] = round(
+        summary["throughput_rps"] / args.cores, 1
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput per core of the sync and async apps"
+    )
+    parser.add_argument("--cores", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    if args.cores > len(os.sched_getaffinity(0)):
+        sys.exit(f"Only {len(os.sched_getaffinity(0))} cores are available")
+
+    requests = search_requests(args.requests, args.radius_km, args.seed)
+    report = {
+        "git_revision": git_revision(),
+        "cores": args.cores,
+        "concurrency": args.concurrency,
+        "servers": {},
+    }
+    for name in SERVERS:
+        report["servers"][name] = measure(name, args, requests)
+        print(f"  {name}: {report['servers'][name]}", flush=True)
+
+    write_report(report, args.output)
+    if any(summary["errors"] for summary in report["servers"].values()):
+        sys.exit("Some requests failed; check the servers and the database")
+
+
+if __name__ == "__main__":
+    main()
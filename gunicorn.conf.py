@@ -0,0 +1,40 @@
+"""Production WSGI server: gunicorn with pre-forked threaded workers
+
+    FLASK_ENV=production gunicorn --config gunicorn.conf.py
+
+WEB_CONCURRENCY and WEB_THREADS size the server; the engine pool of each
+worker is derived from the same values in config.py, so the total of
+connections stays within DB_MAX_CONNECTIONS.
+"""
+
+import os
+from config import WEB_THREADS, WEB_WORKERS
+
+# The app/ package shadows app.py, so build the app from the factory
+wsgi_app = "app:create_app()"
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = WEB_WORKERS
+threads = WEB_THREADS
+worker_class = "gthread"
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+keepalive = 5
+accesslog = "-"
+
+# Import the app once in the master so workers fork with it loaded
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the workers
+    from app import db
+
+    flask_app = server.app.wsgi()
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    if flask_app.config.get("FAST_START"):
+        # The master warmed the compiled cache; warm this worker's connections
+        from app.startup import warm_up
+
+        warm_up(flask_app)
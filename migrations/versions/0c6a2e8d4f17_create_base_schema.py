@@ -0,0 +1,88 @@
+"""create base schema
+
+Revision ID: 0c6a2e8d4f17
+Revises:
+Create Date: 2026-10-16 09:58:12.503611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from geoalchemy2.types import Geography
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6a2e8d4f17'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+    # Databases created with db.create_all before migrations were tracked
+    # already have these tables; the later revisions bring them up to date
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'customers' not in existing:
+        op.create_table(
+            'customers',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('email', sa.String(length=255), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('phone', sa.String(length=20), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_customers_email', 'customers', ['email'], unique=True)
+
+    if 'stashpoints' not in existing:
+        op.create_table(
+            'stashpoints',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('address', sa.String(length=255), nullable=False),
+            sa.Column('postal_code', sa.String(length=20), nullable=False),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False),
+            # The GiST index is created in 8b2e6f0a91c3
+            sa.Column(
+                'location',
+                Geography(geometry_type='POINT', srid=4326, spatial_index=False),
+                nullable=True,
+            ),
+            sa.Column('capacity', sa.Integer(), nullable=False),
+            sa.Column('open_from', sa.Time(), nullable=False),
+            sa.Column('open_until', sa.Time(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if 'bookings' not in existing:
+        op.create_table(
+            'bookings',
+            sa.Column('id', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('bag_count', sa.Integer(), nullable=False),
+            sa.Column('dropoff_time', sa.DateTime(), nullable=False),
+            sa.Column('pickup_time', sa.DateTime(), nullable=False),
+            sa.Column('is_paid', sa.Boolean(), nullable=False),
+            sa.Column('is_cancelled', sa.Boolean(), nullable=False),
+            sa.Column('checked_in', sa.Boolean(), nullable=False),
+            sa.Column('checked_out', sa.Boolean(), nullable=False),
+            sa.Column('stashpoint_id', sa.String(), nullable=False),
+            sa.Column('customer_id', sa.String(), nullable=False),
+            sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+            sa.ForeignKeyConstraint(['stashpoint_id'], ['stashpoints.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_bookings_dropoff_time', 'bookings', ['dropoff_time'])
+        op.create_index('ix_bookings_pickup_time', 'bookings', ['pickup_time'])
+        op.create_index('ix_bookings_stashpoint_id', 'bookings', ['stashpoint_id'])
+        op.create_index('ix_bookings_customer_id', 'bookings', ['customer_id'])
+
+
+def downgrade():
+    op.drop_table('bookings')
+    op.drop_table('stashpoints')
+    op.drop_table('customers')
@@ -0,0 +1,48 @@
+"""add stashpoint_occupancy hourly buckets
+
+Revision ID: 3f9a1c2b7d4e
+Revises: 0c6a2e8d4f17
+Create Date: 2026-10-16 10:12:04.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2b7d4e'
+down_revision = '0c6a2e8d4f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stashpoint_occupancy',
+        sa.Column('stashpoint_id', sa.String(), nullable=False),
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('booked', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['stashpoint_id'], ['stashpoints.id'], ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('stashpoint_id', 'hour'),
+    )
+    # Backfill from the existing bookings
+    op.execute(
+        """
+        INSERT INTO stashpoint_occupancy (stashpoint_id, hour, booked)
+        SELECT b.stashpoint_id, h.hour, SUM(b.bag_count)
+        FROM bookings b
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('hour', b.dropoff_time),
+            b.pickup_time - interval '1 microsecond',
+            interval '1 hour'
+        ) AS h(hour)
+        WHERE NOT b.is_cancelled AND b.pickup_time > b.dropoff_time
+        GROUP BY b.stashpoint_id, h.hour
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('stashpoint_occupancy')
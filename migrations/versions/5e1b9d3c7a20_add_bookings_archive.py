@@ -0,0 +1,49 @@
+"""add bookings_archive
+
+Revision ID: 5e1b9d3c7a20
+Revises: c4d7e2a96b15
+Create Date: 2026-10-17 11:04:52.917384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1b9d3c7a20'
+down_revision = 'c4d7e2a96b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bookings_archive',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('bag_count', sa.Integer(), nullable=False),
+        sa.Column('dropoff_time', sa.DateTime(), nullable=False),
+        sa.Column('pickup_time', sa.DateTime(), nullable=False),
+        sa.Column('is_paid', sa.Boolean(), nullable=False),
+        sa.Column('is_cancelled', sa.Boolean(), nullable=False),
+        sa.Column('checked_in', sa.Boolean(), nullable=False),
+        sa.Column('checked_out', sa.Boolean(), nullable=False),
+        sa.Column('stashpoint_id', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id']),
+        sa.ForeignKeyConstraint(['stashpoint_id'], ['stashpoints.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_bookings_archive_customer_id', 'bookings_archive', ['customer_id']
+    )
+    op.create_index(
+        'ix_bookings_archive_stashpoint_id', 'bookings_archive', ['stashpoint_id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_bookings_archive_stashpoint_id', table_name='bookings_archive')
+    op.drop_index('ix_bookings_archive_customer_id', table_name='bookings_archive')
+    op.drop_table('bookings_archive')
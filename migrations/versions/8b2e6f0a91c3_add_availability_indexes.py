@@ -0,0 +1,46 @@
+"""add availability indexes
+
+Revision ID: 8b2e6f0a91c3
+Revises: 3f9a1c2b7d4e
+Create Date: 2026-10-16 14:38:51.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e6f0a91c3'
+down_revision = '3f9a1c2b7d4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so a large bookings table keeps taking writes
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS
+                ix_bookings_active_stashpoint_window
+            ON bookings (stashpoint_id, dropoff_time, pickup_time)
+            INCLUDE (bag_count)
+            WHERE is_cancelled IS false
+            """
+        )
+        # geoalchemy2 only creates this with create_all
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stashpoints_location
+            ON stashpoints USING gist (location)
+            """
+        )
+    op.execute('ANALYZE bookings')
+    op.execute('ANALYZE stashpoints')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS ix_bookings_active_stashpoint_window'
+        )
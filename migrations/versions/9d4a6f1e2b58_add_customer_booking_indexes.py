@@ -0,0 +1,42 @@
+"""add customer booking history indexes
+
+Revision ID: 9d4a6f1e2b58
+Revises: 5e1b9d3c7a20
+Create Date: 2026-10-17 14:21:06.530712
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a6f1e2b58'
+down_revision = '5e1b9d3c7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so a large bookings table keeps taking writes
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_customer_dropoff
+            ON bookings (customer_id, dropoff_time, id)
+            """
+        )
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS
+                ix_bookings_archive_customer_dropoff
+            ON bookings_archive (customer_id, dropoff_time, id)
+            """
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS ix_bookings_archive_customer_dropoff'
+        )
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_bookings_customer_dropoff')
@@ -0,0 +1,65 @@
+"""add stashpoint weekly_schedule
+
+Revision ID: c4d7e2a96b15
+Revises: 8b2e6f0a91c3
+Create Date: 2026-10-17 09:21:37.640512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e2a96b15'
+down_revision = '8b2e6f0a91c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'stashpoints',
+        sa.Column('weekly_schedule', postgresql.BIT(672), nullable=True),
+    )
+    # Every day open from open_from to open_until, as daily_schedule() in
+    # app/services/schedule.py: slot i of the week is 15 minutes starting at
+    # (i % 96) * 15 minutes past midnight, and partly open slots count
+    op.execute(
+        """
+        UPDATE stashpoints AS s
+        SET weekly_schedule = (
+            SELECT string_agg(
+                CASE
+                    WHEN i % 96 >= r.first AND i % 96 < r.last THEN '1'
+                    WHEN i % 96 + 96 < r.last THEN '1'
+                    ELSE '0'
+                END,
+                '' ORDER BY i
+            )::bit(672)
+            FROM generate_series(0, 671) AS i,
+                (
+                    SELECT
+                        m.first,
+                        CASE
+                            WHEN m.last <= m.first THEN m.last + 96
+                            ELSE m.last
+                        END AS last
+                    FROM (
+                        SELECT
+                            floor((extract(hour FROM s.open_from) * 60
+                                + extract(minute FROM s.open_from)) / 15)
+                                AS first,
+                            ceil((extract(hour FROM s.open_until) * 60
+                                + extract(minute FROM s.open_until)) / 15)
+                                AS last
+                    ) AS m
+                ) AS r
+        )
+        """
+    )
+    op.alter_column('stashpoints', 'weekly_schedule', nullable=False)
+
+
+def downgrade():
+    op.drop_column('stashpoints', 'weekly_schedule')
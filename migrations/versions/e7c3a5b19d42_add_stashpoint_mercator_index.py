@@ -0,0 +1,38 @@
+"""add stashpoint web mercator location index
+
+Revision ID: e7c3a5b19d42
+Revises: 9d4a6f1e2b58
+Create Date: 2026-10-17 15:02:44.108365
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a5b19d42'
+down_revision = '9d4a6f1e2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Map tile bounds are Web Mercator boxes; the geography index on
+    # location compares great-circle boxes, which do not follow parallels.
+    # The expression is web_mercator() of the Stashpoint model, so tile
+    # queries and db.create_all use this same index
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_stashpoints_location_mercator
+            ON stashpoints USING gist (ST_Transform(CAST(location AS geometry), 3857))
+            """
+        )
+    op.execute('ANALYZE stashpoints')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS ix_stashpoints_location_mercator'
+        )
@@ -0,0 +1,48 @@
+"""add stashpoint versions
+
+Revision ID: f2b8d6c1e4a9
+Revises: e7c3a5b19d42
+Create Date: 2026-10-17 16:12:30.274851
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6c1e4a9'
+down_revision = 'e7c3a5b19d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('deleted_version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.add_column('stashpoints', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('stashpoints', sa.Column('version', sa.BigInteger(), nullable=True))
+    # Existing stashpoints are all version 1, so ?since=0 lists them
+    op.execute('UPDATE stashpoints SET updated_at = created_at, version = 1')
+    op.execute(
+        """
+        INSERT INTO table_versions (name, version, updated_at, deleted_version)
+        SELECT 'stashpoints', 1, COALESCE(MAX(updated_at), timezone('utc', now())), 0
+        FROM stashpoints
+        """
+    )
+    op.alter_column('stashpoints', 'updated_at', nullable=False)
+    op.alter_column('stashpoints', 'version', nullable=False)
+    op.create_index('ix_stashpoints_version_id', 'stashpoints', ['version', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_stashpoints_version_id', table_name='stashpoints')
+    op.drop_column('stashpoints', 'version')
+    op.drop_column('stashpoints', 'updated_at')
+    op.drop_table('table_versions')
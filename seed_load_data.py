@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Script to generate a synthetic load-testing dataset
+Scatters stashpoints across several cities and books them with Zipf-skewed
+popularity and realistic time-of-day patterns. The same seed always
+produces the same data. Rows are streamed into PostgreSQL with COPY, so a
+million bookings load in seconds.
+
+    python seed_load_data.py --stashpoints 5000 --customers 100000 --bookings 1000000
+"""
+
+import argparse
+import csv
+import io
+import math
+import random
+import time as clock
+from datetime import datetime, time, timedelta
+from sqlalchemy import text
+from app import create_app, db
+from app.services.occupancy import rebuild_occupancy
+from app.services.schedule import daily_schedule
+from app.services.versions import touch_all_stashpoints
+
+# (name, latitude, longitude, spread in km, share of stashpoints)
+CITIES = [
+    ("London", 51.5074, -0.1278, 12, 0.30),
+    ("Paris", 48.8566, 2.3522, 8, 0.18),
+    ("New York", 40.7128, -74.0060, 10, 0.18),
+    ("Barcelona", 41.3874, 2.1686, 5, 0.10),
+    ("Rome", 41.9028, 12.4964, 6, 0.08),
+    ("Amsterdam", 52.3676, 4.9041, 4, 0.08),
+    ("Edinburgh", 55.9533, -3.1883, 3, 0.04),
+    ("Lisbon", 38.7223, -9.1393, 4, 0.04),
+]
+
+# (open_from, open_until, capacity range, weight)
+PROFILES = [
+    (time(8, 0), time(22, 0), (10, 30), 40),  # cafes and shops
+    (time(9, 0), time(18, 0), (8, 20), 20),  # office-hours shops
+    (time(0, 0), time(23, 59), (30, 80), 15),  # 24/7 hotels
+    (time(5, 0), time(23, 59), (60, 150), 10),  # station lockers
+    (time(9, 30), time(18, 30), (20, 40), 15),  # museum lockers
+]
+
+# Relative dropoff demand per hour of day, peaking at late morning
+DROPOFF_HOUR_WEIGHTS = [
+    1, 1, 1, 1, 1, 2, 4, 8, 14, 18, 20, 18,
+    15, 13, 12, 10, 8, 7, 6, 5, 4, 3, 2, 1,
+]
+
+COPY_CHUNK_ROWS = 200_000
+
+# Bookings are laid out around this date so runs are comparable
+DEFAULT_ANCHOR = datetime(2026, 1, 1)
+
+
+def _hex_id(rng):
+    return "%032x" % rng.getrandbits(128)
+
+
+def _offset(lat, lng, distance_km, bearing):
+    """Move a coordinate distance_km along bearing (flat-earth approximation)"""
+    dlat = distance_km * math.cos(bearing) / 110.574
+    dlng = distance_km * math.sin(bearing) / (111.320 * math.cos(math.radians(lat)))
+    return lat + dlat, lng + dlng
+
+
+def generate_stashpoints(rng, count, created_at):
+    """Yield stashpoint rows scattered around the configured cities"""
+    cities = rng.choices(CITIES, weights=[city[4] for city in CITIES], k=count)
+    profiles = rng.choices(PROFILES, weights=[p[3] for p in PROFILES], k=count)
+    for i, (city, profile) in enumerate(zip(cities, profiles)):
+        name, lat, lng, spread_km, _ = city
+        open_from, open_until, (min_capacity, max_capacity), _ = profile
+        # Density falls off from the center like a real city
+        latitude, longitude = _offset(
+            lat, lng, abs(rng.gauss(0, spread_km / 2)), rng.uniform(0, 2 * math.pi)
+        )
+        yield (
+            _hex_id(rng),
+            created_at,
+            f"{name} Storage #{i}",
+            None,
+            f"{rng.randint(1, 300)} {name} Street",
+            f"LG{i % 1000:03d}",
+            round(latitude, 6),
+            round(longitude, 6),
+            rng.randint(min_capacity, max_capacity),
+            open_from,
+            open_until,
+            daily_schedule(open_from, open_until),
+            created_at,
+            0,
+        )
+
+
+def generate_customers(rng, count, created_at):
+    """Yield customer rows with unique emails"""
+    for i in range(count):
+        yield (_hex_id(rng), created_at, f"load.{i}@example.com", f"Customer {i}", None)
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative Zipf weights for count ranks"""
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank**exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def generate_bookings(rng, count, stashpoints, customer_ids, today, zipf_exponent):
+    """Yield booking rows with Zipf-skewed stashpoint popularity"""
+    # Popularity ranks are shuffled so the busiest hubs land in every city
+    by_popularity = list(stashpoints)
+    rng.shuffle(by_popularity)
+    cum_weights = zipf_cum_weights(len(by_popularity), zipf_exponent)
+    hours = range(24)
+    # Flags are relative to the anchor date, not the wall clock
+    now = today
+
+    for _ in range(count):
+        stashpoint = rng.choices(by_popularity, cum_weights=cum_weights)[0]
+        stashpoint_id, open_from, open_until = stashpoint
+        close_hour = max(open_from.hour + 1, open_until.hour)
+
+        hour = rng.choices(hours, weights=DROPOFF_HOUR_WEIGHTS)[0]
+        hour = min(max(hour, open_from.hour), close_hour - 1)
+        day = today + timedelta(days=rng.randint(-60, 30))
+        dropoff_time = day.replace(hour=hour, minute=rng.choice((0, 15, 30, 45)))
+
+        if rng.random() < 0.7:
+            pickup_time = dropoff_time + timedelta(hours=rng.randint(2, 8))
+        else:
+            pickup_day = day + timedelta(days=rng.randint(1, 5))
+            pickup_time = pickup_day.replace(
+                hour=rng.randint(open_from.hour, close_hour - 1)
+            )
+
+        in_past = pickup_time < now
+        yield (
+            _hex_id(rng),
+            dropoff_time - timedelta(days=rng.randint(0, 14)),
+            rng.choices((1, 2, 3, 4), weights=(50, 30, 15, 5))[0],
+            dropoff_time,
+            pickup_time,
+            rng.random() < 0.9,
+            rng.random() < 0.05,
+            dropoff_time < now and rng.random() < 0.9,
+            in_past and rng.random() < 0.9,
+            stashpoint_id,
+            rng.choice(customer_ids),
+        )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Stream rows into table with COPY in bounded chunks"""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        total += 1
+        if total % COPY_CHUNK_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    return total
+
+
+def load_dataset(
+    stashpoints, customers, bookings, seed=42, zipf_exponent=1.1, anchor=None
+):
+    """Replace the database contents with a generated dataset
+
+    Bookings span 60 days before to 30 days after the anchor date.
+    """
+    rng = random.Random(seed)
+    today = anchor or DEFAULT_ANCHOR
+    stashpoint_rows = list(generate_stashpoints(rng, stashpoints, today))
+    customer_ids = []
+
+    def customer_rows():
+        for row in generate_customers(rng, customers, today):
+            customer_ids.append(row[0])
+            yield row
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "TRUNCATE stashpoint_occupancy, bookings, customers, stashpoints CASCADE"
+        )
+        copy_rows(
+            cursor,
+            "stashpoints",
+            (
+                "id",
+                "created_at",
+                "name",
+                "description",
+                "address",
+                "postal_code",
+                "latitude",
+                "longitude",
+                "capacity",
+                "open_from",
+                "open_until",
+                "weekly_schedule",
+                "updated_at",
+                "version",
+            ),
+            stashpoint_rows,
+        )
+        # Geography points are built server-side from the coordinates
+        cursor.execute(
+            "UPDATE stashpoints SET location = "
+            "ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography"
+        )
+        copy_rows(
+            cursor,
+            "customers",
+            ("id", "created_at", "email", "name", "phone"),
+            customer_rows(),
+        )
+        copy_rows(
+            cursor,
+            "bookings",
+            (
+                "id",
+                "created_at",
+                "bag_count",
+                "dropoff_time",
+                "pickup_time",
+                "is_paid",
+                "is_cancelled",
+                "checked_in",
+                "checked_out",
+                "stashpoint_id",
+                "customer_id",
+            ),
+            generate_bookings(
+                rng,
+                bookings,
+                [(row[0], row[9], row[10]) for row in stashpoint_rows],
+                customer_ids,
+                today,
+                zipf_exponent,
+            ),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+    # COPY bypasses the ORM events that maintain the buckets and versions
+    rebuild_occupancy()
+    touch_all_stashpoints()
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a load-testing dataset")
+    parser.add_argument("--stashpoints", type=int, default=1_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument(
+        "--anchor",
+        type=datetime.fromisoformat,
+        default=DEFAULT_ANCHOR,
+        help="date the bookings are laid out around (YYYY-MM-DD)",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = clock.perf_counter()
+        load_dataset(
+            args.stashpoints,
+            args.customers,
+            args.bookings,
+            seed=args.seed,
+            zipf_exponent=args.zipf_exponent,
+            anchor=args.anchor,
+        )
+        print(
+            f"Loaded {args.stashpoints} stashpoints, {args.customers} customers "
+            f"and {args.bookings} bookings in {clock.perf_counter() - started:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,15 @@ Creates stashpoints, customers, and bookings with varied times and bag counts
 import random
 from datetime import datetime, timedelta, time
 from app import create_app, db
-from app.models import Stashpoint, Customer, Booking
+from app.models import (
+    Stashpoint,
+    Customer,
+    Booking,
+    BookingArchive,
+    StashpointOccupancy,
+)
+from app.services.occupancy import rebuild_occupancy
+from app.services.versions import touch_all_stashpoints
 
 
 def seed_data():
@@ -15,9 +23,13 @@ def seed_data():
     print("Creating test data...")
 
     # Clear existing data
+    StashpointOccupancy.query.delete()
     Booking.query.delete()
+    BookingArchive.query.delete()
     Customer.query.delete()
     Stashpoint.query.delete()
+    # Bulk deletes bypass the version events; delta clients must resync
+    touch_all_stashpoints()
     db.session.commit()
 
     # Create stashpoints - mix of city center and transportation hubs
@@ -267,6 +279,11 @@ def seed_data():
     db.session.commit()
     print(f"Created {len(full_bookings)} additional bookings for full capacity testing")
 
+    # Bookings were added through the session, so the occupancy buckets are
+    # already current; rebuild anyway to start from a known-good state
+    print(f"Corrected {rebuild_occupancy()} occupancy buckets")
+    db.session.commit()
+
     print("Test data creation complete!")
 
 
@@ -0,0 +1,78 @@
+"""Fixtures for tests against the TEST_DATABASE_URL database
+
+The database must have PostGIS available. Tests that use the app fixture
+are skipped when it cannot be reached, so tests of pure functions still
+run anywhere.
+"""
+
+from datetime import time
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Customer, Stashpoint
+from config import TestConfig
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        except OperationalError:
+            pytest.skip("Test database unreachable; set TEST_DATABASE_URL")
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+        db.session.remove()
+    yield app
+    with app.app_context():
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def session(app):
+    """db.session in an app context; every table is emptied afterwards"""
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        tables = ", ".join(table.name for table in db.metadata.sorted_tables)
+        db.session.execute(text(f"TRUNCATE {tables} CASCADE"))
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app, session):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_stashpoint(session):
+    def make(**overrides):
+        fields = {
+            "name": "Test Stashpoint",
+            "address": "1 Test Street",
+            "postal_code": "EC1A 1AA",
+            "latitude": 51.5074,
+            "longitude": -0.1278,
+            "capacity": 10,
+            "open_from": time(0, 0),
+            "open_until": time(23, 59),
+            **overrides,
+        }
+        stashpoint = Stashpoint(**fields)
+        session.add(stashpoint)
+        session.commit()
+        return stashpoint
+
+    return make
+
+
+@pytest.fixture
+def customer(session):
+    customer = Customer(name="Test Customer", email="customer@example.com")
+    session.add(customer)
+    session.commit()
+    return customer
@@ -0,0 +1,48 @@
+"""Completed bookings move to bookings_archive"""
+
+from datetime import datetime, timedelta
+from app.models import Booking, BookingArchive
+from app.services.archive import archive_bookings
+
+NOW = datetime(2030, 6, 1, 12)
+
+
+def add_bookings(session, customer, stashpoint, **states):
+    """One booking per keyword, with its state flags, keyed by the keyword"""
+    bookings = {}
+    for name, (pickup_days_ago, flags) in states.items():
+        pickup = NOW - timedelta(days=pickup_days_ago)
+        bookings[name] = Booking(
+            customer_id=customer.id,
+            stashpoint_id=stashpoint.id,
+            dropoff_time=pickup - timedelta(hours=4),
+            pickup_time=pickup,
+            bag_count=1,
+            **flags,
+        )
+    session.add_all(bookings.values())
+    session.commit()
+    return {name: booking.id for name, booking in bookings.items()}
+
+
+def test_completed_and_no_show_bookings_are_archived(
+    session, make_stashpoint, customer
+):
+    ids = add_bookings(
+        session,
+        customer,
+        make_stashpoint(),
+        checked_out=(40, {"checked_in": True, "checked_out": True}),
+        cancelled=(40, {"is_cancelled": True}),
+        no_show=(40, {}),
+        still_stored=(40, {"checked_in": True}),
+        recent_no_show=(1, {}),
+    )
+
+    moved = archive_bookings(NOW - timedelta(days=30), batch_size=2)
+
+    archived = {booking.id for booking in session.query(BookingArchive)}
+    remaining = {booking.id for booking in session.query(Booking)}
+    assert moved == 3
+    assert archived == {ids["checked_out"], ids["cancelled"], ids["no_show"]}
+    assert remaining == {ids["still_stored"], ids["recent_no_show"]}
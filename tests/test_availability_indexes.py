@@ -0,0 +1,155 @@
+"""The availability search and map tiles run on index scans at 1M bookings
+
+Rows are generated server-side and analyzed, so the planner picks plans
+from real statistics rather than from enable_seqscan overrides.
+PLAN_TEST_BOOKINGS lowers the booking count for a quicker run.
+"""
+
+import os
+from datetime import datetime
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from app import db
+from app.models import Stashpoint
+from app.services.clusters import (
+    build_cluster_statement,
+    covering_tiles,
+    mercator_location,
+    parse_tile,
+)
+from app.services.search import (
+    SearchParams,
+    build_nearest_statement,
+    build_search_statement,
+    explain_plan,
+)
+
+BOOKINGS = int(os.environ.get("PLAN_TEST_BOOKINGS", 1_000_000))
+STASHPOINTS = 2000
+
+INSERT_STASHPOINTS = text(
+    """
+    INSERT INTO stashpoints (
+        id, created_at, updated_at, version, name, address, postal_code,
+        latitude, longitude, location, capacity, open_from, open_until,
+        weekly_schedule
+    )
+    SELECT
+        'sp-' || g, now(), now(), 0, 'Stashpoint ' || g, 'Street', 'EC1',
+        p.lat, p.lng,
+        CAST(ST_SetSRID(ST_MakePoint(p.lng, p.lat), 4326) AS geography),
+        20, '00:00', '23:59', CAST(repeat('1', 672) AS bit(672))
+    FROM generate_series(1, :count) AS g
+    CROSS JOIN LATERAL (
+        -- Spread over about 50 x 70 km around London
+        SELECT 51.3 + (g * 7919 % 1000) / 2000.0 AS lat,
+            -0.6 + (g * 104729 % 1000) / 1000.0 AS lng
+    ) AS p
+    """
+)
+
+INSERT_BOOKINGS = text(
+    """
+    INSERT INTO bookings (
+        id, created_at, bag_count, dropoff_time, pickup_time, is_paid,
+        is_cancelled, checked_in, checked_out, stashpoint_id, customer_id
+    )
+    SELECT
+        'b-' || g, h.dropoff_time, 1 + g % 3, h.dropoff_time,
+        h.dropoff_time + interval '4 hours', true, g % 20 = 0, false, false,
+        'sp-' || (1 + g % :stashpoints), 'customer'
+    FROM generate_series(1, :count) AS g
+    CROSS JOIN LATERAL (
+        -- Spread over the year 2026
+        SELECT timestamp '2026-01-01' + interval '1 minute' * (g * 7919 % 525600)
+            AS dropoff_time
+    ) AS h
+    """
+)
+
+
+@pytest.fixture(scope="module")
+def loaded(app):
+    with app.app_context():
+        db.session.execute(
+            text(
+                "INSERT INTO customers (id, created_at, email, name) "
+                "VALUES ('customer', now(), 'plans@example.com', 'Plans')"
+            )
+        )
+        db.session.execute(INSERT_STASHPOINTS, {"count": STASHPOINTS})
+        db.session.execute(
+            INSERT_BOOKINGS, {"count": BOOKINGS, "stashpoints": STASHPOINTS}
+        )
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+        yield
+        db.session.rollback()
+        db.session.execute(text("TRUNCATE bookings, customers, stashpoints CASCADE"))
+        db.session.commit()
+        db.session.remove()
+
+
+def search_params():
+    return SearchParams(
+        lat=51.5074,
+        lng=-0.1278,
+        dropoff=datetime(2026, 6, 1, 10),
+        pickup=datetime(2026, 6, 1, 18),
+        bag_count=2,
+        radius_km=5.0,
+    )
+
+
+def plan_of(statement):
+    plan = "\n".join(explain_plan(statement))
+    db.session.rollback()
+    return plan
+
+
+def test_search_scans_the_location_and_active_window_indexes(loaded):
+    plan = plan_of(build_search_statement(search_params()))
+
+    assert "idx_stashpoints_location" in plan
+    assert "ix_bookings_active_stashpoint_window" in plan
+    assert "Seq Scan on bookings" not in plan
+    assert "Seq Scan on stashpoints" not in plan
+
+
+def test_nearest_search_sweeps_bookings_through_the_partial_index(loaded):
+    plan = plan_of(build_nearest_statement(search_params(), 5, 50.0))
+
+    assert "idx_stashpoints_location" in plan
+    assert "ix_bookings_active_stashpoint_window" in plan
+    assert "Seq Scan on bookings" not in plan
+
+
+def compiled(expression):
+    return str(expression.compile(dialect=postgresql.dialect()))
+
+
+def test_tile_queries_use_the_indexed_mercator_expression():
+    index = next(
+        index
+        for index in Stashpoint.__table__.indexes
+        if index.name == "ix_stashpoints_location_mercator"
+    )
+    point = compiled(mercator_location()).replace("stashpoints.", "")
+
+    assert point == "ST_Transform(CAST(location AS geometry), 3857)"
+    assert f"({point})" in compiled(CreateIndex(index))
+
+
+def test_tiles_scan_the_mercator_index(loaded):
+    zoom = 14
+    (x, _), (y, _) = covering_tiles([-0.1278, 51.5074, -0.1278, 51.5074], zoom)
+    _, bounds = parse_tile(zoom, x, y)
+    params = search_params()
+
+    plan = plan_of(build_cluster_statement(bounds, zoom, params.dropoff, params.pickup))
+
+    assert "ix_stashpoints_location_mercator" in plan
+    assert "Seq Scan on stashpoints" not in plan
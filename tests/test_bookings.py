@@ -0,0 +1,103 @@
+"""Booking creation and cancellation against the capacity of a stashpoint"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.models import Booking
+from app.services.bookings import peak_booked_bags
+
+DROPOFF = datetime(2030, 6, 1, 10)
+PICKUP = datetime(2030, 6, 1, 18)
+
+
+def booking_body(customer, stashpoint, bag_count=1):
+    return {
+        "customer_id": customer.id,
+        "stashpoint_id": stashpoint.id,
+        "dropoff": DROPOFF.isoformat(),
+        "pickup": PICKUP.isoformat(),
+        "bag_count": bag_count,
+    }
+
+
+def add_booking(session, customer, stashpoint, **overrides):
+    fields = {
+        "customer_id": customer.id,
+        "stashpoint_id": stashpoint.id,
+        "dropoff_time": DROPOFF,
+        "pickup_time": PICKUP,
+        "bag_count": 1,
+        **overrides,
+    }
+    booking = Booking(**fields)
+    session.add(booking)
+    session.commit()
+    return booking
+
+
+def test_concurrent_bookings_never_exceed_capacity(
+    app, session, make_stashpoint, customer
+):
+    stashpoint = make_stashpoint(capacity=5)
+    body = booking_body(customer, stashpoint)
+
+    def post(_):
+        return app.test_client().post("/api/v1/bookings/", json=body).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        statuses = list(pool.map(post, range(20)))
+
+    assert statuses.count(201) == 5
+    assert statuses.count(409) == 15
+    assert peak_booked_bags(stashpoint.id, DROPOFF, PICKUP) == 5
+
+
+def test_bookings_cannot_start_in_the_past(client, session, make_stashpoint, customer):
+    body = booking_body(customer, make_stashpoint())
+    body["dropoff"] = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+
+    response = client.post("/api/v1/bookings/", json=body)
+
+    assert response.status_code == 400
+    assert "past" in response.get_json()["error"]
+    assert session.query(Booking).count() == 0
+
+
+def test_cancelling_frees_capacity(client, session, make_stashpoint, customer):
+    stashpoint = make_stashpoint(capacity=1)
+    booking = add_booking(session, customer, stashpoint)
+
+    response = client.post(f"/api/v1/bookings/{booking.id}/cancel")
+    retry = client.post("/api/v1/bookings/", json=booking_body(customer, stashpoint))
+
+    assert response.status_code == 200
+    assert response.get_json()["is_cancelled"] is True
+    assert retry.status_code == 201
+
+
+def test_bookings_cannot_be_cancelled_after_dropoff(
+    client, session, make_stashpoint, customer
+):
+    started = datetime.utcnow() - timedelta(hours=1)
+    booking = add_booking(
+        session,
+        customer,
+        make_stashpoint(),
+        dropoff_time=started,
+        pickup_time=started + timedelta(hours=4),
+    )
+
+    response = client.post(f"/api/v1/bookings/{booking.id}/cancel")
+
+    assert response.status_code == 400
+    session.refresh(booking)
+    assert booking.is_cancelled is False
+
+
+def test_checked_in_bookings_cannot_be_cancelled(
+    client, session, make_stashpoint, customer
+):
+    booking = add_booking(session, customer, make_stashpoint(), checked_in=True)
+
+    response = client.post(f"/api/v1/bookings/{booking.id}/cancel")
+
+    assert response.status_code == 400
@@ -0,0 +1,174 @@
+"""The NumPy occupancy engine against the hourly buckets"""
+
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sqlalchemy import delete, select
+from app.models import Booking, StashpointOccupancy
+from app.services.bulk_availability import (
+    HourlyOccupancy,
+    _staging_lines,
+    add_bookings,
+    compute_hourly_occupancy,
+    haversine_matrix,
+    write_occupancy,
+)
+from app.services.geo_index import haversine_km
+from app.services.occupancy import HOUR, rebuild_occupancy
+
+START = datetime(2030, 6, 1)
+
+
+def test_bookings_count_towards_their_hours_within_the_horizon():
+    diff = np.zeros((2, 6 + 1), dtype=np.int32)
+    chunk = np.array(
+        [
+            [0, 1, 3, 2],  # hours 1 and 2
+            [0, 2, 4, 1],  # hours 2 and 3
+            [1, -5, 2, 3],  # started before the horizon
+            [1, 5, 40, 1],  # ends after it
+        ],
+        dtype=np.int64,
+    )
+
+    add_bookings(diff, chunk)
+    booked = np.cumsum(diff[:, :6], axis=1)
+
+    assert booked.tolist() == [[0, 2, 3, 1, 0, 0], [3, 3, 0, 0, 0, 1]]
+
+
+def test_staging_lines_hold_one_array_per_stashpoint_to_correct():
+    counts = np.array([[0, 2, 12], [0, 0, 0], [-3, 0, 1]], dtype=np.int32)
+
+    lines = list(_staging_lines(["a", "b", "c"], counts))
+
+    assert lines == ["a\t{0,2,12}\n", "c\t{-3,0,1}\n"]
+
+
+def test_occupancy_is_written_only_with_the_stored_buckets():
+    occupancy = HourlyOccupancy(
+        START,
+        ["a"],
+        np.array([5], dtype=np.int32),
+        np.zeros((1, 24), dtype=np.int32),
+    )
+
+    with pytest.raises(ValueError, match="stored=True"):
+        write_occupancy(occupancy)
+
+
+def test_haversine_matrix_matches_the_geo_index():
+    lat1, lng1 = np.array([51.5074, 48.8566]), np.array([-0.1278, 2.3522])
+    lat2, lng2 = np.array([51.5155, 52.52, 40.4168]), np.array(
+        [-0.0922, 13.405, -3.7038]
+    )
+
+    matrix = haversine_matrix(lat1, lng1, lat2, lng2)
+
+    expected = [
+        [haversine_km(a, b, c, d) for c, d in zip(lat2, lng2)]
+        for a, b in zip(lat1, lng1)
+    ]
+    assert matrix.shape == (2, 3)
+    np.testing.assert_allclose(matrix, expected, rtol=1e-9)
+
+
+def test_written_buckets_match_the_sql_rebuild(session, make_stashpoint, customer):
+    stashpoints = [make_stashpoint(name=f"Stashpoint {number}") for number in range(3)]
+    for number in range(30):
+        dropoff = START + timedelta(hours=number * 5, minutes=number * 7 % 60)
+        session.add(
+            Booking(
+                customer_id=customer.id,
+                stashpoint_id=stashpoints[number % 3].id,
+                dropoff_time=dropoff,
+                pickup_time=dropoff + timedelta(hours=1 + number % 9, minutes=20),
+                bag_count=1 + number % 4,
+                is_cancelled=number % 10 == 0,
+            )
+        )
+    session.commit()
+
+    def buckets():
+        return session.execute(
+            select(
+                StashpointOccupancy.stashpoint_id,
+                StashpointOccupancy.hour,
+                StashpointOccupancy.booked,
+            ).order_by(StashpointOccupancy.stashpoint_id, StashpointOccupancy.hour)
+        ).all()
+
+    rebuild_occupancy()
+    session.commit()
+    expected = buckets()
+    session.execute(delete(StashpointOccupancy))
+    session.commit()
+
+    occupancy = compute_hourly_occupancy(START, days=14, stored=True)
+    written = write_occupancy(occupancy)
+    session.commit()
+
+    assert written == len(expected)
+    assert buckets() == expected
+
+
+def test_bookings_committed_after_the_compute_are_kept(
+    session, make_stashpoint, customer
+):
+    stashpoint = make_stashpoint()
+
+    def book(hours):
+        session.add(
+            Booking(
+                customer_id=customer.id,
+                stashpoint_id=stashpoint.id,
+                dropoff_time=START + timedelta(hours=hours),
+                pickup_time=START + timedelta(hours=hours + 2),
+                bag_count=1,
+            )
+        )
+        session.commit()
+
+    book(0)
+    session.execute(delete(StashpointOccupancy))
+    session.commit()
+    occupancy = compute_hourly_occupancy(START, days=1, stored=True)
+    book(1)
+
+    written = write_occupancy(occupancy)
+    session.commit()
+
+    booked = session.execute(
+        select(StashpointOccupancy.booked).order_by(StashpointOccupancy.hour)
+    ).scalars()
+    assert written == 2
+    assert booked.all() == [1, 2, 1]
+
+
+def test_rebuild_corrects_only_the_wrong_buckets(session, make_stashpoint, customer):
+    stashpoint = make_stashpoint()
+    session.add(
+        Booking(
+            customer_id=customer.id,
+            stashpoint_id=stashpoint.id,
+            dropoff_time=START + timedelta(minutes=30),
+            pickup_time=START + timedelta(hours=2, minutes=30),
+            bag_count=2,
+        )
+    )
+    session.commit()
+    buckets = select(StashpointOccupancy.hour, StashpointOccupancy.booked).order_by(
+        StashpointOccupancy.hour
+    )
+    expected = session.execute(buckets).all()
+
+    session.get(StashpointOccupancy, (stashpoint.id, START)).booked = 7
+    session.add(
+        StashpointOccupancy(stashpoint_id=stashpoint.id, hour=START - HOUR, booked=1)
+    )
+    session.commit()
+    corrected = rebuild_occupancy()
+    session.commit()
+
+    assert corrected == 2
+    assert session.execute(buckets).all() == expected
@@ -0,0 +1,38 @@
+"""Availability calendars built from booking rows"""
+
+from collections import namedtuple
+from datetime import datetime, time
+import pytest
+from app.services.calendar import calendars_from_rows
+from app.services.schedule import weekly_schedule
+
+Row = namedtuple(
+    "Row", "id capacity weekly_schedule dropoff_time pickup_time bag_count"
+)
+
+# Monday 2030-06-03
+MONDAY = datetime(2030, 6, 3)
+
+
+@pytest.mark.parametrize(
+    "interval, expected",
+    [
+        (15, [[36, None], [6, 4], [1, None], [5, 4], [48, None]]),
+        (30, [[18, None], [3, 4], [1, None], [2, 4], [24, None]]),
+        (60, [[9, None], [1, 4], [1, None], [1, 4], [12, None]]),
+    ],
+)
+def test_slots_are_open_only_if_the_schedule_is_open_for_all_of_them(
+    interval, expected
+):
+    # Open 09:00-10:30 and 10:45-12:00
+    schedule = weekly_schedule(
+        {"mon": [(time(9), time(10, 30)), (time(10, 45), time(12))]}
+    )
+    rows = [Row("a", 4, schedule, None, None, None)]
+
+    calendars = calendars_from_rows(
+        rows, MONDAY, MONDAY.replace(day=4), interval_minutes=interval
+    )
+
+    assert calendars["a"]["available"] == expected
@@ -0,0 +1,91 @@
+"""Engine pool sizing of the production workers"""
+
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from config import TestConfig, production_engine_options
+
+
+@pytest.mark.parametrize(
+    "workers, threads, max_connections",
+    [(9, 4, 90), (9, 4, 36), (17, 8, 140), (4, 16, 70), (1, 4, 4), (22, 4, 90)],
+)
+def test_workers_stay_within_the_connection_budget(workers, threads, max_connections):
+    options = production_engine_options(workers, threads, max_connections)
+
+    per_worker = options["pool_size"] + options["max_overflow"]
+    assert options["pool_size"] >= 1
+    assert options["max_overflow"] >= 0
+    assert per_worker * workers <= max_connections
+
+
+def test_each_thread_gets_a_connection_when_the_budget_allows():
+    options = production_engine_options(workers=9, threads=4, max_connections=90)
+
+    assert options["pool_size"] == 4
+    assert options["max_overflow"] == 2
+
+
+def test_a_budget_below_one_connection_per_worker_is_refused():
+    with pytest.raises(ValueError, match="DB_MAX_CONNECTIONS=8"):
+        production_engine_options(workers=9, threads=4, max_connections=8)
+
+
+def test_a_budget_below_one_connection_per_thread_is_refused():
+    with pytest.raises(ValueError, match="fewer than its 4 threads"):
+        production_engine_options(workers=9, threads=4, max_connections=20)
+
+
+def test_a_refused_production_sizing_does_not_break_importing_the_config():
+    imported = subprocess.run(
+        [sys.executable, "-c", "import config"],
+        cwd=Path(__file__).resolve().parents[1],
+        env={**os.environ, "DB_MAX_CONNECTIONS": "1", "WEB_CONCURRENCY": "3"},
+        capture_output=True,
+    )
+
+    assert imported.returncode == 0, imported.stderr.decode()
+
+
+def test_statement_timeout_is_a_startup_option_without_an_external_pooler():
+    direct = production_engine_options(9, 4, 90, statement_timeout_ms=2500)
+    pooled = production_engine_options(9, 4, 90, external_pooler=True)
+
+    assert direct["connect_args"]["options"] == "-c statement_timeout=2500"
+    assert "connect_args" not in pooled
+
+
+@pytest.mark.parametrize("workers, threads, max_connections", [(9, 4, 90), (4, 16, 70)])
+def test_every_thread_of_a_worker_gets_a_connection(
+    app, workers, threads, max_connections
+):
+    options = production_engine_options(workers, threads, max_connections)
+
+    class WorkerConfig(TestConfig):
+        SQLALCHEMY_ENGINE_OPTIONS = {**options, "pool_timeout": 1}
+
+    worker = create_app(WorkerConfig)
+    # Every thread holds its connection until all of them have one
+    everyone_connected = threading.Barrier(threads)
+
+    def request():
+        with worker.app_context():
+            db.session.execute(text("SELECT 1"))
+            everyone_connected.wait(timeout=5)
+            db.session.remove()
+
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            for future in [pool.submit(request) for _ in range(threads)]:
+                # Raises sqlalchemy's TimeoutError if a checkout timed out
+                future.result()
+    finally:
+        with worker.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
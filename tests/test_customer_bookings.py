@@ -0,0 +1,163 @@
+"""Statements per page of a customer's booking history
+
+The customer holds a few hundred bookings, half upcoming and half past.
+Completed past bookings are archived, so past pages merge bookings and
+bookings_archive. Every page must take the same two statements however
+long the history.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+import pytest
+from sqlalchemy import event, func, select, text
+from app import db
+from app.models import Booking, BookingArchive, Customer, Stashpoint
+from app.services.archive import archive_bookings
+
+BOOKINGS = 600
+LIMIT = 50
+MAX_STATEMENTS_PER_PAGE = 2
+
+INSERT_BOOKINGS = text(
+    """
+    INSERT INTO bookings (
+        id, created_at, bag_count, dropoff_time, pickup_time, is_paid,
+        is_cancelled, checked_in, checked_out, stashpoint_id, customer_id
+    )
+    SELECT
+        'history-' || g, d.dropoff_time - interval '7 days', 1 + g % 3,
+        d.dropoff_time, d.dropoff_time + interval '4 hours', g % 3 <> 0,
+        g % 20 = 0, d.dropoff_time < :now, d.dropoff_time < :now,
+        (:stashpoint_ids)[1 + g % cardinality(:stashpoint_ids)], :customer_id
+    FROM generate_series(1, :count) AS g
+    CROSS JOIN LATERAL (
+        -- Alternate past and upcoming, spread over a year either side of now
+        SELECT CAST(:now AS timestamp)
+            + interval '1 hour' * (CASE WHEN g % 2 = 0 THEN 1 ELSE -1 END)
+            * (24 + (g * 7919) % 8760) AS dropoff_time
+    ) AS d
+    """
+)
+
+
+@pytest.fixture(scope="module")
+def history(app):
+    """(customer id, now) of a customer with BOOKINGS bookings"""
+    with app.app_context():
+        stashpoints = [
+            Stashpoint(
+                name=f"Stashpoint {number}",
+                address="1 Test Street",
+                postal_code="EC1A 1AA",
+                latitude=51.5074,
+                longitude=-0.1278,
+                capacity=10,
+                open_from=time(0, 0),
+                open_until=time(23, 59),
+            )
+            for number in range(5)
+        ]
+        customer = Customer(name="History", email="history@example.com")
+        db.session.add_all([customer, *stashpoints])
+        db.session.commit()
+        now = datetime.utcnow().replace(microsecond=0)
+        db.session.execute(
+            INSERT_BOOKINGS,
+            {
+                "count": BOOKINGS,
+                "now": now,
+                "customer_id": customer.id,
+                "stashpoint_ids": [stashpoint.id for stashpoint in stashpoints],
+            },
+        )
+        db.session.commit()
+        assert archive_bookings(now - timedelta(days=30)) > 0
+        yield customer.id, now
+        db.session.rollback()
+        tables = ", ".join(table.name for table in db.metadata.sorted_tables)
+        db.session.execute(text(f"TRUNCATE {tables} CASCADE"))
+        db.session.commit()
+        db.session.remove()
+
+
+@contextmanager
+def counting_statements():
+    counts = []
+
+    def count(*args):
+        counts[-1] += 1
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        yield counts
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+
+def page_through(client, customer_id, query):
+    """Statements taken by each page and the bookings listed"""
+    query = dict(query, limit=LIMIT)
+    bookings = 0
+    with counting_statements() as statements:
+        while True:
+            statements.append(0)
+            response = client.get(
+                f"/api/v1/customers/{customer_id}/bookings", query_string=query
+            )
+            assert response.status_code == 200
+            bookings += len(response.get_json())
+            if "X-Next-Cursor" not in response.headers:
+                return statements, bookings
+            query["cursor"] = response.headers["X-Next-Cursor"]
+
+
+def expected_bookings(customer_id, now, when, filters):
+    total = 0
+    for model in (Booking, BookingArchive):
+        statement = select(func.count()).where(model.customer_id == customer_id)
+        if when == "upcoming":
+            statement = statement.where(model.pickup_time >= now)
+        else:
+            statement = statement.where(model.pickup_time < now)
+        for name, value in filters.items():
+            statement = statement.where(getattr(model, name).is_(value == "true"))
+        total += db.session.scalar(statement)
+    return total
+
+
+@pytest.mark.parametrize(
+    "when, filters",
+    [
+        ("upcoming", {}),
+        ("past", {}),
+        ("past", {"is_cancelled": "true"}),
+    ],
+)
+def test_every_page_takes_at_most_two_statements(app, history, when, filters):
+    customer_id, now = history
+
+    with app.app_context():
+        statements, bookings = page_through(
+            app.test_client(), customer_id, {"when": when, **filters}
+        )
+        expected = expected_bookings(customer_id, now, when, filters)
+
+    assert max(statements) <= MAX_STATEMENTS_PER_PAGE
+    assert bookings == expected
+
+
+def test_archived_bookings_serialize_like_live_ones():
+    times = {
+        "created_at": datetime(2026, 1, 1),
+        "dropoff_time": datetime(2026, 1, 2, 10),
+        "pickup_time": datetime(2026, 1, 3, 12),
+    }
+    flags = {"is_cancelled": False, "checked_out": True}
+    live = Booking(id="b", **times, **flags).to_dict()
+    archived = BookingArchive(
+        id="b", archived_at=datetime(2026, 2, 1), **times, **flags
+    ).to_dict()
+
+    assert archived.keys() - live.keys() == {"archived_at"}
+    assert live.keys() <= archived.keys()
+    assert (archived["days"], archived["is_active"]) == (2, False)
@@ -0,0 +1,40 @@
+"""Searches shortlisted by the in-process geo index"""
+
+import math
+from datetime import datetime
+import pytest
+from app.services.geo_index import KM_PER_DEGREE, geo_index, refresh_geo_index
+from app.services.search import SearchParams, search_stashpoints
+
+
+@pytest.fixture
+def geo_index_enabled(app):
+    app.config["GEO_INDEX_ENABLED"] = True
+    yield
+    app.config["GEO_INDEX_ENABLED"] = False
+    geo_index.rebuild([])
+    geo_index.built_at = None
+
+
+def test_shortlisted_searches_keep_the_radius_of_postgis(
+    geo_index_enabled, app, make_stashpoint
+):
+    params = SearchParams(
+        lat=51.5074,
+        lng=-0.1278,
+        dropoff=datetime(2030, 6, 1, 10),
+        pickup=datetime(2030, 6, 1, 12),
+        bag_count=1,
+    )
+    # Around the radius north and east, where the sphere and the spheroid differ
+    km_per_lng_degree = KM_PER_DEGREE * math.cos(math.radians(params.lat))
+    for km in (4.97, 4.99, 4.995, 5.0, 5.005, 5.01, 5.03):
+        make_stashpoint(latitude=params.lat + km / KM_PER_DEGREE)
+        make_stashpoint(longitude=params.lng + km / km_per_lng_degree)
+
+    refresh_geo_index(max_age=0)
+    shortlisted = search_stashpoints(params)
+    app.config["GEO_INDEX_ENABLED"] = False
+    unlisted = search_stashpoints(params)
+
+    assert shortlisted == unlisted
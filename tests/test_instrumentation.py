@@ -0,0 +1,50 @@
+import pytest
+from app.instrumentation import registry
+
+
+def test_metrics_are_served_to_localhost_without_a_token(app, client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert b"stasher_http_requests_total" in response.data
+
+
+def test_metrics_are_refused_to_other_hosts_without_a_token(client):
+    response = client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.9"})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("authorization, status", [(None, 401), ("Bearer s3cret", 200)])
+def test_metrics_require_the_configured_token(app, client, authorization, status):
+    app.config["METRICS_TOKEN"] = "s3cret"
+    try:
+        headers = {"Authorization": authorization} if authorization else {}
+        response = client.get(
+            "/metrics", headers=headers, environ_base={"REMOTE_ADDR": "203.0.113.9"}
+        )
+    finally:
+        app.config["METRICS_TOKEN"] = None
+
+    assert response.status_code == status
+
+
+def test_server_timing_is_off_by_default(client):
+    response = client.get("/api/v1/stashpoints/")
+
+    assert "Server-Timing" not in response.headers
+
+
+def test_streamed_responses_are_recorded_when_closed(client, make_stashpoint):
+    make_stashpoint()
+    labels = ("/api/v1/stashpoints/", "GET")
+    before = registry.queries.get(labels)
+    count, total = (before.count, before.total) if before else (0, 0)
+
+    response = client.get("/api/v1/stashpoints/", query_string={"stream": "true"})
+    response.get_data()
+    response.close()
+
+    # The version lookup before the stream and the listing streamed after it
+    assert registry.queries[labels].count == count + 1
+    assert registry.queries[labels].total - total == 2
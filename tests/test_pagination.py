@@ -0,0 +1,68 @@
+import pytest
+from app.services.pagination import (
+    DROPOFF_KEY,
+    ID_KEY,
+    SEARCH_KEY,
+    VERSION_KEY,
+    PaginationError,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+@pytest.mark.parametrize(
+    "key, key_types",
+    [
+        (("abc",), ID_KEY),
+        ((1234.5, "abc"), SEARCH_KEY),
+        ((0, "abc"), SEARCH_KEY),
+        ((42, "abc"), VERSION_KEY),
+        (("2026-01-01T10:00:00", "abc"), DROPOFF_KEY),
+    ],
+)
+def test_cursor_round_trip(key, key_types):
+    assert decode_cursor(encode_cursor(key), key_types) == key
+
+
+@pytest.mark.parametrize(
+    "key, key_types",
+    [
+        (["x", {}], SEARCH_KEY),
+        ([1.5, "abc"], VERSION_KEY),
+        ([True, "abc"], VERSION_KEY),
+        ([None, "abc"], SEARCH_KEY),
+        ([[1], "abc"], DROPOFF_KEY),
+        ([7], ID_KEY),
+        (["abc", "def"], ID_KEY),
+    ],
+)
+def test_cursor_with_wrong_value_types_is_rejected(key, key_types):
+    with pytest.raises(PaginationError):
+        decode_cursor(encode_cursor(key), key_types)
+
+
+def test_non_finite_distances_are_rejected():
+    with pytest.raises(PaginationError):
+        decode_cursor(encode_cursor([float("inf"), "abc"]), SEARCH_KEY)
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(PaginationError):
+        decode_cursor("not base64 json!", ID_KEY)
+
+
+def test_listing_answers_a_crafted_cursor_with_400(client):
+    response = client.get(
+        "/api/v1/stashpoints/",
+        query_string={
+            "lat": 51.5,
+            "lng": -0.12,
+            "dropoff": "2026-06-01T10:00:00Z",
+            "pickup": "2026-06-01T18:00:00Z",
+            "bag_count": 1,
+            "limit": 10,
+            "cursor": encode_cursor(["x", {}]),
+        },
+    )
+
+    assert response.status_code == 400
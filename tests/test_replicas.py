@@ -0,0 +1,77 @@
+"""Replica health checks and routing"""
+
+import threading
+import pytest
+from flask import Flask, g
+from app.replicas import ReplicaSet, reads_from_primary
+from config import REPLICA_CONNECT_TIMEOUT_SECONDS, replica_binds
+
+
+class BlockingReplicaSet(ReplicaSet):
+    """ReplicaSet whose checks wait until released, counting the calls"""
+
+    def __init__(self, keys):
+        super().__init__(dict.fromkeys(keys), check_interval=60, max_lag=30)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.checks = 0
+
+    def check(self, key):
+        self.checks += 1
+        self.started.set()
+        self.release.wait(5)
+        return False
+
+
+def test_other_requests_do_not_wait_for_a_health_check():
+    replicas = BlockingReplicaSet(["replica_0"])
+    checking = threading.Thread(target=replicas.is_healthy, args=["replica_0"])
+    checking.start()
+    assert replicas.started.wait(5)
+
+    # Answered from the last known state while the check is still running
+    assert replicas.is_healthy("replica_0") is True
+    replicas.release.set()
+    checking.join(5)
+
+    assert replicas.checks == 1
+    assert replicas.is_healthy("replica_0") is False
+
+
+def test_a_failing_check_marks_the_replica_unhealthy():
+    class BrokenReplicaSet(ReplicaSet):
+        def check(self, key):
+            raise RuntimeError("driver bug")
+
+    replicas = BrokenReplicaSet({"replica_0": None}, check_interval=60, max_lag=30)
+
+    with pytest.raises(RuntimeError):
+        replicas.is_healthy("replica_0")
+
+    assert replicas.is_healthy("replica_0") is False
+
+
+def test_reads_from_primary_restores_the_request_replica():
+    with Flask(__name__).test_request_context():
+        g.read_replica = replica = object()
+
+        with reads_from_primary():
+            assert g.get("read_replica") is None
+
+        assert g.read_replica is replica
+
+
+def test_replica_binds_time_out_connecting_and_keep_the_engine_options():
+    options = {"pool_size": 4, "connect_args": {"options": "-c statement_timeout=5"}}
+
+    binds = replica_binds(["postgresql://replica/db"], options)
+
+    assert binds["replica_0"] == {
+        "url": "postgresql://replica/db",
+        "pool_size": 4,
+        "connect_args": {
+            "options": "-c statement_timeout=5",
+            "connect_timeout": REPLICA_CONNECT_TIMEOUT_SECONDS,
+        },
+    }
+    assert options["connect_args"] == {"options": "-c statement_timeout=5"}
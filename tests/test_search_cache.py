@@ -0,0 +1,196 @@
+from datetime import datetime, time
+import pytest
+from app.models import Booking
+from app.services.search import SearchParams, search_results
+from app.services.search_cache import (
+    CacheEntry,
+    CachedRow,
+    LocalCacheBackend,
+    SearchCache,
+    register_search_cache_events,
+)
+
+
+class Row:
+    def __init__(self, id):
+        self.id = id
+
+
+def cached_row(id):
+    return CachedRow(
+        id=id,
+        name="Stashpoint",
+        description=None,
+        address="1 Test Street",
+        postal_code="EC1A 1AA",
+        latitude=51.5074,
+        longitude=-0.1278,
+        capacity=5,
+        open_from=time(8, 0),
+        open_until=None,
+        weekly_schedule="1" * 672,
+    )
+
+
+@pytest.fixture
+def search_cache(app):
+    cache = SearchCache(LocalCacheBackend())
+    app.extensions["search_cache"] = cache
+    register_search_cache_events()
+    yield cache
+    del app.extensions["search_cache"]
+
+
+def search_params(**overrides):
+    fields = {
+        "lat": 51.5074,
+        "lng": -0.1278,
+        "dropoff": datetime(2026, 6, 1, 10, 30),
+        "pickup": datetime(2026, 6, 1, 12, 15),
+        "bag_count": 1,
+        "radius_km": 5.0,
+        **overrides,
+    }
+    return SearchParams(**fields)
+
+
+def search(params, after=None, limit=None, yield_per=None):
+    return list(search_results(params, after=after, limit=limit, yield_per=yield_per))
+
+
+def test_booking_invalidation_only_evicts_overlapping_windows():
+    cache = SearchCache(LocalCacheBackend())
+    morning = CacheEntry(
+        (datetime(2026, 6, 1, 9), datetime(2026, 6, 1, 12)), (0, 0), 1, [Row("a")], {}
+    )
+    evening = CacheEntry(
+        (datetime(2026, 6, 1, 18), datetime(2026, 6, 1, 20)), (0, 0), 1, [Row("a")], {}
+    )
+    cache.backend.set("morning", morning)
+    cache.backend.set("evening", evening)
+
+    cache.invalidate_booking("a", datetime(2026, 6, 1, 11), datetime(2026, 6, 1, 13))
+
+    assert cache.backend.get("morning") is None
+    assert cache.backend.get("evening") is evening
+    assert cache.backend.keys_for_stashpoint("a") == {"evening"}
+
+
+def test_windows_within_the_same_hours_share_an_entry():
+    key, window, _, _ = SearchCache.quantize(search_params())
+    same_hours = SearchCache.quantize(
+        search_params(dropoff=datetime(2026, 6, 1, 10), pickup=datetime(2026, 6, 1, 13))
+    )
+    longer = SearchCache.quantize(search_params(pickup=datetime(2026, 6, 1, 13, 1)))
+
+    assert window == (datetime(2026, 6, 1, 10), datetime(2026, 6, 1, 13))
+    assert same_hours[0] == key
+    assert longer[0] != key
+
+
+def test_entries_survive_a_json_round_trip():
+    entry = CacheEntry(
+        (datetime(2026, 6, 1, 10), datetime(2026, 6, 1, 13)),
+        (51.5, -0.1),
+        5.5,
+        [cached_row("a"), cached_row("b")],
+        {"a": [(datetime(2026, 6, 1, 9), datetime(2026, 6, 1, 11, 30), 2)]},
+    )
+
+    decoded = CacheEntry.loads(entry.dumps())
+
+    assert (decoded.window, decoded.center, decoded.radius_km) == (
+        entry.window,
+        entry.center,
+        entry.radius_km,
+    )
+    assert decoded.rows == entry.rows
+    assert decoded.bookings == entry.bookings
+    assert decoded.stashpoint_ids == {"a", "b"}
+
+
+def test_fills_racing_an_invalidation_are_not_stored():
+    cache = SearchCache(LocalCacheBackend())
+    params = search_params()
+
+    def fill(window, center, radius_km):
+        # A booking for a committed while its bookings were being read
+        cache.invalidate_booking("a", params.dropoff, params.pickup)
+        return [cached_row("a")], {}
+
+    entry = cache.get_or_fill(params, fill)
+
+    assert entry.stashpoint_ids == {"a"}
+    assert cache.backend.get(SearchCache.quantize(params)[0]) is None
+
+
+def test_cached_search_matches_the_database_search(
+    search_cache, make_stashpoint, customer, session
+):
+    near = make_stashpoint(latitude=51.5080, longitude=-0.1270, capacity=3)
+    make_stashpoint(latitude=51.5200, longitude=-0.1000, capacity=5)
+    # Overlaps the window for half an hour only, outside the hour boundaries
+    session.add(
+        Booking(
+            customer_id=customer.id,
+            stashpoint_id=near.id,
+            dropoff_time=datetime(2026, 6, 1, 9, 0),
+            pickup_time=datetime(2026, 6, 1, 11, 0),
+            bag_count=2,
+        )
+    )
+    # Within the hours of the window but before it, alongside the first
+    session.add(
+        Booking(
+            customer_id=customer.id,
+            stashpoint_id=near.id,
+            dropoff_time=datetime(2026, 6, 1, 10, 0),
+            pickup_time=datetime(2026, 6, 1, 10, 30),
+            bag_count=1,
+        )
+    )
+    session.commit()
+    params = search_params()
+
+    uncached = search(params, yield_per=100)
+    cached = search(params)
+
+    assert cached == uncached
+    assert search_cache.misses == 1
+    assert [result["available_capacity"] for _, result in cached] == [1, 5]
+
+
+def test_cursors_carry_over_between_cached_and_database_searches(
+    search_cache, make_stashpoint
+):
+    for i in range(5):
+        make_stashpoint(latitude=51.5074 + i * 0.001, longitude=-0.1278)
+    params = search_params()
+
+    first_page = search(params, limit=2)
+    rest_cached = search(params, after=first_page[-1][0])
+    rest_uncached = search(params, after=first_page[-1][0], yield_per=100)
+
+    assert rest_cached == rest_uncached
+    assert len(first_page) + len(rest_cached) == 5
+
+
+def test_committed_booking_evicts_the_cached_search(
+    search_cache, make_stashpoint, customer, session
+):
+    stashpoint = make_stashpoint(capacity=2)
+    params = search_params(bag_count=2)
+    assert len(search(params)) == 1
+
+    session.add(
+        Booking(
+            customer_id=customer.id,
+            stashpoint_id=stashpoint.id,
+            dropoff_time=params.dropoff,
+            pickup_time=params.pickup,
+            bag_count=1,
+        )
+    )
+    session.commit()
+
+    assert search(params) == []
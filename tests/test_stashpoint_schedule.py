@@ -0,0 +1,59 @@
+"""weekly_schedule follows open_from and open_until"""
+
+from datetime import time
+from app.models import Stashpoint
+from app.services.schedule import daily_schedule, weekly_schedule
+
+CUSTOM = weekly_schedule({"mon": [(time(9), time(12))]})
+
+
+def new_stashpoint(**overrides):
+    fields = {"open_from": time(8), "open_until": time(18), **overrides}
+    return Stashpoint(
+        name="Stashpoint",
+        address="1 Street",
+        postal_code="EC1",
+        latitude=51.5,
+        longitude=-0.1,
+        capacity=10,
+        **fields,
+    )
+
+
+def test_new_stashpoints_are_open_their_hours_every_day():
+    stashpoint = new_stashpoint()
+
+    assert stashpoint.weekly_schedule == daily_schedule(time(8), time(18))
+
+
+def test_an_explicit_schedule_wins_over_the_hours_of_the_constructor():
+    assert new_stashpoint(weekly_schedule=CUSTOM).weekly_schedule == CUSTOM
+
+
+def test_changing_either_hour_re_derives_the_schedule():
+    stashpoint = new_stashpoint()
+
+    stashpoint.open_until = time(22)
+    assert stashpoint.weekly_schedule == daily_schedule(time(8), time(22))
+
+    stashpoint.open_from = time(6)
+    assert stashpoint.weekly_schedule == daily_schedule(time(6), time(22))
+
+
+def test_setting_unchanged_hours_keeps_a_custom_schedule():
+    stashpoint = new_stashpoint(weekly_schedule=CUSTOM)
+
+    stashpoint.open_from = time(8)
+
+    assert stashpoint.weekly_schedule == CUSTOM
+
+
+def test_edits_of_loaded_stashpoints_are_saved(session, make_stashpoint):
+    stashpoint = make_stashpoint(open_from=time(8), open_until=time(18))
+    session.expire_all()
+
+    stashpoint.open_until = time(20)
+    session.commit()
+    session.expire_all()
+
+    assert stashpoint.weekly_schedule == daily_schedule(time(8), time(20))
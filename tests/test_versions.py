@@ -0,0 +1,35 @@
+"""Conditional GET headers of the stashpoints listing"""
+
+from datetime import datetime
+from werkzeug.http import http_date
+from app.services.versions import STASHPOINTS, listing_headers
+
+QUERY_STRING = b"limit=50"
+
+
+def test_if_none_match_of_the_current_version_is_not_modified():
+    state = (7, datetime(2026, 5, 1, 12, 0, 0, 250000), 0)
+    headers, _, _ = listing_headers(STASHPOINTS, state, QUERY_STRING, {})
+
+    _, modified, _ = listing_headers(
+        STASHPOINTS, state, QUERY_STRING, {"If-None-Match": headers["ETag"]}
+    )
+
+    assert not modified
+
+
+def test_if_modified_since_never_hides_a_write_in_the_same_second():
+    # Two writes 500ms apart share their one-second Last-Modified
+    first = (7, datetime(2026, 5, 1, 12, 0, 0, 250000), 0)
+    second = (8, datetime(2026, 5, 1, 12, 0, 0, 750000), 0)
+    headers, _, _ = listing_headers(STASHPOINTS, first, QUERY_STRING, {})
+    assert headers["Last-Modified"] == http_date(second[1])
+
+    _, modified, _ = listing_headers(
+        STASHPOINTS,
+        second,
+        QUERY_STRING,
+        {"If-Modified-Since": headers["Last-Modified"]},
+    )
+
+    assert modified